@@ -1,21 +1,47 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+from flask import (
+    Blueprint, Flask, Response, current_app, g, render_template, request, jsonify, redirect, url_for, stream_with_context
+)
+from werkzeug.local import LocalProxy
 import sqlite3
 import json
 import os
-from datetime import datetime
+import itertools
+import functools
+import inspect
+from typing import Dict, List, Optional
 from models import Character
-from utils.autofill import AutoFill
-from utils.recommender import Recommender
-from utils.chat_engine import ChatEngine
-from utils.spell_manager import SpellManager
-from logging_config import setup_logging
+from config import (
+    MAX_NPC_BATCH, RECOMMENDATION_WORKERS, RECOMMENDATION_QUEUE_SIZE, CHAT_PAGE_SIZE, CHAT_PAGE_MAX, CHAT_POLL_MAX_WAIT,
+    RATE_LIMIT_ENABLED, RATE_LIMIT_STORE, RATE_LIMIT_TRUST_PROXY, CHAT_RATE_PER_MINUTE, CHAT_BURST,
+    CHARACTER_CHAT_RATE_PER_MINUTE, CHARACTER_CHAT_BURST, AUTOFILL_RATE_PER_MINUTE, AUTOFILL_BURST,
+    CHAT_MAX_IN_FLIGHT, AUTOFILL_MAX_IN_FLIGHT, DATABASE_PATH, METRICS_ENABLED,
+    PROFILE_SECRET, PROFILE_ALL_REQUESTS, PROFILE_SAMPLE_EVERY, PROFILE_DIR
+)
+from utils.chat_backends import BackendBusy
+from utils.creation_pipeline import CharacterCreationPipeline, CreationError
+from utils.character_store import (
+    fetch_character, row_to_character, refresh_persona_profile, backfill_persona_profiles, update_character_fields
+)
+from utils.database import connect, resolve_database, is_memory_database
+from utils.db_pool import run_db
+from utils.lazy import Lazy, LazyGroup
+from utils.metrics import RequestMetrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from utils.profiler import RequestProfiler
+from utils.chat_memory import init_chat_schema, migrate_chat_history
+from utils.rate_limiter import (
+    RateLimited, TokenBucketLimiter, AdmissionGate, MemoryBucketStore, SQLiteBucketStore
+)
+from utils.currency_ledger import (
+    CurrencyLedger, LedgerError, init_ledger_schema, currency_to_copper, format_copper
+)
+from logging_config import setup_logging, get_logger
 
-# Setup logging
-logger = setup_logging()
+# Configure logging (handlers are set up by create_app)
+logger = get_logger('app')
 
-def init_db():
+def init_db(db_path: str):
     """Initialize database"""
-    conn = sqlite3.connect('db.sqlite')
+    conn = connect(db_path)
     cursor = conn.cursor()
     
     # Check if table exists
@@ -23,7 +49,7 @@ def init_db():
     table_exists = cursor.fetchone()
     
     if not table_exists:
-        # Create new table with optimized columns
+        # Original columns, in the order rows are read by position (the rest are added below)
         cursor.execute('''
             CREATE TABLE characters (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -35,8 +61,7 @@ def init_db():
             attributes TEXT,
             skills TEXT,
             feats TEXT,
-            cantrips TEXT,
-            spells_known TEXT,
+            spells TEXT,
             personality_traits TEXT,
             history_log TEXT,
             chat_history TEXT,
@@ -44,52 +69,225 @@ def init_db():
         )
     ''')
         logger.info("Created new characters table")
-    else:
-        # Check existing columns and add missing ones
-        cursor.execute("PRAGMA table_info(characters)")
-        existing_columns = [column[1] for column in cursor.fetchall()]
-        
-        missing_columns = []
-        required_columns = [
-            'cantrips', 'spells_known', 'background_story', 'short_term_goals', 'long_term_goals', 
-            'personal_goals', 'personality_tags', 'flaws', 'currency', 'items', 'item_weights',
-            'alignment', 'experience_points', 'age', 'height', 'weight', 'eyes', 'skin', 'hair',
-            'hit_point_maximum', 'current_hit_points', 'temporary_hit_points', 'hit_dice',
-            'ideals', 'bonds'
-        ]
-        
-        for column in required_columns:
-            if column not in existing_columns:
-                missing_columns.append(column)
-        
-        # Add missing columns
-        for column in missing_columns:
-            try:
-                cursor.execute(f'ALTER TABLE characters ADD COLUMN {column} TEXT')
-                logger.info(f"Added missing column: {column}")
-            except sqlite3.OperationalError as e:
-                logger.error(f"Error adding column {column}: {e}")
+    
+    # Check existing columns and add missing ones
+    cursor.execute("PRAGMA table_info(characters)")
+    existing_columns = [column[1] for column in cursor.fetchall()]
+    
+    missing_columns = []
+    required_columns = [
+        'cantrips', 'spells_known', 'background_story', 'short_term_goals', 'long_term_goals', 
+        'personal_goals', 'personality_tags', 'flaws', 'currency', 'items', 'item_weights',
+        'alignment', 'experience_points', 'age', 'height', 'weight', 'eyes', 'skin', 'hair',
+        'hit_point_maximum', 'current_hit_points', 'temporary_hit_points', 'hit_dice',
+        'ideals', 'bonds', 'persona_profile'
+    ]
+    
+    for column in required_columns:
+        if column not in existing_columns:
+            missing_columns.append(column)
+    
+    # Add missing columns
+    for column in missing_columns:
+        try:
+            cursor.execute(f'ALTER TABLE characters ADD COLUMN {column} TEXT')
+            logger.info(f"Added missing column: {column}")
+        except sqlite3.OperationalError as e:
+            logger.error(f"Error adding column {column}: {e}")
+    
+    # Currency ledger tables
+    init_ledger_schema(cursor)
+    
+    # Persona profiles for characters saved before they existed
+    if table_exists:
+        built = backfill_persona_profiles(cursor)
+        if built:
+            logger.info(f"Built persona profiles for {built} characters")
+    
+    # Chat messages and summaries, moving any chat_history blobs into them
+    init_chat_schema(cursor)
+    moved = migrate_chat_history(cursor)
+    if moved:
+        logger.info(f"Moved {moved} chat messages out of chat_history")
     
     conn.commit()
+    
+    # Seed ledger balances for characters created before the ledger existed
+    cursor.execute('''
+        SELECT c.id, c.currency FROM characters c
+        LEFT JOIN currency_balances b ON b.character_id = c.id
+        WHERE b.character_id IS NULL
+    ''')
+    unseeded = cursor.fetchall()
     conn.close()
+    
+    if unseeded:
+        CurrencyLedger(db_path).seed_balances(unseeded)
+    
     logger.info("Database initialization completed")
 
-app = Flask(__name__)
-app.secret_key = 'echo_sheet_secret_key'
+# Inicializar utilidades on first use (they hold no database state, so every app shares them)
+def _build_autofill():
+    from utils.autofill import AutoFill
+    return AutoFill()
+
+def _build_recommender():
+    from utils.recommender import Recommender
+    return Recommender()
+
+def _build_recommendation_worker():
+    from utils.recommendation_worker import RecommendationWorker
+    return RecommendationWorker(get_recommender(), RECOMMENDATION_WORKERS, RECOMMENDATION_QUEUE_SIZE)
+
+def _build_spell_manager():
+    from utils.spell_manager import SpellManager
+    return SpellManager()
+
+def _build_party_analyzer():
+    from utils.party_analyzer import PartyAnalyzer
+    return PartyAnalyzer(get_spell_manager())
+
+get_autofill = Lazy(_build_autofill)
+get_recommender = Lazy(_build_recommender)
+get_recommendation_worker = Lazy(_build_recommendation_worker)
+get_spell_manager = Lazy(_build_spell_manager)
+get_party_analyzer = Lazy(_build_party_analyzer)
+
+autofill = LocalProxy(get_autofill)
+recommender = LocalProxy(get_recommender)
+recommendation_worker = LocalProxy(get_recommendation_worker)
+spell_manager = LocalProxy(get_spell_manager)
+party_analyzer = LocalProxy(get_party_analyzer)
+
+class Services:
+    """Engines and stores bound to the database of one app, each built on first use"""
+
+    def __init__(self, db_path: str, profiler: Optional[RequestProfiler] = None):
+        self.db_path = db_path
+        # An in-memory database lives only while a connection to it is open
+        self.keepalive = connect(db_path) if is_memory_database(db_path) else None
+        self.metrics = RequestMetrics()
+        self.profiler = profiler or RequestProfiler(PROFILE_DIR)
+        self._parts = LazyGroup()
+
+    def database(self) -> str:
+        """Path of the database, created and migrated on first use"""
+        return self._parts.get('database', self._init_database)
+
+    def _init_database(self) -> str:
+        init_db(self.db_path)
+        return self.db_path
+
+    def built(self) -> List[str]:
+        """Names of the parts built so far"""
+        return self._parts.built()
+
+    def _build_chat_engine(self):
+        from utils.chat_engine import ChatEngine
+        return ChatEngine(db_path=self.database())
+
+    @property
+    def chat_engine(self):
+        return self._parts.get('chat_engine', self._build_chat_engine)
+
+    @property
+    def currency_ledger(self) -> CurrencyLedger:
+        return self._parts.get('currency_ledger', lambda: CurrencyLedger(self.database()))
+
+    @property
+    def creation_pipeline(self) -> CharacterCreationPipeline:
+        return self._parts.get('creation_pipeline', lambda: CharacterCreationPipeline(
+            get_autofill(), get_spell_manager(), self.currency_ledger, self.database()))
+
+    # Rate limits per client and per character, and in-flight caps, for the expensive endpoints
+    @property
+    def rate_limit_store(self):
+        return self._parts.get('rate_limit_store', lambda: SQLiteBucketStore(self.database())
+                               if RATE_LIMIT_STORE == 'sqlite' else MemoryBucketStore())
+
+    @property
+    def client_rate_limits(self) -> Dict[str, TokenBucketLimiter]:
+        return self._parts.get('client_rate_limits', lambda: {
+            'chat': TokenBucketLimiter(CHAT_RATE_PER_MINUTE / 60, CHAT_BURST, self.rate_limit_store),
+            'autofill': TokenBucketLimiter(AUTOFILL_RATE_PER_MINUTE / 60, AUTOFILL_BURST, self.rate_limit_store)
+        })
+
+    @property
+    def character_rate_limit(self) -> TokenBucketLimiter:
+        return self._parts.get('character_rate_limit', lambda: TokenBucketLimiter(
+            CHARACTER_CHAT_RATE_PER_MINUTE / 60, CHARACTER_CHAT_BURST, self.rate_limit_store))
+
+    @property
+    def admission_gates(self) -> Dict[str, AdmissionGate]:
+        return self._parts.get('admission_gates', lambda: {
+            'chat': AdmissionGate(CHAT_MAX_IN_FLIGHT),
+            'autofill': AdmissionGate(AUTOFILL_MAX_IN_FLIGHT)
+        })
+
+def get_services(flask_app: Optional[Flask] = None) -> Services:
+    """Services of an app (the app handling the current request by default)"""
+    return (flask_app or current_app).extensions['echosheet']
+
+def db_path() -> str:
+    """Database of the app handling the current request, initialized on first use"""
+    return get_services().database()
+
+# The services of the current app, under the names the views use
+chat_engine = LocalProxy(lambda: get_services().chat_engine)
+currency_ledger = LocalProxy(lambda: get_services().currency_ledger)
+creation_pipeline = LocalProxy(lambda: get_services().creation_pipeline)
+client_rate_limits = LocalProxy(lambda: get_services().client_rate_limits)
+character_rate_limit = LocalProxy(lambda: get_services().character_rate_limit)
+admission_gates = LocalProxy(lambda: get_services().admission_gates)
 
-# Initialize database
-init_db()
+main = Blueprint('main', __name__)
 
-# Inicializar utilidades
-autofill = AutoFill()
-recommender = Recommender()
-chat_engine = ChatEngine()
-spell_manager = SpellManager()
+def client_address():
+    """Address of the client, taken from X-Forwarded-For only when running behind a trusted proxy
 
-@app.route('/')
+    Only the last entry, the one the proxy appended, is trusted: the client can put anything before it.
+    """
+    if RATE_LIMIT_TRUST_PROXY and request.access_route:
+        return request.access_route[-1]
+    return request.remote_addr or 'unknown'
+
+def admission_control(group):
+    """Rate limit POSTs to a view per client (and per character) and shed them when the group is full"""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            # ensure_sync runs async views on an event loop for this request
+            if not RATE_LIMIT_ENABLED or request.method != 'POST':
+                return current_app.ensure_sync(view)(*args, **kwargs)
+            
+            gate = admission_gates[group]
+            try:
+                client_rate_limits[group].check(f'{group}:client:{client_address()}')
+                if 'character_id' in kwargs:
+                    character_rate_limit.check(f"{group}:character:{kwargs['character_id']}")
+                gate.acquire()
+            except RateLimited as e:
+                return busy_response(e)
+            
+            try:
+                response = current_app.make_response(current_app.ensure_sync(view)(*args, **kwargs))
+            except Exception:
+                gate.release()
+                raise
+            
+            # Streamed responses keep their slot until the stream is closed
+            if response.is_streamed:
+                response.call_on_close(gate.release)
+            else:
+                gate.release()
+            return response
+        return wrapper
+    return decorator
+
+@main.route('/')
 def index():
     """Main page with character list"""
-    conn = sqlite3.connect('db.sqlite')
+    conn = connect(db_path())
     cursor = conn.cursor()
     cursor.execute('SELECT id, name, race, char_class, level FROM characters ORDER BY created_at DESC')
     characters = cursor.fetchall()
@@ -97,203 +295,90 @@ def index():
     
     return render_template('index.html', characters=characters)
 
-@app.route('/create', methods=['GET', 'POST'])
+@main.route('/create', methods=['GET', 'POST'])
 def create_character():
     """Create new character"""
     if request.method == 'POST':
+        data = request.get_json(silent=True)
+        logger.info(f"Received character creation request for: {(data or {}).get('name', 'Unknown')}")
+        
         try:
-            data = request.get_json()
-            logger.info(f"Received character creation request for: {data.get('name', 'Unknown')}")
-            
-            # Validate required fields
-            required_fields = ['name', 'race', 'char_class', 'background']
-            for field in required_fields:
-                if not data.get(field):
-                    return jsonify({'success': False, 'error': f'Missing required field: {field}'})
-        
-        # Create character with basic data
-            character = Character(
-                name=data['name'],
-                race=data['race'],
-                char_class=data['char_class'],
-                level=max(1, min(20, data.get('level', 1))),  # Cap level between 1-20
-                background=data.get('background', '')
-            )
-        except Exception as e:
-            logger.error(f"Error processing character creation request: {e}")
-            return jsonify({'success': False, 'error': f'Error processing request: {str(e)}'})
-        
-        # Set custom attributes if provided
-        if 'attributes' in data:
-            # Validate attribute points
-            point_costs = {8: 0, 9: 1, 10: 2, 11: 3, 12: 4, 13: 5, 14: 7, 15: 9}
-            total_cost = 0
-            
-            for attr, value in data['attributes'].items():
-                # Convert string to int if necessary
-                try:
-                    value = int(value)
-                except (ValueError, TypeError):
-                    return jsonify({'success': False, 'error': f'Invalid {attr} value: {value}. Must be a number between 8-15.'})
-                
-                if value < 8 or value > 15:
-                    return jsonify({'success': False, 'error': f'Invalid {attr} value: {value}. Must be between 8-15.'})
-                if value in point_costs:
-                    total_cost += point_costs[value]
-                else:
-                    return jsonify({'success': False, 'error': f'Invalid {attr} value: {value}'})
-            
-            if total_cost > 27:
-                return jsonify({'success': False, 'error': f'Too many attribute points used: {total_cost}. Maximum is 27.'})
-            
-            character.attributes = data['attributes']
-        else:
-            # Autofill data if no custom attributes
-            autofill.fill_character(character)
-        
-        # Set custom skills if provided
-        if 'skills' in data:
-            # Validate skill count based on class and background
-            char_class = data['char_class']
-            background = data.get('background', '')
-            
-            # Expected skill choices
-            class_choices = {
-                'Fighter': 2, 'Wizard': 2, 'Cleric': 2, 'Rogue': 4,
-                'Ranger': 3, 'Paladin': 2, 'Bard': 3, 'Sorcerer': 2,
-                'Warlock': 2, 'Monk': 2, 'Druid': 2, 'Barbarian': 2
-            }
-            
-            expected_choices = class_choices.get(char_class, 0) + 2  # +2 for background
-            
-            if len(data['skills']) != expected_choices:
-                return jsonify({
-                    'success': False, 
-                    'error': f'Invalid number of skills: {len(data["skills"])}. Expected {expected_choices} for {char_class} with {background} background.'
-                })
-            
-            character.skills = data['skills']
-        elif not character.skills:
-            # Generate skills if not provided
-            autofill.fill_character(character)
-        
-        # Set custom spells if provided
-        if 'spells' in data:
-            spells_data = data['spells']
-            cantrips = spells_data.get('cantrips', [])
-            spells_known = spells_data.get('spells', [])
-            
-            # Validate spell selection
-            validation = spell_manager.validate_spell_selection(
-                character.char_class, cantrips, spells_known
-            )
-            
-            if not validation['valid']:
-                return jsonify({
-                    'success': False,
-                    'error': 'Invalid spell selection: ' + '; '.join(validation['errors'])
-                })
-            
-            character.cantrips = cantrips
-            character.spells_known = spells_known
-            character.spells = cantrips + spells_known  # Combined list for compatibility
-        else:
-            # Always generate spells for spellcasters if not provided
-            if spell_manager.can_cast_spells(character.char_class):
-                autofill.fill_character(character)
-                
-                # If autofill didn't work, try direct spell generation
-                if not character.cantrips and not character.spells_known:
-                    suggestions = spell_manager.get_spell_suggestions(character.char_class)
-                    character.cantrips = suggestions['cantrips']
-                    character.spells_known = suggestions['spells']
-                    character.spells = character.cantrips + character.spells_known
-        
-        # Save to database
-        try:
-            conn = sqlite3.connect('db.sqlite')
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO characters (name, race, char_class, level, background, 
-                                        attributes, skills, feats, cantrips, spells_known, personality_traits,
-                                        background_story, short_term_goals, long_term_goals, personal_goals, personality_tags, flaws,
-                                        currency, items, item_weights)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                character.name, character.race, character.char_class, character.level,
-                character.background, json.dumps(character.attributes),
-                json.dumps(character.skills), json.dumps(character.feats),
-                    json.dumps(character.cantrips), json.dumps(character.spells_known), 
-                character.personality_traits, character.background_story,
-                character.short_term_goals, character.long_term_goals, character.personal_goals,
-                json.dumps(character.personality_tags), character.flaws,
-                json.dumps(character.currency), json.dumps(character.items), json.dumps(character.item_weights)
-            ))
-            character_id = cursor.lastrowid
-            conn.commit()
-            conn.close()
-            
-            logger.info(f"Character created successfully with ID: {character_id}")
-            return jsonify({'success': True, 'character_id': character_id})
+            result = creation_pipeline.run(data)
+        except CreationError as e:
+            return jsonify({'success': False, 'error': str(e)})
         except Exception as e:
-            logger.error(f"Database error during character creation: {e}")
-            return jsonify({'success': False, 'error': f'Database error: {str(e)}'})
+            logger.error(f"Error during character creation: {e}")
+            return jsonify({'success': False, 'error': f'Error creating character: {str(e)}'})
+        
+        logger.info(f"Character created successfully with ID: {result['character_id']}")
+        recommendation_worker.submit(result['character'])
+        return jsonify({'success': True, 'character_id': result['character_id'], 'timings': result['timings']})
     
     return render_template('create.html')
 
-@app.route('/character/<int:character_id>')
+@main.route('/api/characters', methods=['POST'])
+def api_create_character():
+    """API to create a character through the creation pipeline"""
+    data = request.get_json(silent=True)
+    
+    try:
+        seed = data.get('seed') if data else None
+        result = creation_pipeline.run(data, seed=int(seed) if seed is not None else None)
+    except (CreationError, ValueError, TypeError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error during character creation: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    
+    recommendation_worker.submit(result['character'])
+    return jsonify({
+        'success': True,
+        'character_id': result['character_id'],
+        'character': result['character'].to_dict(),
+        'timings': result['timings']
+    }), 201
+
+@main.route('/api/characters/generate', methods=['POST'])
+def generate_characters():
+    """Generate a batch of NPCs (?count=N) and insert them in one transaction"""
+    try:
+        data = request.get_json(silent=True) or {}
+        count = request.args.get('count', data.get('count', 1), type=int)
+        
+        if count is None or count < 1 or count > MAX_NPC_BATCH:
+            return jsonify({'success': False, 'error': f'count must be between 1 and {MAX_NPC_BATCH}'}), 400
+        
+        seed = data.get('seed')
+        if seed is not None:
+            try:
+                seed = int(seed)
+            except (ValueError, TypeError):
+                return jsonify({'success': False, 'error': f'Invalid seed: {seed}. Must be an integer.'}), 400
+        
+        from utils.npc_generator import generate_npcs, parse_npc_options
+        
+        try:
+            options = parse_npc_options(data)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        rows = generate_npcs(count, seed, options)
+        
+        # Bulk insert characters and their ledger balances in a single transaction
+        character_ids = creation_pipeline.persist(rows)
+        
+        logger.info(f"Generated {len(character_ids)} NPCs")
+        return jsonify({'success': True, 'count': len(character_ids), 'character_ids': character_ids})
+    except Exception as e:
+        logger.error(f"Error generating characters: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@main.route('/character/<int:character_id>')
 def view_character(character_id):
     """View character sheet"""
-    conn = sqlite3.connect('db.sqlite')
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM characters WHERE id = ?', (character_id,))
-    char_data = cursor.fetchone()
-    conn.close()
+    character = fetch_character(db_path(), character_id)
     
-    if not char_data:
-        return redirect(url_for('index'))
-    
-    # Convert database data to Character object
-    character = Character(
-        id=char_data[0],
-        name=char_data[1],
-        race=char_data[2],
-        char_class=char_data[3],
-        level=char_data[4],
-        background=char_data[5],
-        alignment=char_data[25] if len(char_data) > 25 and char_data[25] else '',
-        experience_points=char_data[26] if len(char_data) > 26 and char_data[26] else 0,
-        age=char_data[27] if len(char_data) > 27 and char_data[27] else '',
-        height=char_data[28] if len(char_data) > 28 and char_data[28] else '',
-        weight=char_data[29] if len(char_data) > 29 and char_data[29] else '',
-        eyes=char_data[30] if len(char_data) > 30 and char_data[30] else '',
-        skin=char_data[31] if len(char_data) > 31 and char_data[31] else '',
-        hair=char_data[32] if len(char_data) > 32 and char_data[32] else '',
-        hit_point_maximum=char_data[33] if len(char_data) > 33 and char_data[33] else 0,
-        current_hit_points=char_data[34] if len(char_data) > 34 and char_data[34] else 0,
-        temporary_hit_points=char_data[35] if len(char_data) > 35 and char_data[35] else 0,
-        hit_dice=char_data[36] if len(char_data) > 36 and char_data[36] else '',
-        attributes=json.loads(char_data[6]) if char_data[6] and char_data[6].strip() else {},
-        skills=json.loads(char_data[7]) if char_data[7] and char_data[7].strip() else [],
-        feats=json.loads(char_data[8]) if char_data[8] and char_data[8].strip() else [],
-        cantrips=json.loads(char_data[14]) if char_data[14] and char_data[14].strip() else [],
-        spells_known=json.loads(char_data[15]) if char_data[15] and char_data[15].strip() else [],
-        personality_traits=char_data[10] or '',
-        ideals=char_data[37] if len(char_data) > 37 and char_data[37] else '',
-        bonds=char_data[38] if len(char_data) > 38 and char_data[38] else '',
-        background_story=char_data[16] if len(char_data) > 16 and char_data[16] else '',
-        short_term_goals=char_data[17] if len(char_data) > 17 and char_data[17] else '',
-        long_term_goals=char_data[18] if len(char_data) > 18 and char_data[18] else '',
-        personal_goals=char_data[19] if len(char_data) > 19 and char_data[19] else '',
-        personality_tags=json.loads(char_data[20]) if len(char_data) > 20 and char_data[20] and char_data[20].strip() else [],
-        flaws=char_data[21] if len(char_data) > 21 and char_data[21] else '',
-        currency=json.loads(char_data[22]) if len(char_data) > 22 and char_data[22] and char_data[22].strip() else {},
-        items=json.loads(char_data[23]) if len(char_data) > 23 and char_data[23] and char_data[23].strip() else [],
-        item_weights=json.loads(char_data[24]) if len(char_data) > 24 and char_data[24] and char_data[24].strip() else {}
-    )
-    
-    # Combine cantrips and spells_known for backward compatibility
-    character.spells = character.cantrips + character.spells_known
+    if not character:
+        return redirect(url_for('main.index'))
     
     # Get detailed spell information for display
     cantrips_info = []
@@ -309,8 +394,8 @@ def view_character(character_id):
         if spell_info:
             spells_info.append(spell_info)
     
-    # Get recommendations
-    recommendations = recommender.get_recommendations(character)
+    # Get recommendations (precomputed in the background when the character last changed)
+    recommendations = recommendation_worker.get_recommendations(character)
     
     return render_template('character.html', 
                          character=character, 
@@ -318,91 +403,233 @@ def view_character(character_id):
                          cantrips_info=cantrips_info,
                          spells_info=spells_info)
 
-@app.route('/character/<int:character_id>/chat', methods=['GET', 'POST'])
-def chat_with_character(character_id):
+@main.route('/character/<int:character_id>/chat', methods=['GET', 'POST'])
+@admission_control('chat')
+async def chat_with_character(character_id):
     """Chat with character"""
-    conn = sqlite3.connect('db.sqlite')
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM characters WHERE id = ?', (character_id,))
-    char_data = cursor.fetchone()
-    conn.close()
+    character = await run_db(fetch_character, db_path(), character_id)
     
-    if not char_data:
-        return redirect(url_for('index'))
-    
-    character = Character(
-        id=char_data[0],
-        name=char_data[1],
-        race=char_data[2],
-        char_class=char_data[3],
-        level=char_data[4],
-        background=char_data[5],
-        alignment=char_data[25] if len(char_data) > 25 and char_data[25] else '',
-        experience_points=char_data[26] if len(char_data) > 26 and char_data[26] else 0,
-        age=char_data[27] if len(char_data) > 27 and char_data[27] else '',
-        height=char_data[28] if len(char_data) > 28 and char_data[28] else '',
-        weight=char_data[29] if len(char_data) > 29 and char_data[29] else '',
-        eyes=char_data[30] if len(char_data) > 30 and char_data[30] else '',
-        skin=char_data[31] if len(char_data) > 31 and char_data[31] else '',
-        hair=char_data[32] if len(char_data) > 32 and char_data[32] else '',
-        hit_point_maximum=char_data[33] if len(char_data) > 33 and char_data[33] else 0,
-        current_hit_points=char_data[34] if len(char_data) > 34 and char_data[34] else 0,
-        temporary_hit_points=char_data[35] if len(char_data) > 35 and char_data[35] else 0,
-        hit_dice=char_data[36] if len(char_data) > 36 and char_data[36] else '',
-        attributes=json.loads(char_data[6]) if char_data[6] and char_data[6].strip() else {},
-        skills=json.loads(char_data[7]) if char_data[7] and char_data[7].strip() else [],
-        feats=json.loads(char_data[8]) if char_data[8] and char_data[8].strip() else [],
-        cantrips=json.loads(char_data[14]) if char_data[14] and char_data[14].strip() else [],
-        spells_known=json.loads(char_data[15]) if char_data[15] and char_data[15].strip() else [],
-        personality_traits=char_data[10] or '',
-        ideals=char_data[37] if len(char_data) > 37 and char_data[37] else '',
-        bonds=char_data[38] if len(char_data) > 38 and char_data[38] else '',
-        background_story=char_data[16] if len(char_data) > 16 and char_data[16] else '',
-        short_term_goals=char_data[17] if len(char_data) > 17 and char_data[17] else '',
-        long_term_goals=char_data[18] if len(char_data) > 18 and char_data[18] else '',
-        personal_goals=char_data[19] if len(char_data) > 19 and char_data[19] else '',
-        personality_tags=json.loads(char_data[20]) if len(char_data) > 20 and char_data[20] and char_data[20].strip() else [],
-        flaws=char_data[21] if len(char_data) > 21 and char_data[21] else '',
-        currency=json.loads(char_data[22]) if len(char_data) > 22 and char_data[22] and char_data[22].strip() else {},
-        items=json.loads(char_data[23]) if len(char_data) > 23 and char_data[23] and char_data[23].strip() else [],
-        item_weights=json.loads(char_data[24]) if len(char_data) > 24 and char_data[24] and char_data[24].strip() else {},
-        chat_history=json.loads(char_data[12]) if char_data[12] and char_data[12].strip() else []
-    )
-    
-    # Combine cantrips and spells_known for backward compatibility
-    character.spells = character.cantrips + character.spells_known
+    if not character:
+        return redirect(url_for('main.index'))
     
     if request.method == 'POST':
         data = request.get_json()
         user_message = data.get('message', '')
         
         # Generate character response
-        response = chat_engine.get_response(character, user_message)
+        try:
+            response = await chat_engine.aget_response(character, user_message)
+        except BackendBusy as e:
+            return busy_response(e)
         
         # Save to history
-        chat_entry = {
-            'timestamp': datetime.now().isoformat(),
-            'user': user_message,
-            'character': response
-        }
-        character.chat_history.append(chat_entry)
-        
-        # Update database
-        conn = sqlite3.connect('db.sqlite')
-        cursor = conn.cursor()
-        cursor.execute('UPDATE characters SET chat_history = ? WHERE id = ?',
-                      (json.dumps(character.chat_history), character_id))
-        conn.commit()
-        conn.close()
+        seq = await run_db(chat_engine.record_exchange, character_id, user_message, response)
         
-        return jsonify({'response': response})
+        return jsonify({'response': response, 'seq': seq})
     
     return render_template('chat.html', character=character)
 
-@app.route('/character/<int:character_id>/delete', methods=['POST'])
+@main.route('/api/character/<int:character_id>/chat', methods=['GET'])
+def chat_history_page(character_id):
+    """Get a page of chat messages older than ?before=<seq> (the latest page by default)"""
+    try:
+        if not fetch_character(db_path(), character_id):
+            return jsonify({'success': False, 'error': 'Character not found'}), 404
+        
+        before = request.args.get('before', type=int)
+        limit = max(1, min(CHAT_PAGE_MAX, request.args.get('limit', CHAT_PAGE_SIZE, type=int)))
+        messages, has_more = chat_engine.memory.get_page(character_id, before, limit)
+        return jsonify({
+            'success': True,
+            'messages': messages,
+            'has_more': has_more,
+            'next_before': messages[0]['seq'] if has_more else None
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@main.route('/api/character/<int:character_id>/chat/since', methods=['GET'])
+def chat_messages_since(character_id):
+    """Get the chat messages after ?seq=<N>, long-polling up to ?wait=<seconds> when there are none yet"""
+    try:
+        if not fetch_character(db_path(), character_id):
+            return jsonify({'success': False, 'error': 'Character not found'}), 404
+        
+        after_seq = max(0, request.args.get('seq', 0, type=int))
+        wait = max(0.0, min(CHAT_POLL_MAX_WAIT, request.args.get('wait', 0, type=float)))
+        limit = max(1, min(CHAT_PAGE_MAX, request.args.get('limit', CHAT_PAGE_MAX, type=int)))
+        try:
+            messages = chat_engine.memory.wait_for_messages(character_id, after_seq, wait, limit)
+        except RateLimited as e:
+            return busy_response(e)
+        return jsonify({
+            'success': True,
+            'messages': messages,
+            'last_seq': messages[-1]['seq'] if messages else after_seq,
+            'has_more': len(messages) == limit
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@main.route('/health/live', methods=['GET'])
+def liveness():
+    """The process is up and serving requests"""
+    return jsonify({'status': 'ok'})
+
+@main.route('/health/ready', methods=['GET'])
+def readiness():
+    """Ready once warmup finished and the database answers"""
+    try:
+        conn = connect(db_path())
+        conn.execute('SELECT 1 FROM characters LIMIT 1')
+        conn.close()
+    except sqlite3.Error as e:
+        return jsonify({'ready': False, 'error': str(e)}), 503
+    
+    if not current_app.config['READY']:
+        return jsonify({'ready': False, 'error': 'Warming up'}), 503
+    return jsonify({'ready': True, 'warmup': current_app.config.get('WARMUP_STATS', {})})
+
+@main.before_app_request
+def start_request_metrics():
+    """Start timing the request under its route pattern (not the URL, to keep the label set small)"""
+    if METRICS_ENABLED:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        g.request_timer = get_services().metrics.start(route, request.method)
+
+@main.after_app_request
+def record_request_metrics(response):
+    """Record the request with the status of its response"""
+    timer = g.pop('request_timer', None)
+    if timer:
+        get_services().metrics.finish(timer, response.status_code)
+    return response
+
+@main.teardown_app_request
+def record_failed_request_metrics(error):
+    """Record requests that ended in an exception before a response was built"""
+    timer = g.pop('request_timer', None)
+    if timer:
+        get_services().metrics.finish(timer, 500)
+
+@main.before_app_request
+def start_request_profile():
+    """Profile the request when it sends the profiling secret, or when it is picked by sampling"""
+    profiler = get_services().profiler
+    if profiler.enabled:
+        reason = profiler.select(request.headers.get('X-Profile') or request.args.get('profile'))
+        if reason:
+            g.request_profile = profiler.start(reason)
+
+def profile_async_view(view):
+    """Profile an async view of a profiled request in the event loop thread it runs in"""
+    @functools.wraps(view)
+    async def wrapper(*args, **kwargs):
+        session = g.get('request_profile')
+        profile = session.enable() if session else None
+        try:
+            return await view(*args, **kwargs)
+        finally:
+            if profile:
+                profile.disable()
+    return wrapper
+
+def save_request_profile(session):
+    """Write out the profile of the current request, returning its file name"""
+    route = request.url_rule.rule if request.url_rule else request.path
+    try:
+        return get_services().profiler.finish(session, request.method, route)
+    except OSError as e:
+        logger.error(f"Error saving profile of {request.method} {route}: {e}")
+
+@main.after_app_request
+def finish_request_profile(response):
+    """Save the profile, telling the client where when it asked for one"""
+    session = g.pop('request_profile', None)
+    if session:
+        name = save_request_profile(session)
+        if name and session.reason == 'requested':
+            response.headers['X-Profile-File'] = name
+    return response
+
+@main.teardown_app_request
+def finish_failed_request_profile(error):
+    """Save the profile of a request that ended in an exception"""
+    session = g.pop('request_profile', None)
+    if session:
+        save_request_profile(session)
+
+def cache_stats():
+    """Stats of the caches built so far (reading them must not build an engine)"""
+    caches = {}
+    if get_recommender.built:
+        caches['recommendations'] = recommender.get_cache_stats()
+    if get_autofill.built:
+        caches['autofill_suggestions'] = autofill.suggestions_cache.stats()
+    services = get_services()
+    if 'chat_engine' in services.built():
+        caches['chat_responses'] = services.chat_engine.response_cache.stats()
+        caches['chat_recall'] = services.chat_engine.recall.stats()
+    return caches
+
+@main.route('/metrics', methods=['GET'])
+def metrics():
+    """Request, database and cache metrics of this process in the Prometheus text format"""
+    return Response(get_services().metrics.render(cache_stats()), content_type=METRICS_CONTENT_TYPE)
+
+def busy_response(error):
+    """429 response asking the client to retry later (error is BackendBusy or RateLimited)"""
+    response = jsonify({'success': False, 'error': str(error)})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+def sse_event(event: str, data: dict) -> str:
+    """Format a Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@main.route('/character/<int:character_id>/chat/stream', methods=['POST'])
+@admission_control('chat')
+def stream_chat_with_character(character_id):
+    """Chat with character, streaming the response as Server-Sent Events"""
+    character = fetch_character(db_path(), character_id)
+    if not character:
+        return jsonify({'success': False, 'error': 'Character not found'}), 404
+    
+    data = request.get_json(silent=True) or {}
+    user_message = data.get('message', '')
+    
+    # Start generating before sending headers so a full backend can still answer 429
+    stream = chat_engine.stream_response(character, user_message)
+    try:
+        first_chunk = next(stream, '')
+    except BackendBusy as e:
+        return busy_response(e)
+    
+    def generate():
+        chunks = []
+        try:
+            for chunk in itertools.chain([first_chunk] if first_chunk else [], stream):
+                chunks.append(chunk)
+                yield sse_event('chunk', {'text': chunk})
+            
+            # Persist only once the full response has been sent
+            response = ''.join(chunks)
+            seq = chat_engine.record_exchange(character_id, user_message, response)
+            yield sse_event('done', {'response': response, 'seq': seq})
+        except Exception as e:
+            logger.error(f"Error streaming chat response for character {character_id}: {e}")
+            yield sse_event('error', {'error': str(e)})
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Stop reverse proxies from buffering the stream
+    })
+
+@main.route('/character/<int:character_id>/delete', methods=['POST'])
 def delete_character(character_id):
     """Delete character with confirmation"""
-    conn = sqlite3.connect('db.sqlite')
+    conn = connect(db_path())
     cursor = conn.cursor()
     
     # Verify character exists
@@ -418,10 +645,14 @@ def delete_character(character_id):
     conn.commit()
     conn.close()
     
+    currency_ledger.delete_balance(character_id)
+    chat_engine.forget_character(character_id)
+    
     return jsonify({'success': True, 'message': f'Character "{char_data[0]}" deleted successfully'})
 
-@app.route('/api/autofill', methods=['POST'])
-def api_autofill():
+@main.route('/api/autofill', methods=['POST'])
+@admission_control('autofill')
+async def api_autofill():
     """API to autofill character data"""
     try:
         data = request.get_json()
@@ -434,14 +665,21 @@ def api_autofill():
         background = data.get('background', '')
         race = data.get('race', '')
         playstyle = data.get('playstyle', '')
+        seed = data.get('seed')
         
-        logger.info(f"Processing autofill: class={char_class}, background={background}, race={race}, playstyle={playstyle}")
+        logger.info(f"Processing autofill: class={char_class}, background={background}, race={race}, playstyle={playstyle}, seed={seed}")
         
         if not char_class or not background:
             return jsonify({'success': False, 'error': 'Class and background are required'})
         
-        # Get suggestions that respect available skills and playstyle
-        suggestions = autofill.get_suggestions(char_class, background, race, playstyle)
+        if seed is not None:
+            try:
+                seed = int(seed)
+            except (ValueError, TypeError):
+                return jsonify({'success': False, 'error': f'Invalid seed: {seed}. Must be an integer.'})
+        
+        # Get suggestions that respect available skills and playstyle (CPU only, no I/O to await)
+        suggestions = autofill.get_suggestions(char_class, background, race, playstyle, seed=seed)
         logger.info(f"Generated autofill suggestions for {char_class}")
         
         return jsonify({
@@ -450,13 +688,14 @@ def api_autofill():
             'skills': suggestions['skills'],
             'spells': suggestions['spells'],
             'available_playstyles': suggestions['available_playstyles'],
-            'current_playstyle': suggestions['current_playstyle']
+            'current_playstyle': suggestions['current_playstyle'],
+            'seed': seed
         })
     except Exception as e:
         logger.error(f"Error in autofill API: {e}")
         return jsonify({'success': False, 'error': str(e)})
 
-@app.route('/api/spells/<char_class>', methods=['GET'])
+@main.route('/api/spells/<char_class>', methods=['GET'])
 def get_spells(char_class):
     """Get available spells for a class"""
     try:
@@ -473,7 +712,7 @@ def get_spells(char_class):
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
-@app.route('/api/spells/validate', methods=['POST'])
+@main.route('/api/spells/validate', methods=['POST'])
 def validate_spells():
     """Validate spell selection"""
     try:
@@ -491,7 +730,7 @@ def validate_spells():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
-@app.route('/api/spells/suggestions/<char_class>', methods=['GET'])
+@main.route('/api/spells/suggestions/<char_class>', methods=['GET'])
 def get_spell_suggestions(char_class):
     """Get spell suggestions for a class"""
     try:
@@ -504,7 +743,7 @@ def get_spell_suggestions(char_class):
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
-@app.route('/api/playstyles/<char_class>', methods=['GET'])
+@main.route('/api/playstyles/<char_class>', methods=['GET'])
 def get_playstyles(char_class):
     """Get available playstyles for a class"""
     try:
@@ -529,7 +768,38 @@ def get_playstyles(char_class):
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
-@app.route('/api/spell/<spell_name>', methods=['GET'])
+@main.route('/api/point-buy/<char_class>', methods=['GET'])
+def get_point_buy_arrays(char_class):
+    """Get the best point buy arrays for a class and optional race"""
+    try:
+        race = request.args.get('race') or None
+        limit = max(1, min(50, request.args.get('limit', 5, type=int)))
+        
+        return jsonify({
+            'success': True,
+            'arrays': autofill.get_top_point_buy_arrays(char_class, race, limit),
+            'total_valid_arrays': autofill.point_buy.total_arrays
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@main.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Get hit-rate metrics for the in-process caches, queues and rate limiters"""
+    return jsonify({
+        'success': True,
+        'recommendations': recommender.get_cache_stats(),
+        'recommendation_queue': recommendation_worker.stats(),
+        'chat_backend': chat_engine.backend.stats(),
+        'chat_responses': chat_engine.response_cache.stats(),
+        'chat_recall': chat_engine.recall.stats(),
+        'rate_limits': {group: limiter.stats() for group, limiter in client_rate_limits.items()},
+        'character_rate_limit': character_rate_limit.stats(),
+        'admission': {group: gate.stats() for group, gate in admission_gates.items()},
+        'autofill_suggestions': autofill.suggestions_cache.stats()
+    })
+
+@main.route('/api/spell/<spell_name>', methods=['GET'])
 def get_spell_info(spell_name):
     """Get detailed information for a specific spell"""
     try:
@@ -550,93 +820,75 @@ def get_spell_info(spell_name):
             'error': str(e)
         }), 500
 
-@app.route('/api/character/<int:character_id>/personality', methods=['POST'])
-def update_personality(character_id):
+@main.route('/api/character/<int:character_id>/personality', methods=['POST'])
+async def update_personality(character_id):
     """Update character personality fields"""
     try:
         data = request.get_json()
         
-        # Get current character data
-        conn = sqlite3.connect('db.sqlite')
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM characters WHERE id = ?', (character_id,))
-        char_data = cursor.fetchone()
-        
-        if not char_data:
-            conn.close()
+        # Save the fields and precompute the chat persona from them
+        found = await run_db(update_character_fields, db_path(), character_id, {
+            'background_story': data.get('background_story', ''),
+            'short_term_goals': data.get('short_term_goals', ''),
+            'long_term_goals': data.get('long_term_goals', ''),
+            'personal_goals': data.get('personal_goals', ''),
+            'personality_traits': data.get('personality_traits', ''),
+            'ideals': data.get('ideals', ''),
+            'bonds': data.get('bonds', ''),
+            'personality_tags': json.dumps(data.get('personality_tags', [])),
+            'flaws': data.get('flaws', '')
+        }, refresh_persona=True)
+        
+        if not found:
             return jsonify({'success': False, 'error': 'Character not found'}), 404
         
-        # Update personality fields
-        cursor.execute('''
-            UPDATE characters SET 
-                background_story = ?, 
-                short_term_goals = ?, 
-                long_term_goals = ?, 
-                personal_goals = ?, 
-                personality_traits = ?,
-                ideals = ?,
-                bonds = ?,
-                personality_tags = ?, 
-                flaws = ?
-            WHERE id = ?
-        ''', (
-            data.get('background_story', ''),
-            data.get('short_term_goals', ''),
-            data.get('long_term_goals', ''),
-            data.get('personal_goals', ''),
-            data.get('personality_traits', ''),
-            data.get('ideals', ''),
-            data.get('bonds', ''),
-            json.dumps(data.get('personality_tags', [])),
-            data.get('flaws', ''),
-            character_id
-        ))
-        
-        conn.commit()
-        conn.close()
-        
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/character/<int:character_id>/inventory', methods=['POST'])
-def update_inventory(character_id):
+def save_inventory(ledger: CurrencyLedger, path: str, character_id: int, items: list,
+                   item_weights: dict, currency: dict) -> bool:
+    """Save the inventory and record currency edits in the ledger in one transaction"""
+    conn = connect(path, isolation_level=None)
+    try:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('UPDATE characters SET items = ?, item_weights = ? WHERE id = ?',
+                       (json.dumps(items), json.dumps(item_weights), character_id))
+        if cursor.rowcount == 0:
+            cursor.execute('ROLLBACK')
+            return False
+        
+        # Manual currency edits are adjustments; the ledger also writes the currency column
+        delta = currency_to_copper(currency) - ledger.get_balance(character_id, cursor)
+        if delta:
+            ledger.record(character_id, delta, 'adjustment', 'Inventory edit', currency=currency, cursor=cursor)
+        else:
+            cursor.execute('UPDATE characters SET currency = ? WHERE id = ?', (json.dumps(currency), character_id))
+        cursor.execute('COMMIT')
+        return True
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+@main.route('/api/character/<int:character_id>/inventory', methods=['POST'])
+async def update_inventory(character_id):
     """Update character inventory and currency"""
     try:
         data = request.get_json()
+        found = await run_db(save_inventory, get_services().currency_ledger, db_path(), character_id,
+                             data.get('items', []), data.get('item_weights', {}), data.get('currency', {}))
         
-        # Get current character data
-        conn = sqlite3.connect('db.sqlite')
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM characters WHERE id = ?', (character_id,))
-        char_data = cursor.fetchone()
-        
-        if not char_data:
-            conn.close()
+        if not found:
             return jsonify({'success': False, 'error': 'Character not found'}), 404
         
-        # Update inventory fields
-        cursor.execute('''
-            UPDATE characters SET 
-                currency = ?, 
-                items = ?,
-                item_weights = ?
-            WHERE id = ?
-        ''', (
-            json.dumps(data.get('currency', {})),
-            json.dumps(data.get('items', [])),
-            json.dumps(data.get('item_weights', {})),
-            character_id
-        ))
-        
-        conn.commit()
-        conn.close()
-        
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/character/<int:character_id>/apply-pack', methods=['POST'])
+@main.route('/api/character/<int:character_id>/apply-pack', methods=['POST'])
 def apply_equipment_pack(character_id):
     """Apply an equipment pack to a character"""
     try:
@@ -653,13 +905,15 @@ def apply_equipment_pack(character_id):
         if not pack_info:
             return jsonify({'success': False, 'error': 'Pack not found'}), 404
         
-        # Get current character data
-        conn = sqlite3.connect('db.sqlite')
+        # Get current character data; the items and the ledger are written in the same transaction
+        conn = connect(db_path(), isolation_level=None)
         cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
         cursor.execute('SELECT * FROM characters WHERE id = ?', (character_id,))
         char_data = cursor.fetchone()
         
         if not char_data:
+            cursor.execute('ROLLBACK')
             conn.close()
             return jsonify({'success': False, 'error': 'Character not found'}), 404
         
@@ -684,21 +938,27 @@ def apply_equipment_pack(character_id):
             new_currency[currency_type] = new_currency.get(currency_type, 0) + amount
         
         # Update character
-        cursor.execute('''
-            UPDATE characters SET 
-                currency = ?, 
-                items = ?,
-                item_weights = ?
-            WHERE id = ?
-        ''', (
-            json.dumps(new_currency),
-            json.dumps(new_items),
-            json.dumps(new_weights),
-            character_id
-        ))
-        
-        conn.commit()
-        conn.close()
+        try:
+            cursor.execute('''
+                UPDATE characters SET 
+                    items = ?,
+                    item_weights = ?
+                WHERE id = ?
+            ''', (
+                json.dumps(new_items),
+                json.dumps(new_weights),
+                character_id
+            ))
+            
+            # Pack currency goes through the ledger, which also updates the currency column
+            currency_ledger.record(character_id, currency_to_copper(pack_info['currency']), 'pack',
+                                   pack_name, currency=new_currency, cursor=cursor)
+            cursor.execute('COMMIT')
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
         
         return jsonify({
             'success': True,
@@ -710,129 +970,189 @@ def apply_equipment_pack(character_id):
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/character/<int:character_id>/basic-info', methods=['POST'])
-def update_basic_info(character_id):
+def parse_amount_cp(data):
+    """Read a copper amount from either 'amount_cp' or an 'amount' denomination dict"""
+    if 'amount_cp' in data:
+        return int(data['amount_cp'])
+    return currency_to_copper(data.get('amount', {}))
+
+@main.route('/api/character/<int:character_id>/currency', methods=['GET', 'POST'])
+def character_currency(character_id):
+    """Get the ledger balance or record a loot/purchase transaction"""
+    try:
+        if request.method == 'POST':
+            data = request.get_json() or {}
+            source = data.get('source', '')
+            if source not in ('loot', 'purchase'):
+                return jsonify({'success': False, 'error': 'Source must be loot or purchase'}), 400
+
+            amount_cp = parse_amount_cp(data)
+            if amount_cp <= 0:
+                return jsonify({'success': False, 'error': 'Amount must be positive'}), 400
+
+            # Purchases spend money, loot adds it
+            signed_amount = -amount_cp if source == 'purchase' else amount_cp
+            balance = currency_ledger.record(character_id, signed_amount, source, data.get('note', ''))
+
+            return jsonify({
+                'success': True,
+                'balance_cp': balance,
+                'formatted': format_copper(balance)
+            })
+
+        limit = max(1, min(500, request.args.get('limit', 50, type=int)))
+        balance = currency_ledger.get_balance(character_id)
+        return jsonify({
+            'success': True,
+            'balance_cp': balance,
+            'formatted': format_copper(balance),
+            'transactions': currency_ledger.get_transactions(character_id, limit)
+        })
+    except LedgerError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@main.route('/api/currency/transfer', methods=['POST'])
+def transfer_currency():
+    """Transfer money between two characters atomically"""
+    try:
+        data = request.get_json() or {}
+        from_id = data.get('from_id')
+        to_id = data.get('to_id')
+
+        if not from_id or not to_id:
+            return jsonify({'success': False, 'error': 'from_id and to_id are required'}), 400
+
+        balances = currency_ledger.transfer(int(from_id), int(to_id), parse_amount_cp(data), data.get('note', ''))
+
+        return jsonify({'success': True, **balances})
+    except LedgerError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@main.route('/api/party/currency', methods=['GET'])
+def party_currency():
+    """Get aggregated currency totals for a party (?ids=1,2,3)"""
+    try:
+        ids = [int(value) for value in request.args.get('ids', '').split(',') if value.strip()]
+        totals = currency_ledger.get_party_totals(ids)
+
+        return jsonify({'success': True, **totals})
+    except ValueError:
+        return jsonify({'success': False, 'error': 'ids must be a comma-separated list of integers'}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@main.route('/api/party/composition', methods=['GET'])
+def party_composition():
+    """Analyze party coverage gaps and suggest additions (?ids=1,2,3&limit=5)"""
+    try:
+        ids = [int(value) for value in request.args.get('ids', '').split(',') if value.strip()]
+        limit = max(1, min(request.args.get('limit', 5, type=int) or 5, 20))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'ids must be a comma-separated list of integers'}), 400
+    
+    if not ids:
+        return jsonify({'success': False, 'error': 'No character ids provided'}), 400
+    
+    try:
+        placeholders = ','.join('?' for _ in ids)
+        conn = connect(db_path())
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT id, name, char_class, level, skills, cantrips, spells_known
+            FROM characters WHERE id IN ({placeholders})
+        ''', ids)
+        rows = cursor.fetchall()
+        conn.close()
+        
+        found = {row[0] for row in rows}
+        missing = [character_id for character_id in ids if character_id not in found]
+        if missing:
+            return jsonify({'success': False, 'error': f'Characters not found: {missing}'}), 404
+        
+        characters = [Character(
+            id=row[0],
+            name=row[1],
+            char_class=row[2],
+            level=row[3],
+            skills=json.loads(row[4]) if row[4] and row[4].strip() else [],
+            cantrips=json.loads(row[5]) if row[5] and row[5].strip() else [],
+            spells_known=json.loads(row[6]) if row[6] and row[6].strip() else []
+        ) for row in rows]
+        
+        return jsonify({'success': True, **party_analyzer.analyze(characters, limit)})
+    except Exception as e:
+        logger.error(f"Error analyzing party composition: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@main.route('/api/character/<int:character_id>/basic-info', methods=['POST'])
+async def update_basic_info(character_id):
     """Update character basic information"""
     try:
         data = request.get_json()
         
-        # Get current character data
-        conn = sqlite3.connect('db.sqlite')
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM characters WHERE id = ?', (character_id,))
-        char_data = cursor.fetchone()
+        found = await run_db(update_character_fields, db_path(), character_id, {
+            'alignment': data.get('alignment', ''),
+            'experience_points': data.get('experience_points', 0)
+        })
         
-        if not char_data:
-            conn.close()
+        if not found:
             return jsonify({'success': False, 'error': 'Character not found'}), 404
         
-        # Update basic info fields
-        cursor.execute('''
-            UPDATE characters SET 
-                alignment = ?, 
-                experience_points = ?
-            WHERE id = ?
-        ''', (
-            data.get('alignment', ''),
-            data.get('experience_points', 0),
-            character_id
-        ))
-        
-        conn.commit()
-        conn.close()
-        
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/character/<int:character_id>/physical-info', methods=['POST'])
-def update_physical_info(character_id):
+@main.route('/api/character/<int:character_id>/physical-info', methods=['POST'])
+async def update_physical_info(character_id):
     """Update character physical characteristics"""
     try:
         data = request.get_json()
         
-        # Get current character data
-        conn = sqlite3.connect('db.sqlite')
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM characters WHERE id = ?', (character_id,))
-        char_data = cursor.fetchone()
+        found = await run_db(update_character_fields, db_path(), character_id, {
+            'age': data.get('age', ''),
+            'height': data.get('height', ''),
+            'weight': data.get('weight', ''),
+            'eyes': data.get('eyes', ''),
+            'skin': data.get('skin', ''),
+            'hair': data.get('hair', '')
+        })
         
-        if not char_data:
-            conn.close()
+        if not found:
             return jsonify({'success': False, 'error': 'Character not found'}), 404
         
-        # Update physical info fields
-        cursor.execute('''
-            UPDATE characters SET 
-                age = ?, 
-                height = ?, 
-                weight = ?, 
-                eyes = ?, 
-                skin = ?, 
-                hair = ?
-            WHERE id = ?
-        ''', (
-            data.get('age', ''),
-            data.get('height', ''),
-            data.get('weight', ''),
-            data.get('eyes', ''),
-            data.get('skin', ''),
-            data.get('hair', ''),
-            character_id
-        ))
-        
-        conn.commit()
-        conn.close()
-        
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/character/<int:character_id>/hit-points', methods=['POST'])
-def update_hit_points(character_id):
+@main.route('/api/character/<int:character_id>/hit-points', methods=['POST'])
+async def update_hit_points(character_id):
     """Update character hit points"""
     try:
         data = request.get_json()
         
-        # Get current character data
-        conn = sqlite3.connect('db.sqlite')
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM characters WHERE id = ?', (character_id,))
-        char_data = cursor.fetchone()
+        found = await run_db(update_character_fields, db_path(), character_id, {
+            'hit_point_maximum': data.get('hit_point_maximum', 0),
+            'current_hit_points': data.get('current_hit_points', 0),
+            'temporary_hit_points': data.get('temporary_hit_points', 0)
+        })
         
-        if not char_data:
-            conn.close()
+        if not found:
             return jsonify({'success': False, 'error': 'Character not found'}), 404
         
-        # Update hit points fields
-        cursor.execute('''
-            UPDATE characters SET 
-                hit_point_maximum = ?, 
-                current_hit_points = ?, 
-                temporary_hit_points = ?
-            WHERE id = ?
-        ''', (
-            data.get('hit_point_maximum', 0),
-            data.get('current_hit_points', 0),
-            data.get('temporary_hit_points', 0),
-            character_id
-        ))
-        
-        conn.commit()
-        conn.close()
-        
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-
-
-@app.route('/api/character/<int:character_id>/level-up', methods=['POST'])
+@main.route('/api/character/<int:character_id>/level-up', methods=['POST'])
 def level_up_character(character_id):
     """Level up character"""
     try:
         # Get current character data
-        conn = sqlite3.connect('db.sqlite')
+        conn = connect(db_path())
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM characters WHERE id = ?', (character_id,))
         char_data = cursor.fetchone()
@@ -842,43 +1162,7 @@ def level_up_character(character_id):
             return jsonify({'success': False, 'error': 'Character not found'}), 404
         
         # Load character from database data
-        character = Character(
-            id=char_data[0],
-            name=char_data[1],
-            race=char_data[2],
-            char_class=char_data[3],
-            level=char_data[4],
-            background=char_data[5],
-            alignment=char_data[25] if len(char_data) > 25 and char_data[25] else '',
-            experience_points=char_data[26] if len(char_data) > 26 and char_data[26] else 0,
-            age=char_data[27] if len(char_data) > 27 and char_data[27] else '',
-            height=char_data[28] if len(char_data) > 28 and char_data[28] else '',
-            weight=char_data[29] if len(char_data) > 29 and char_data[29] else '',
-            eyes=char_data[30] if len(char_data) > 30 and char_data[30] else '',
-            skin=char_data[31] if len(char_data) > 31 and char_data[31] else '',
-            hair=char_data[32] if len(char_data) > 32 and char_data[32] else '',
-            hit_point_maximum=char_data[33] if len(char_data) > 33 and char_data[33] else 0,
-            current_hit_points=char_data[34] if len(char_data) > 34 and char_data[34] else 0,
-            temporary_hit_points=char_data[35] if len(char_data) > 35 and char_data[35] else 0,
-            hit_dice=char_data[36] if len(char_data) > 36 and char_data[36] else '',
-            attributes=json.loads(char_data[6]) if char_data[6] and char_data[6].strip() else {},
-            skills=json.loads(char_data[7]) if char_data[7] and char_data[7].strip() else [],
-            feats=json.loads(char_data[8]) if char_data[8] and char_data[8].strip() else [],
-            cantrips=json.loads(char_data[14]) if char_data[14] and char_data[14].strip() else [],
-            spells_known=json.loads(char_data[15]) if char_data[15] and char_data[15].strip() else [],
-            personality_traits=char_data[10] or '',
-            ideals=char_data[37] if len(char_data) > 37 and char_data[37] else '',
-            bonds=char_data[38] if len(char_data) > 38 and char_data[38] else '',
-            background_story=char_data[16] if len(char_data) > 16 and char_data[16] else '',
-            short_term_goals=char_data[17] if len(char_data) > 17 and char_data[17] else '',
-            long_term_goals=char_data[18] if len(char_data) > 18 and char_data[18] else '',
-            personal_goals=char_data[19] if len(char_data) > 19 and char_data[19] else '',
-            personality_tags=json.loads(char_data[20]) if len(char_data) > 20 and char_data[20] and char_data[20].strip() else [],
-            flaws=char_data[21] if len(char_data) > 21 and char_data[21] else '',
-            currency=json.loads(char_data[22]) if len(char_data) > 22 and char_data[22] and char_data[22].strip() else {},
-            items=json.loads(char_data[23]) if len(char_data) > 23 and char_data[23] and char_data[23].strip() else [],
-            item_weights=json.loads(char_data[24]) if len(char_data) > 24 and char_data[24] and char_data[24].strip() else {}
-        )
+        character = row_to_character(char_data)
         
         # Check if character can level up
         if not character.can_level_up():
@@ -903,10 +1187,15 @@ def level_up_character(character_id):
                 level = ?
             WHERE id = ?
         ''', (new_level, character_id))
+        refresh_persona_profile(cursor, character_id)
         
         conn.commit()
         conn.close()
         
+        # Refresh recommendations for the new level off the request path
+        character.level = new_level
+        recommendation_worker.submit(character)
+        
         return jsonify({
             'success': True, 
             'new_level': new_level,
@@ -916,7 +1205,51 @@ def level_up_character(character_id):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+class EchoSheetFlask(Flask):
+    """Flask app whose async views are profiled in their event loop thread too (when profiling is on)"""
+
+    def ensure_sync(self, func):
+        if inspect.iscoroutinefunction(func) and get_services(self).profiler.enabled:
+            func = profile_async_view(func)
+        return super().ensure_sync(func)
+
+def create_app(config: Optional[Dict] = None) -> Flask:
+    """Build an app whose views and services all use config['DATABASE'] (DATABASE_PATH by default)
+
+    ':memory:' gives the app a private in-memory database, so tests and benchmarks can each
+    run against their own database in parallel. The database is initialized by the first
+    request that uses it, and engines are built on first use, so building an app is cheap.
+    """
+    setup_logging()
+    
+    app = EchoSheetFlask(__name__)
+    app.secret_key = 'echo_sheet_secret_key'
+    app.config['DATABASE'] = DATABASE_PATH
+    # Set by the production server (server.py) once caches are warm
+    app.config['READY'] = False
+    app.config['PROFILE_SECRET'] = PROFILE_SECRET
+    app.config['PROFILE_ALL_REQUESTS'] = PROFILE_ALL_REQUESTS
+    app.config['PROFILE_SAMPLE_EVERY'] = PROFILE_SAMPLE_EVERY
+    app.config['PROFILE_DIR'] = PROFILE_DIR
+    app.config.update(config or {})
+    app.config['DATABASE'] = resolve_database(app.config['DATABASE'])
+    
+    app.extensions['echosheet'] = Services(app.config['DATABASE'], RequestProfiler(
+        app.config['PROFILE_DIR'], app.config['PROFILE_SECRET'],
+        app.config['PROFILE_ALL_REQUESTS'], app.config['PROFILE_SAMPLE_EVERY']
+    ))
+    app.register_blueprint(main)
+    return app
+
+# The app served by gunicorn and the development server, built when first accessed as app.app
+_default_app = Lazy(create_app)
+
+def __getattr__(name):
+    if name == 'app':
+        return _default_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == '__main__':
-    init_db()
+    app = create_app()
+    app.config['READY'] = True
     app.run(debug=True, host='0.0.0.0', port=int(os.environ.get('PORT', 5000))) 
\ No newline at end of file
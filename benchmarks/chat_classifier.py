@@ -0,0 +1,48 @@
+"""
+Microbenchmark: compiled keyword classifier vs. per-category substring scans
+
+Run from the project root:
+    python -m benchmarks.chat_classifier
+"""
+
+import timeit
+from utils.chat_engine import ChatEngine, MESSAGE_CATEGORIES, CONTEXT_TOPICS
+
+BASE_MESSAGE = 'quiero saber más sobre tu vida y lo que piensas de todo esto en general '
+SUGGESTED_QUESTION = '¿qué opinas de nuestra última aventura?'
+
+
+def scan_by_category(message: str, ranking) -> str:
+    """The previous approach: one any() scan per category until something matches"""
+    for label, keywords in ranking:
+        if any(word in message for word in keywords):
+            return label
+    return 'general'
+
+
+def legacy_scan(message: str) -> tuple:
+    return scan_by_category(message, MESSAGE_CATEGORIES), scan_by_category(message, CONTEXT_TOPICS)
+
+
+def best_of(func, number: int) -> float:
+    """Best time per call in microseconds"""
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    engine = ChatEngine()
+    messages = [('suggested question', SUGGESTED_QUESTION)]
+    messages += [(f'{len(BASE_MESSAGE) * repeat} chars, no keyword', BASE_MESSAGE * repeat)
+                 for repeat in (1, 4, 16, 64)]
+
+    print(f"{'message':<28}{'legacy us':>12}{'compiled us':>14}{'speedup':>10}")
+    for name, message in messages:
+        assert legacy_scan(message) == engine.scan_message(message)
+        number = max(20, 20000 // len(message))
+        legacy = best_of(lambda: legacy_scan(message), number)
+        compiled = best_of(lambda: engine.scan_message(message), number)
+        print(f"{name:<28}{legacy:>12.2f}{compiled:>14.2f}{legacy / compiled:>9.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -9,9 +9,82 @@ SECRET_KEY = os.environ.get('SECRET_KEY', 'echo_sheet_secret_key')
 DEBUG = os.environ.get('DEBUG', 'True').lower() == 'true'
 HOST = os.environ.get('HOST', '0.0.0.0')
 PORT = int(os.environ.get('PORT', 5000))
+GUNICORN_THREADS = int(os.environ.get('GUNICORN_THREADS', 4))  # Request threads per worker process
 
 # Database Configuration
 DATABASE_PATH = os.environ.get('DATABASE_PATH', 'db.sqlite')
+DB_POOL_WORKERS = int(os.environ.get('DB_POOL_WORKERS', 8))  # Threads for database work of async views
+
+# AutoFill Configuration
+AUTOFILL_CACHE_SIZE = int(os.environ.get('AUTOFILL_CACHE_SIZE', 256))
+
+# Recommendation Configuration
+RECOMMENDATION_CACHE_SIZE = int(os.environ.get('RECOMMENDATION_CACHE_SIZE', 1024))
+RECOMMENDATION_WORKERS = int(os.environ.get('RECOMMENDATION_WORKERS', 2))
+RECOMMENDATION_QUEUE_SIZE = 64  # Precompute jobs beyond this are dropped
+
+# Chat Backend ('canned' or 'llm' for an OpenAI-compatible server on localhost)
+CHAT_BACKEND = os.environ.get('CHAT_BACKEND', 'canned')
+LLM_URL = os.environ.get('LLM_URL', 'http://127.0.0.1:8080/v1/chat/completions')
+LLM_MODEL = os.environ.get('LLM_MODEL', 'local')
+LLM_TIMEOUT = float(os.environ.get('LLM_TIMEOUT', 20))
+LLM_WORKERS = int(os.environ.get('LLM_WORKERS', 2))
+LLM_QUEUE_SIZE = int(os.environ.get('LLM_QUEUE_SIZE', 8))  # Requests beyond workers + queue get a 429
+CHAT_REPLY_WORKERS = int(os.environ.get('CHAT_REPLY_WORKERS', 4))  # Threads for in-process replies of async views
+
+# Chat Response Cache (only used by backends whose replies are expensive, like 'llm')
+CHAT_CACHE_SIZE = int(os.environ.get('CHAT_CACHE_SIZE', 512))
+CHAT_CACHE_TTL = int(os.environ.get('CHAT_CACHE_TTL', 3600))  # Seconds
+CHAT_CACHE_VARIETY = int(os.environ.get('CHAT_CACHE_VARIETY', 1))  # Distinct replies kept per prompt
+
+# Chat Memory (messages beyond the window are folded into a rolling summary every interval messages)
+CHAT_CONTEXT_WINDOW = int(os.environ.get('CHAT_CONTEXT_WINDOW', 20))
+CHAT_SUMMARY_INTERVAL = int(os.environ.get('CHAT_SUMMARY_INTERVAL', 10))
+CHAT_PAGE_SIZE = 30  # Messages per history page on the chat screen
+CHAT_PAGE_MAX = 200
+CHAT_POLL_MAX_WAIT = 20  # Longest long-poll for new messages, in seconds
+# Long-polls waiting at once per worker, kept below its threads so other requests are still served;
+# polls beyond this get a 429
+CHAT_POLL_MAX_WAITERS = int(os.environ.get('CHAT_POLL_MAX_WAITERS', max(1, GUNICORN_THREADS - 1)))
+CHAT_POLL_RETRY_AFTER = 5  # Seconds a poll over the cap is asked to wait
+
+# Chat Recall (BM25 indexes over past turns, kept for the most recently active characters)
+CHAT_RECALL_CHARACTERS = int(os.environ.get('CHAT_RECALL_CHARACTERS', 64))
+CHAT_RECALL_RESULTS = 3  # Past turns given to context-aware backends
+CHAT_RECALL_MIN_SCORE = 1.5
+CHAT_RECALL_SYNC_INTERVAL = 1.0  # Seconds between reads of turns recorded by other workers
+
+# Rate Limiting and Admission Control for chat and autofill
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '1') == '1'
+RATE_LIMIT_STORE = os.environ.get('RATE_LIMIT_STORE', 'memory')  # 'memory' per process, 'sqlite' shared by workers
+RATE_LIMIT_TRUST_PROXY = os.environ.get('RATE_LIMIT_TRUST_PROXY', '0') == '1'  # Use X-Forwarded-For as the client
+CHAT_RATE_PER_MINUTE = float(os.environ.get('CHAT_RATE_PER_MINUTE', 20))  # Per client
+CHAT_BURST = int(os.environ.get('CHAT_BURST', 10))
+CHARACTER_CHAT_RATE_PER_MINUTE = float(os.environ.get('CHARACTER_CHAT_RATE_PER_MINUTE', 40))  # Per character, all clients
+CHARACTER_CHAT_BURST = int(os.environ.get('CHARACTER_CHAT_BURST', 20))
+AUTOFILL_RATE_PER_MINUTE = float(os.environ.get('AUTOFILL_RATE_PER_MINUTE', 60))
+AUTOFILL_BURST = int(os.environ.get('AUTOFILL_BURST', 20))
+CHAT_MAX_IN_FLIGHT = int(os.environ.get('CHAT_MAX_IN_FLIGHT', 8))  # Requests beyond this are shed with a 429
+AUTOFILL_MAX_IN_FLIGHT = int(os.environ.get('AUTOFILL_MAX_IN_FLIGHT', 8))
+
+# Production Server (server.py / gunicorn.conf.py)
+WARMUP_CHARACTERS = int(os.environ.get('WARMUP_CHARACTERS', 50))  # Recent characters whose recommendations are precomputed
+IMPORT_TIME_BUDGET_MS = float(os.environ.get('IMPORT_TIME_BUDGET_MS', 400))  # Cold import of app.py, checked by the tests
+
+# Metrics (Prometheus text format on /metrics, per worker process)
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True').lower() == 'true'
+
+# Request Profiling (cProfile output written to PROFILE_DIR, see utils/profiler.py)
+PROFILE_SECRET = os.environ.get('PROFILE_SECRET', '')  # Requests sending it in X-Profile or ?profile= are profiled
+PROFILE_ALL_REQUESTS = os.environ.get('PROFILE_ALL_REQUESTS', 'False').lower() == 'true'
+PROFILE_SAMPLE_EVERY = int(os.environ.get('PROFILE_SAMPLE_EVERY', 0))  # Profile 1 in N requests, 0 = off
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join('logs', 'profiles'))
+
+# NPC Batch Generation
+MAX_NPC_BATCH = int(os.environ.get('MAX_NPC_BATCH', 5000))
+NPC_CHUNK_SIZE = 100  # NPCs generated per pool task
+NPC_POOL_THRESHOLD = 200  # Smaller batches are generated in-process
+NPC_POOL_WORKERS = int(os.environ.get('NPC_POOL_WORKERS', 0))  # 0 = one per CPU
 
 # Application Constants
 MAX_LEVEL = 20
@@ -137,6 +210,28 @@ SAVING_THROW_PROFICIENCIES = {
     'Barbarian': ['Strength', 'Constitution']
 }
 
+# Ability used by each skill
+SKILL_ATTRIBUTES = {
+    'Acrobatics': 'DEX',
+    'Animal Handling': 'WIS',
+    'Arcana': 'INT',
+    'Athletics': 'STR',
+    'Deception': 'CHA',
+    'History': 'INT',
+    'Insight': 'WIS',
+    'Intimidation': 'CHA',
+    'Investigation': 'INT',
+    'Medicine': 'WIS',
+    'Nature': 'INT',
+    'Perception': 'WIS',
+    'Performance': 'CHA',
+    'Persuasion': 'CHA',
+    'Religion': 'INT',
+    'Sleight of Hand': 'DEX',
+    'Stealth': 'DEX',
+    'Survival': 'WIS'
+}
+
 # Combat Roles by Class
 COMBAT_ROLES = {
     'Fighter': 'Frontline Defender',
@@ -0,0 +1,21 @@
+import os
+import server
+from config import GUNICORN_THREADS
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+# Threads let long-polls, chat streams and async views share a worker
+worker_class = 'gthread'
+threads = GUNICORN_THREADS
+timeout = 60
+
+# Load and warm the app once in the master; workers inherit it when forked
+preload_app = True
+
+
+def post_fork(arbiter, worker):
+    server.post_fork(worker.pid)
+
+
+def worker_exit(arbiter, worker):
+    server.worker_exit(worker.pid)
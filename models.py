@@ -5,10 +5,12 @@ from typing import Dict, List, Optional
 from config import (
     MAX_LEVEL, MIN_LEVEL, MAX_ATTRIBUTE_POINTS, MIN_ATTRIBUTE_VALUE, 
     MAX_ATTRIBUTE_VALUE, POINT_BUY_COSTS, XP_THRESHOLDS, 
-    CURRENCY_VALUES, DEFAULT_ITEM_WEIGHTS, HIT_DICE_BY_CLASS,
+    DEFAULT_ITEM_WEIGHTS, HIT_DICE_BY_CLASS,
     BASE_HP_BY_CLASS, MOVEMENT_SPEED_BY_RACE, SPELLCASTING_ABILITIES,
-    SAVING_THROW_PROFICIENCIES, COMBAT_ROLES
+    SAVING_THROW_PROFICIENCIES, COMBAT_ROLES, CLASS_SKILL_CHOICES, BACKGROUND_SKILL_CHOICES,
+    SKILL_ATTRIBUTES
 )
+from utils.currency_ledger import currency_to_copper, format_copper
 
 
 @dataclass
@@ -62,6 +64,7 @@ class Character:
     item_weights: Dict[str, float] = field(default_factory=dict)  # Custom weights for items
     history_log: List[str] = field(default_factory=list)
     chat_history: List[Dict[str, str]] = field(default_factory=list)
+    persona_profile: Dict = field(default_factory=dict)  # Chat data precomputed at save time (utils/persona_profile.py)
     available_attribute_points: int = 27  # Point buy system
     available_skill_choices: int = 0  # Based on class and background
     
@@ -80,29 +83,7 @@ class Character:
         if skill not in self.skills:
             return 0
         
-        # Skill to attribute mapping
-        skill_attributes = {
-            'Acrobatics': 'DEX',
-            'Animal Handling': 'WIS',
-            'Arcana': 'INT',
-            'Athletics': 'STR',
-            'Deception': 'CHA',
-            'History': 'INT',
-            'Insight': 'WIS',
-            'Intimidation': 'CHA',
-            'Investigation': 'INT',
-            'Medicine': 'WIS',
-            'Nature': 'INT',
-            'Perception': 'WIS',
-            'Performance': 'CHA',
-            'Persuasion': 'CHA',
-            'Religion': 'INT',
-            'Sleight of Hand': 'DEX',
-            'Stealth': 'DEX',
-            'Survival': 'WIS'
-        }
-        
-        attribute = skill_attributes.get(skill, 'STR')
+        attribute = SKILL_ATTRIBUTES.get(skill, 'STR')
         modifier = self.get_attribute_modifier(attribute)
         proficiency = self.get_proficiency_bonus() if skill in self.skills else 0
         
@@ -156,21 +137,21 @@ class Character:
         if not self.char_class:
             return 0
         
-        # Class skill choices
-        class_choices = {
-            'Fighter': 2, 'Wizard': 2, 'Cleric': 2, 'Rogue': 4,
-            'Ranger': 3, 'Paladin': 2, 'Bard': 3, 'Sorcerer': 2,
-            'Warlock': 2, 'Monk': 2, 'Druid': 2, 'Barbarian': 2
-        }
-        
-        base_choices = class_choices.get(self.char_class, 0)
-        background_choices = 2 if self.background else 0
-        
-        total_choices = base_choices + background_choices
+        total_choices = self.get_total_skill_choices()
         used_choices = len(self.skills)
         
         return max(0, total_choices - used_choices)
     
+    def get_total_skill_choices(self) -> int:
+        """Get the number of skills granted by class and background"""
+        if not self.char_class:
+            return 0
+        
+        base_choices = CLASS_SKILL_CHOICES.get(self.char_class, 0)
+        background_choices = BACKGROUND_SKILL_CHOICES if self.background else 0
+        
+        return base_choices + background_choices
+    
     def add_to_history(self, entry: str):
         """Agregar entrada al historial del personaje"""
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M")
@@ -216,7 +197,8 @@ class Character:
             'items': self.items,
             'item_weights': self.item_weights,
             'history_log': self.history_log,
-            'chat_history': self.chat_history
+            'chat_history': self.chat_history,
+            'persona_profile': self.persona_profile
         }
     
     @classmethod
@@ -260,7 +242,8 @@ class Character:
             items=data.get('items', []),
             item_weights=data.get('item_weights', {}),
             history_log=data.get('history_log', []),
-            chat_history=data.get('chat_history', [])
+            chat_history=data.get('chat_history', []),
+            persona_profile=data.get('persona_profile', {})
         )
     
     def get_spellcasting_ability(self) -> str:
@@ -451,47 +434,15 @@ class Character:
     
     def get_total_currency_value(self) -> int:
         """Get total currency value in copper pieces"""
-        total_cp = 0
-        
-        for currency_type, amount in self.currency.items():
-            if currency_type in CURRENCY_VALUES:
-                total_cp += amount * CURRENCY_VALUES[currency_type]
-        
-        return total_cp
+        return currency_to_copper(self.currency)
     
     def format_currency(self) -> str:
         """Format currency for display"""
         if not self.currency:
             return "0 cp"
         
-        # Convert everything to copper first
-        total_cp = self.get_total_currency_value()
-        
-        # Convert back to highest denominations
-        pp = total_cp // 1000
-        total_cp %= 1000
-        gp = total_cp // 100
-        total_cp %= 100
-        ep = total_cp // 50
-        total_cp %= 50
-        sp = total_cp // 10
-        total_cp %= 10
-        cp = total_cp
-        
-        # Build formatted string
-        parts = []
-        if pp > 0:
-            parts.append(f"{pp} pp")
-        if gp > 0:
-            parts.append(f"{gp} gp")
-        if ep > 0:
-            parts.append(f"{ep} ep")
-        if sp > 0:
-            parts.append(f"{sp} sp")
-        if cp > 0:
-            parts.append(f"{cp} cp")
-        
-        return ", ".join(parts) if parts else "0 cp"
+        # Convert to copper and back to the highest denominations
+        return format_copper(self.get_total_currency_value())
     
     def get_estimated_weight(self) -> float:
         """Estimate total weight of items (simplified calculation)"""
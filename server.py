@@ -0,0 +1,125 @@
+"""
+Production server entry point
+Builds and warms the app once in the gunicorn master (preload), so forked workers start with
+catalogs loaded, templates compiled and caches filled. Run with:
+
+    gunicorn -c gunicorn.conf.py "server:create_app()"
+"""
+
+import random
+import sys
+import time
+from typing import Dict, Optional
+from config import AVAILABLE_CLASSES, AVAILABLE_BACKGROUNDS, WARMUP_CHARACTERS
+from utils.database import connect
+from logging_config import get_logger
+
+# Configure logging
+logger = get_logger(__name__)
+
+
+def warmup(app_module, app) -> dict:
+    """Fill the caches and compile what the first requests would otherwise pay for
+
+    Only runs synchronous code: worker threads started here would not survive the fork.
+    """
+    stats = {}
+    services = app_module.get_services(app)
+
+    # Create and migrate the database before the first request would
+    start = time.perf_counter()
+    services.database()
+    stats['database_ms'] = round((time.perf_counter() - start) * 1000, 2)
+
+    # Engines are built on first use; build them here so workers inherit them ready (except the
+    # recommendation worker, whose threads each process starts for itself)
+    start = time.perf_counter()
+    for engine in (app_module.get_autofill, app_module.get_recommender, app_module.get_spell_manager,
+                   app_module.get_party_analyzer):
+        engine()
+    for part in ('chat_engine', 'creation_pipeline', 'client_rate_limits', 'character_rate_limit', 'admission_gates'):
+        getattr(services, part)
+    stats['engines_ms'] = round((time.perf_counter() - start) * 1000, 2)
+
+    # Jinja compiles templates on first render
+    start = time.perf_counter()
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    stats['templates_ms'] = round((time.perf_counter() - start) * 1000, 2)
+
+    # Recommendations of the most recently created characters
+    start = time.perf_counter()
+    conn = connect(services.database())
+    try:
+        rows = conn.execute('SELECT * FROM characters ORDER BY id DESC LIMIT ?', (WARMUP_CHARACTERS,)).fetchall()
+    finally:
+        conn.close()
+    for row in rows:
+        try:
+            app_module.recommender.get_recommendations(app_module.row_to_character(row))
+        except Exception as e:
+            logger.warning(f"Skipping recommendation warmup for character {row[0]}: {e}")
+    stats['recommendations'] = len(rows)
+    stats['recommendations_ms'] = round((time.perf_counter() - start) * 1000, 2)
+
+    # One autofill per class exercises the class, background and spell tables
+    start = time.perf_counter()
+    for char_class in AVAILABLE_CLASSES:
+        app_module.autofill.get_suggestions(char_class, AVAILABLE_BACKGROUNDS[0])
+    stats['autofill_ms'] = round((time.perf_counter() - start) * 1000, 2)
+
+    # A request through the full stack (routing, DB, template rendering)
+    start = time.perf_counter()
+    with app.test_client() as client:
+        client.get('/')
+    stats['index_ms'] = round((time.perf_counter() - start) * 1000, 2)
+
+    return stats
+
+
+def create_app(config: Optional[Dict] = None):
+    """Build the app, warm it up and mark it ready
+
+    Without a config this is the module-level app of app.py; with one, a new app built from it.
+    """
+    start = time.perf_counter()
+    import app as app_module
+
+    app = app_module.create_app(config) if config else app_module.app
+    stats = warmup(app_module, app)
+    stats['total_ms'] = round((time.perf_counter() - start) * 1000, 2)
+    app.config['WARMUP_STATS'] = stats
+    app.config['READY'] = True
+    logger.info(f"Warmup finished: {stats}")
+    return app
+
+
+def post_fork(worker_pid: int):
+    """Reset per-process state in a freshly forked worker
+
+    Database connections are opened per call, so none are inherited from the master. Random
+    generators are, though: without reseeding every worker would roll the same dice.
+    """
+    import app as app_module
+
+    random.seed()
+    app_module.autofill.rng.seed()
+
+    # Make sure this process can reach the database before it takes traffic
+    conn = connect(app_module.app.config['DATABASE'])
+    try:
+        conn.execute('SELECT 1')
+    finally:
+        conn.close()
+    logger.info(f"Worker {worker_pid} ready")
+
+
+def worker_exit(worker_pid: int):
+    """Stop the thread pools of a worker that is shutting down, letting queued work finish"""
+    from utils.db_pool import shutdown_db_pool
+
+    shutdown_db_pool()
+    # Chat backends are imported on first use; nothing to stop if this worker never loaded them
+    if 'utils.chat_backends' in sys.modules:
+        sys.modules['utils.chat_backends'].shutdown_reply_pool()
+    logger.info(f"Worker {worker_pid} stopped")
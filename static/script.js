@@ -1362,6 +1362,7 @@ function initChat() {
         
         // Agregar mensaje del usuario
         addMessage('Tú', message, 'user');
+        chatSync.pending.push(message);
         messageInput.value = '';
         
         // Enviar mensaje al servidor
@@ -1376,10 +1377,130 @@ function initChat() {
     // Observar cambios en los mensajes para auto-scroll
     const observer = new MutationObserver(scrollToBottom);
     observer.observe(chatMessages, { childList: true });
+    
+    // Cargar la última página del historial y las anteriores al subir
+    initChatHistory(chatMessages, scrollToBottom);
 }
 
-function addMessage(sender, text, type = 'character') {
-    const chatMessages = document.getElementById('chat-messages');
+// Messages this page already shows, so polled updates only add other players' messages
+const chatSync = { lastSeq: 0, seen: new Set(), pending: [] };
+
+function confirmSentMessage(message, seq) {
+    const index = chatSync.pending.indexOf(message);
+    if (index !== -1) chatSync.pending.splice(index, 1);
+    if (seq) chatSync.seen.add(seq);
+}
+
+// Long-poll for messages sent from other windows
+// Pause before polling again after an empty answer, so a poll that returns at once can't loop
+const CHAT_POLL_IDLE_DELAY = 2000;
+
+function pollChat(characterId) {
+    fetch(`/api/character/${characterId}/chat/since?seq=${chatSync.lastSeq}&wait=20`)
+        .then(response => {
+            if (response.status === 404) throw new Error('Character not found');
+            if (response.status === 429) {
+                // Too many polls waiting on the server: come back when it says to
+                const retryAfter = parseInt(response.headers.get('Retry-After'), 10) || 5;
+                setTimeout(() => pollChat(characterId), retryAfter * 1000);
+                return null;
+            }
+            return response.json();
+        })
+        .then(data => {
+            if (data === null) return;
+            if (!data.success) throw new Error(data.error);
+            
+            data.messages.forEach(entry => {
+                chatSync.lastSeq = Math.max(chatSync.lastSeq, entry.seq);
+                if (chatSync.seen.has(entry.seq)) return;
+                chatSync.seen.add(entry.seq);
+                
+                // Our own message whose reply is still on its way
+                const pendingIndex = chatSync.pending.indexOf(entry.user);
+                if (pendingIndex !== -1) {
+                    chatSync.pending.splice(pendingIndex, 1);
+                    return;
+                }
+                addMessage('Tú', entry.user, 'user');
+                addMessage(getChatCharacterName(), entry.character, 'character');
+            });
+            if (data.messages.length) {
+                pollChat(characterId);
+            } else {
+                setTimeout(() => pollChat(characterId), CHAT_POLL_IDLE_DELAY);
+            }
+        })
+        .catch(error => {
+            console.error('Error polling chat:', error);
+            if (error.message !== 'Character not found') {
+                setTimeout(() => pollChat(characterId), 5000);
+            }
+        });
+}
+
+function initChatHistory(chatMessages, scrollToBottom) {
+    const history = document.getElementById('chat-history');
+    if (!history) return;
+    
+    const characterId = chatMessages.dataset.characterId;
+    let before = null;
+    let hasMore = true;
+    let loading = false;
+    
+    function loadPage(initial) {
+        if (loading || !hasMore) return;
+        loading = true;
+        
+        const params = new URLSearchParams();
+        if (before !== null) params.set('before', before);
+        
+        fetch(`/api/character/${characterId}/chat?${params}`)
+            .then(response => response.json())
+            .then(data => {
+                if (!data.success) throw new Error(data.error);
+                
+                const fragment = document.createDocumentFragment();
+                data.messages.forEach(entry => {
+                    fragment.appendChild(createMessageElement('Tú', entry.user, 'user'));
+                    fragment.appendChild(createMessageElement(getChatCharacterName(), entry.character, 'character'));
+                });
+                
+                // Keep the visible messages in place while older ones are added above them
+                const previousHeight = chatMessages.scrollHeight;
+                const previousTop = chatMessages.scrollTop;
+                history.insertBefore(fragment, history.firstChild);
+                if (initial) {
+                    scrollToBottom();
+                } else {
+                    chatMessages.scrollTop = previousTop + chatMessages.scrollHeight - previousHeight;
+                }
+                
+                hasMore = data.has_more;
+                before = data.next_before;
+                
+                if (initial) {
+                    data.messages.forEach(entry => chatSync.seen.add(entry.seq));
+                    chatSync.lastSeq = data.messages.length ? data.messages[data.messages.length - 1].seq : 0;
+                    pollChat(characterId);
+                }
+            })
+            .catch(error => {
+                console.error('Error loading chat history:', error);
+                hasMore = false;
+            })
+            .finally(() => {
+                loading = false;
+            });
+    }
+    
+    chatMessages.addEventListener('scroll', () => {
+        if (chatMessages.scrollTop < 80) loadPage(false);
+    });
+    loadPage(true);
+}
+
+function createMessageElement(sender, text, type = 'character') {
     const messageDiv = document.createElement('div');
     messageDiv.className = `message ${type}-message`;
     
@@ -1389,17 +1510,29 @@ function addMessage(sender, text, type = 'character') {
     messageDiv.innerHTML = `
         <div class="message-avatar ${avatarClass}">${avatar}</div>
         <div class="message-content">
-            <div class="message-sender">${sender}</div>
-            <div class="message-text">${text}</div>
+            <div class="message-sender"></div>
+            <div class="message-text"></div>
         </div>
     `;
-    
-    chatMessages.appendChild(messageDiv);
+    messageDiv.querySelector('.message-sender').textContent = sender;
+    messageDiv.querySelector('.message-text').textContent = text;
+    return messageDiv;
+}
+
+function addMessage(sender, text, type = 'character') {
+    const chatMessages = document.getElementById('chat-messages');
+    chatMessages.appendChild(createMessageElement(sender, text, type));
 }
 
 function sendMessage(message) {
     const characterId = window.location.pathname.split('/')[2];
     
+    // Stream the reply when the browser supports reading response bodies
+    if (window.ReadableStream && window.TextDecoder) {
+        streamMessage(characterId, message);
+        return;
+    }
+    
     fetch(`/character/${characterId}/chat`, {
         method: 'POST',
         headers: {
@@ -1410,11 +1543,87 @@ function sendMessage(message) {
     .then(response => response.json())
     .then(data => {
         // Agregar respuesta del personaje
-        const characterName = document.querySelector('.character-info h2').textContent.replace('💬 Conversando con ', '');
-        addMessage(characterName, data.response, 'character');
+        confirmSentMessage(message, data.seq);
+        addMessage(getChatCharacterName(), data.response, 'character');
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        confirmSentMessage(message, null);
+        addMessage('Sistema', 'Lo siento, hubo un error al procesar tu mensaje.', 'character');
+    });
+}
+
+function getChatCharacterName() {
+    return document.getElementById('chat-messages').dataset.characterName;
+}
+
+function streamMessage(characterId, message) {
+    let messageText = null;
+    let received = '';
+    
+    // Handle one Server-Sent Event ("event: ...\ndata: ...")
+    function handleEvent(rawEvent) {
+        let eventName = 'message';
+        let data = '';
+        rawEvent.split('\n').forEach(line => {
+            if (line.startsWith('event: ')) eventName = line.slice(7);
+            else if (line.startsWith('data: ')) data += line.slice(6);
+        });
+        if (!data) return;
+        
+        const payload = JSON.parse(data);
+        if (eventName === 'chunk') {
+            if (!messageText) {
+                addMessage(getChatCharacterName(), '', 'character');
+                const messages = document.querySelectorAll('#chat-messages .message-text');
+                messageText = messages[messages.length - 1];
+            }
+            received += payload.text;
+            messageText.textContent = received;
+        } else if (eventName === 'done') {
+            confirmSentMessage(message, payload.seq);
+        } else if (eventName === 'error') {
+            throw new Error(payload.error);
+        }
+    }
+    
+    fetch(`/character/${characterId}/chat/stream`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream'
+        },
+        body: JSON.stringify({ message: message })
+    })
+    .then(response => {
+        if (response.status === 429) {
+            confirmSentMessage(message, null);
+            addMessage('Sistema', 'El personaje está ocupado. Intenta de nuevo en unos segundos.', 'character');
+            return;
+        }
+        if (!response.ok || !response.body) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+        
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        
+        function read() {
+            return reader.read().then(({ done, value }) => {
+                if (done) return;
+                buffer += decoder.decode(value, { stream: true });
+                const events = buffer.split('\n\n');
+                buffer = events.pop();
+                events.forEach(handleEvent);
+                return read();
+            });
+        }
+        return read();
     })
     .catch(error => {
         console.error('Error:', error);
+        confirmSentMessage(message, null);
         addMessage('Sistema', 'Lo siento, hubo un error al procesar tu mensaje.', 'character');
     });
 }
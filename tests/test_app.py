@@ -1,8 +1,35 @@
+import asyncio
 import pytest
 import json
 import tempfile
 import os
-from app import app
+import pstats
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import app as app_module
+import server
+from config import IMPORT_TIME_BUDGET_MS
+from utils.autofill import AutoFill
+from utils.recommender import Recommender
+from utils.recommendation_rules import RuleIndex
+from utils.recommendation_worker import RecommendationWorker
+from utils.chat_engine import ChatEngine, MESSAGE_CATEGORIES, CONTEXT_TOPICS
+from utils.chat_backends import LLMBackend, CannedBackend, BackendBusy
+from utils.chat_memory import ChatMemory, init_chat_schema
+from utils.character_store import fetch_character
+from utils.import_time import measure_imports
+from utils.metrics import Histogram
+from utils.persona_profile import PERSONA_PROFILE_VERSION, build_persona_profile
+from utils.rate_limiter import (
+    RateLimited, TokenBucketLimiter, AdmissionGate, MemoryBucketStore, SQLiteBucketStore
+)
+from models import Character
+from utils.currency_ledger import (
+    CurrencyLedger, LedgerError, init_ledger_schema, copper_to_currency, currency_to_copper, format_copper,
+    pay_coins
+)
 
 @pytest.fixture
 def client():
@@ -10,8 +37,7 @@ def client():
     # Create a temporary database for testing
     db_fd, db_path = tempfile.mkstemp()
     
-    app.config['TESTING'] = True
-    app.config['DATABASE'] = db_path
+    app = app_module.create_app({'TESTING': True, 'DATABASE': db_path})
     
     with app.test_client() as client:
         yield client
@@ -81,5 +107,718 @@ def test_spell_validation(client):
     assert data['success'] == True
     assert 'validation' in data
 
+@pytest.fixture
+def ledger():
+    """Create a currency ledger backed by a temporary database"""
+    db_fd, db_path = tempfile.mkstemp()
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE characters (id INTEGER PRIMARY KEY, currency TEXT)')
+    conn.executemany('INSERT INTO characters (id, currency) VALUES (?, ?)',
+                     [(1, json.dumps({'gp': 10})), (2, json.dumps({'sp': 5}))])
+    init_ledger_schema(conn.cursor())
+    conn.commit()
+    conn.close()
+    
+    yield CurrencyLedger(db_path)
+    
+    os.close(db_fd)
+    os.unlink(db_path)
+
+def test_currency_ledger_transactions(ledger):
+    """Test ledger balances, transfers and party totals"""
+    assert ledger.get_balance(1) == 1000
+    assert ledger.record(1, 250, 'loot', 'Goblin hoard') == 1250
+    assert ledger.record(1, -1100, 'purchase', 'Chain mail') == 150
+    
+    with pytest.raises(LedgerError):
+        ledger.record(1, -1000, 'purchase', 'Plate armor')
+    
+    balances = ledger.transfer(1, 2, 100)
+    assert balances == {'from_balance': 50, 'to_balance': 150}
+    
+    totals = ledger.get_party_totals([1, 2])
+    assert totals['total_cp'] == 200
+    assert totals['by_source']['transfer']['total_cp'] == 0
+    assert [t['source'] for t in ledger.get_transactions(1)] == ['transfer', 'purchase', 'loot', 'opening']
+    
+    # The sheet keeps its coins; only the coins spent are broken into change
+    conn = sqlite3.connect(ledger.db_path)
+    assert json.loads(conn.execute('SELECT currency FROM characters WHERE id = 1').fetchone()[0]) == \
+        {'pp': 0, 'gp': 0, 'ep': 0, 'sp': 5, 'cp': 0}
+    conn.close()
+    ledger.record(2, 850, 'loot')
+    ledger.record(2, -1, 'purchase', 'Candle')
+    conn = sqlite3.connect(ledger.db_path)
+    assert json.loads(conn.execute('SELECT currency FROM characters WHERE id = 2').fetchone()[0]) == \
+        {'pp': 0, 'gp': 9, 'ep': 0, 'sp': 9, 'cp': 9}
+    
+    # Reading a balance doesn't wait for a writer holding the lock
+    conn.execute('BEGIN IMMEDIATE')
+    assert ledger.get_balance(2) == 999
+    conn.rollback()
+    conn.close()
+
+def test_currency_formatting():
+    """Test copper conversion to denominations"""
+    assert copper_to_currency(1567) == {'pp': 1, 'gp': 5, 'ep': 1, 'sp': 1, 'cp': 7}
+    assert pay_coins({'gp': 10}, -1) == {'pp': 0, 'gp': 9, 'ep': 0, 'sp': 9, 'cp': 9}
+    assert pay_coins({'gp': 1, 'sp': 5}, -120) == {'pp': 0, 'gp': 0, 'ep': 0, 'sp': 3, 'cp': 0}
+    assert pay_coins({'ep': 2}, 1234) == {'pp': 0, 'gp': 12, 'ep': 2, 'sp': 3, 'cp': 4}
+    assert format_copper(0) == '0 cp'
+    assert format_copper(1210) == '1 pp, 2 gp, 1 sp'
+
+def test_inventory_and_pack_currency_in_ledger(client):
+    """Test that inventory edits and equipment packs keep the currency column and the ledger in step"""
+    response = client.post('/api/characters', json={
+        'name': 'Purse', 'race': 'Dwarf', 'char_class': 'Fighter', 'background': 'Soldier'
+    })
+    character_id = response.get_json()['character_id']
+    
+    response = client.post(f'/api/character/{character_id}/inventory', json={
+        'items': ['Rope'], 'item_weights': {'Rope': 10}, 'currency': {'gp': 5, 'sp': 3}
+    })
+    assert response.status_code == 200
+    response = client.post(f'/api/character/{character_id}/apply-pack', json={'pack_name': "Burglar's Pack"})
+    pack_currency = response.get_json()['currency_added']
+    
+    data = client.get(f'/api/character/{character_id}/currency').get_json()
+    assert data['balance_cp'] == 530 + currency_to_copper(pack_currency)
+    assert [t['source'] for t in data['transactions']][:2] == ['pack', 'adjustment']
+    character = fetch_character(app_module.get_services(client.application).database(), character_id)
+    assert currency_to_copper(character.currency) == data['balance_cp']
+    assert 'Rope' in character.items
+    
+    assert client.post('/api/character/999999/inventory', json={'currency': {'gp': 1}}).status_code == 404
+    client.post(f'/character/{character_id}/delete')
+
+def test_autofill_seeded_suggestions_are_reproducible():
+    """Test that seeded autofill is deterministic and memoized"""
+    autofill = AutoFill()
+    first = autofill.get_suggestions('Rogue', 'Criminal', 'Elf', 'scout', seed=42)
+    second = autofill.get_suggestions('Rogue', 'Criminal', 'Elf', 'scout', seed=42)
+    
+    assert first == second
+    assert autofill.suggestions_cache.stats()['hits'] == 1
+    
+    # Mutating a result must not leak into the cache
+    first['skills'].append('Arcana')
+    assert autofill.get_suggestions('Rogue', 'Criminal', 'Elf', 'scout', seed=42) == second
+    
+    assert AutoFill(seed=7).roll_attributes() == AutoFill(seed=7).roll_attributes()
+
+def test_api_autofill_seed(client):
+    """Test that the autofill API returns the same result for the same seed"""
+    payload = {'char_class': 'Fighter', 'background': 'Soldier', 'race': 'Human', 'seed': 3}
+    first = client.post('/api/autofill', json=payload).get_json()
+    second = client.post('/api/autofill', json=payload).get_json()
+    
+    assert first['success'] is True
+    assert first == second
+
+def test_api_point_buy_arrays(client):
+    """Test the top point buy arrays endpoint"""
+    response = client.get('/api/point-buy/Wizard?race=Gnome&limit=3')
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    
+    assert data['success'] == True
+    assert len(data['arrays']) == 3
+    assert data['total_valid_arrays'] > 0
+    for entry in data['arrays']:
+        validation = Character(attributes=entry['attributes']).validate_attributes()
+        assert validation['valid'] and validation['total_cost'] == 27
+        assert entry['attributes_with_race']['INT'] == entry['attributes']['INT'] + 2
+    
+    best = data['arrays'][0]['attributes']
+    assert best['INT'] == max(best.values())
+
+def test_api_generate_characters(client):
+    """Test batch NPC generation"""
+    response = client.post('/api/characters/generate?count=3',
+                           data=json.dumps({'char_class': 'Cleric', 'seed': 11}),
+                           content_type='application/json')
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    
+    assert data['success'] == True
+    assert data['count'] == 3
+    assert len(set(data['character_ids'])) == 3
+    
+    page = client.get(f"/character/{data['character_ids'][-1]}")
+    assert page.status_code == 200
+    assert b'Cleric' in page.data
+    
+    response = client.post('/api/characters/generate?count=0')
+    assert response.status_code == 400
+    for options in ({'level': 'high'}, {'char_class': 'Necromancer'}, {'race': 'Dragon'}):
+        assert client.post('/api/characters/generate?count=1', json=options).status_code == 400
+
+def test_api_create_character_pipeline(client):
+    """Test the staged creation pipeline through the API route"""
+    character_data = {
+        'name': 'Pipeline Rogue',
+        'race': 'Halfling',
+        'char_class': 'Rogue',
+        'background': 'Urchin',
+        'attributes': {'STR': 8, 'DEX': 15, 'CON': 14, 'INT': 12, 'WIS': 12, 'CHA': 10},
+        'seed': 5
+    }
+    
+    response = client.post('/api/characters', data=json.dumps(character_data), content_type='application/json')
+    assert response.status_code == 201
+    data = json.loads(response.data)
+    
+    assert data['character']['attributes']['DEX'] == 15
+    assert len(data['character']['skills']) > 0
+    assert set(data['timings']) == {'validate', 'fill', 'persist', 'total'}
+    
+    character_data['attributes']['STR'] = 15
+    response = client.post('/api/characters', data=json.dumps(character_data), content_type='application/json')
+    assert response.status_code == 400
+    assert 'Too many attribute points' in json.loads(response.data)['error']
+
+def test_recommendations_cached_by_relevant_fields():
+    """Test that recommendations are reused until a relevant field changes"""
+    recommender = Recommender()
+    character = Character(name='Cached', race='Elf', char_class='Wizard', level=3,
+                          attributes={'INT': 16}, skills=['Arcana'], spells_known=['Shield'])
+    
+    first = recommender.get_recommendations(character)
+    character.personality_traits = 'Curious'  # Irrelevant to recommendations
+    assert recommender.get_recommendations(character) is first
+    
+    character.spells_known.append('Magic Missile')
+    updated = recommender.get_recommendations(character)
+    assert updated is not first
+    assert 'Magic Missile' not in updated['spells']['recommendations']
+    
+    stats = recommender.get_cache_stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 2
+
+def test_recommendation_rule_index():
+    """Test that rules are indexed by level band and evaluated in file order"""
+    rules = RuleIndex({
+        'level_bands': [[1, 4], [5, 20]],
+        'options': {'subclass': {'Fighter': ['Champion', 'Battle Master']}},
+        'rules': [
+            {'category': 'subclass', 'classes': ['Fighter'], 'min_level': 5,
+             'when': [{'attribute': 'STR', 'op': '>', 'other': 'DEX'}], 'recommended': 'Champion', 'reason': 'Strong'},
+            {'category': 'subclass', 'classes': ['*'], 'reason': 'Standard subclass for {char_class}'},
+            {'category': 'spells', 'classes': ['Fighter'], 'min_level': 3, 'spells': ['Shield']},
+            {'category': 'spells', 'classes': ['Fighter'], 'min_level': 7, 'spells': ['Haste']}
+        ]
+    })
+    
+    assert rules.choose('subclass', 'Fighter', 6, {'STR': 16, 'DEX': 10}).recommended == 'Champion'
+    assert rules.choose('subclass', 'Fighter', 3, {'STR': 16, 'DEX': 10}).recommended is None
+    assert rules.choose('subclass', 'Fighter', 6, {'STR': 10, 'DEX': 16}).reason == 'Standard subclass for {char_class}'
+    assert rules.get_spells('Fighter', 2) == []
+    assert rules.get_spells('Fighter', 6) == ['Shield']
+    assert rules.get_spells('Fighter', 7) == ['Shield', 'Haste']
+    assert rules.get_spells('Barbarian', 7) is None
+
+def test_recommendation_worker_precomputes():
+    """Test that submitted characters are served from the cache afterwards"""
+    recommender = Recommender()
+    worker = RecommendationWorker(recommender, max_workers=1, max_queue=4)
+    character = Character(name='Queued', race='Human', char_class='Cleric', level=2)
+    
+    assert worker.submit(character)
+    worker.shutdown()
+    
+    recommendations = worker.get_recommendations(character)
+    assert recommendations == recommender.compute_recommendations(character)
+    assert recommender.get_cache_stats()['hits'] == 1
+    assert worker.stats()['pending'] == 0
+
+def test_party_composition(client):
+    """Test party coverage gaps and suggested additions"""
+    response = client.post('/api/characters', json={
+        'name': 'Party Fighter', 'race': 'Human', 'char_class': 'Fighter', 'background': 'Soldier',
+        'skills': ['Athletics', 'Perception', 'Intimidation', 'Survival']
+    })
+    fighter_id = response.get_json()['character_id']
+    
+    response = client.get(f'/api/party/composition?ids={fighter_id}')
+    data = response.get_json()
+    assert response.status_code == 200
+    assert data['coverage']['combat_roles'] == ['Frontline Defender']
+    assert 'Perception' in data['coverage']['skills']
+    assert 'Medicine' in data['gaps']['skills']
+    assert 'Wisdom' in data['gaps']['saving_throws']
+    assert data['additions']['classes'][0]['gaps_closed'] > 0
+    assert all(spell['school'] in data['gaps']['spell_schools'] for spell in data['additions']['spells'])
+    
+    response = client.get('/api/party/composition?ids=999999')
+    assert response.status_code == 404
+    
+    client.post(f'/character/{fighter_id}/delete')
+
+def test_compiled_classifier_matches_keyword_scans():
+    """Test that the single-pass classifier agrees with scanning categories in priority order"""
+    def scan(message, ranking):
+        for label, keywords in ranking:
+            if any(word in message for word in keywords):
+                return label
+        return 'general'
+    
+    engine = ChatEngine()
+    messages = [
+        'hola amigo', 'háblame de tu magia salvaje', 'un hechizo poderoso', 'this is a test',
+        'cuéntame tu historia', 'tu mayor debilidad en combate', 'qué piensas del ladrón',
+        'nivel de energía', 'sin palabras clave', '', 'goodbye and farewell', 'fuerte como la tierra'
+    ] + engine.suggested_questions
+    
+    for message in messages:
+        message = message.lower()
+        assert engine.scan_message(message) == (scan(message, MESSAGE_CATEGORIES), scan(message, CONTEXT_TOPICS))
+        assert engine.classify_message(message) == scan(message, MESSAGE_CATEGORIES)
+
+def test_chat_stream(client):
+    """Test that the chat stream sends chunks and saves the message afterwards"""
+    response = client.post('/api/characters', json={
+        'name': 'Streamer', 'race': 'Human', 'char_class': 'Bard', 'background': 'Entertainer'
+    })
+    character_id = response.get_json()['character_id']
+    
+    response = client.post(f'/character/{character_id}/chat/stream', json={'message': 'hola'})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    
+    events = [event.split('\n') for event in response.get_data(as_text=True).strip().split('\n\n')]
+    chunks = [json.loads(lines[1][len('data: '):])['text'] for lines in events if lines[0] == 'event: chunk']
+    done = json.loads(events[-1][1][len('data: '):])
+    assert events[-1][0] == 'event: done'
+    assert ''.join(chunks) == done['response']
+    
+    history = app_module.get_services(client.application).chat_engine.memory.get_recent(character_id, 1)
+    assert history[-1]['user'] == 'hola'
+    assert history[-1]['character'] == done['response']
+    
+    assert client.post('/character/999999/chat/stream', json={'message': 'hola'}).status_code == 404
+    client.post(f'/character/{character_id}/delete')
+
+def test_chat_history_pages(client):
+    """Test that chat history is served newest page first and older pages by sequence"""
+    response = client.post('/api/characters', json={
+        'name': 'Pager', 'race': 'Human', 'char_class': 'Wizard', 'background': 'Sage'
+    })
+    character_id = response.get_json()['character_id']
+    for i in range(5):
+        app_module.get_services(client.application).chat_engine.record_exchange(character_id, f'mensaje {i}', f'respuesta {i}')
+    
+    page = client.get(f'/api/character/{character_id}/chat?limit=2').get_json()
+    assert [entry['user'] for entry in page['messages']] == ['mensaje 3', 'mensaje 4']
+    assert page['has_more'] is True
+    
+    page = client.get(f"/api/character/{character_id}/chat?limit=2&before={page['next_before']}").get_json()
+    assert [entry['user'] for entry in page['messages']] == ['mensaje 1', 'mensaje 2']
+    
+    page = client.get(f"/api/character/{character_id}/chat?limit=2&before={page['next_before']}").get_json()
+    assert [entry['user'] for entry in page['messages']] == ['mensaje 0']
+    assert page['has_more'] is False and page['next_before'] is None
+    
+    assert client.get('/api/character/999999/chat').status_code == 404
+    client.post(f'/character/{character_id}/delete')
+
+def test_chat_messages_since(client, monkeypatch):
+    """Test that the sync endpoint returns only new messages and long-polls for the next one"""
+    response = client.post('/api/characters', json={
+        'name': 'Poller', 'race': 'Elf', 'char_class': 'Ranger', 'background': 'Outlander'
+    })
+    character_id = response.get_json()['character_id']
+    seq = client.post(f'/character/{character_id}/chat', json={'message': 'hola'}).get_json()['seq']
+    
+    data = client.get(f'/api/character/{character_id}/chat/since?seq=0').get_json()
+    assert [entry['seq'] for entry in data['messages']] == [seq]
+    assert data['last_seq'] == seq
+    
+    data = client.get(f'/api/character/{character_id}/chat/since?seq={seq}').get_json()
+    assert data['messages'] == [] and data['last_seq'] == seq
+    
+    # A message recorded while the request waits wakes it up before the timeout
+    timer = threading.Timer(0.2, app_module.get_services(client.application).chat_engine.record_exchange, (character_id, 'otro jugador', 'bienvenido'))
+    timer.start()
+    started = time.monotonic()
+    data = client.get(f'/api/character/{character_id}/chat/since?seq={seq}&wait=5').get_json()
+    assert time.monotonic() - started < 2
+    assert [entry['user'] for entry in data['messages']] == ['otro jugador']
+    timer.join()
+    
+    # Once every allowed poll is waiting, further polls are told to come back later
+    monkeypatch.setattr(app_module.get_services(client.application).chat_engine.memory, 'max_waiters', 0)
+    response = client.get(f'/api/character/{character_id}/chat/since?seq={seq + 1}&wait=5')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    assert client.get(f'/api/character/{character_id}/chat/since?seq={seq}').status_code == 200
+    
+    assert client.get('/api/character/999999/chat/since?seq=0').status_code == 404
+    client.post(f'/character/{character_id}/delete')
+
+@pytest.fixture
+def llm_stub():
+    """Local stub of an OpenAI-compatible chat completions server"""
+    class Handler(BaseHTTPRequestHandler):
+        delay = 0
+        
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            time.sleep(Handler.delay)
+            self.send_response(200)
+            if payload.get('stream'):
+                self.send_header('Content-Type', 'text/event-stream')
+                self.end_headers()
+                for token in ['Saludos, ', 'viajero.']:
+                    self.wfile.write(f"data: {json.dumps({'choices': [{'delta': {'content': token}}]})}\n\n".encode())
+                self.wfile.write(b'data: [DONE]\n\n')
+            else:
+                body = json.dumps({'choices': [{'message': {'content': 'Saludos, viajero.'}}]}).encode()
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+        
+        def log_message(self, *args):
+            pass
+    
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, Handler
+    server.shutdown()
+    server.server_close()
+
+def test_llm_backend(llm_stub):
+    """Test LLM replies, streaming, canned fallback and backpressure"""
+    server, handler = llm_stub
+    url = f'http://127.0.0.1:{server.server_port}/v1/chat/completions'
+    character = Character(name='Model', race='Elf', char_class='Bard', personality_tags=['curioso'])
+    
+    backend = LLMBackend(url, 'stub', timeout=2, max_workers=1, max_queue=0)
+    assert backend.generate(character, 'hola') == 'Saludos, viajero.'
+    assert asyncio.run(backend.agenerate(character, 'hola')) == 'Saludos, viajero.'
+    assert list(backend.stream(character, 'hola')) == ['Saludos, ', 'viajero.']
+    messages = backend._messages(character, 'hola', {'summary': 'Earlier conversation: 30 messages.',
+                                                      'recent': [{'user': 'hi', 'character': 'hey'}]})
+    assert 'Earlier conversation' in messages[0]['content']
+    assert [message['role'] for message in messages] == ['system', 'user', 'assistant', 'user']
+    
+    # Every slot taken: reject instead of queueing
+    handler.delay = 0.5
+    worker = threading.Thread(target=backend.generate, args=(character, 'hola'))
+    worker.start()
+    time.sleep(0.1)
+    with pytest.raises(BackendBusy):
+        backend.generate(character, 'hola')
+    worker.join()
+    assert backend.stats()['rejected'] == 1
+    backend.shutdown()
+    
+    # Timeouts and unreachable servers fall back to canned replies
+    engine = ChatEngine(backend=LLMBackend(url, 'stub', timeout=0.1))
+    engine.get_canned_response = lambda character, message: 'canned'
+    assert engine.get_response(character, 'hola') == 'canned'
+    engine.backend.shutdown()
+    engine.backend = LLMBackend('http://127.0.0.1:9/v1/chat/completions', 'stub', timeout=1)
+    assert engine.get_response(character, 'hola') == 'canned'
+    assert ''.join(engine.stream_response(character, 'hola')) == 'canned'
+    engine.backend.shutdown()
+
+def test_persona_profile_saved_with_character(client):
+    """Test that the persona profile is stored at creation, refreshed on save and used for replies"""
+    response = client.post('/api/characters', json={
+        'name': 'Persona', 'race': 'Dwarf', 'char_class': 'Cleric', 'background': 'Acolyte'
+    })
+    character_id = response.get_json()['character_id']
+    profile = fetch_character(client.application.config['DATABASE'], character_id).persona_profile
+    assert profile['version'] == PERSONA_PROFILE_VERSION
+    assert 'Persona' in profile['prompt']
+    
+    client.post(f'/api/character/{character_id}/personality', json={
+        'ideals': 'La verdad ante todo', 'personality_tags': ['terco', 'leal']
+    })
+    character = fetch_character(client.application.config['DATABASE'], character_id)
+    assert character.persona_profile == build_persona_profile(character)
+    assert app_module.get_services(client.application).chat_engine.generate_contextual_response(character, 'tus ideales') == \
+        'Mis ideales son importantes para mí: La verdad ante todo'
+    client.post(f'/character/{character_id}/delete')
+
+def test_async_update_routes(client):
+    """Test that the async update routes save through the database pool"""
+    response = client.post('/api/characters', json={
+        'name': 'Async', 'race': 'Gnome', 'char_class': 'Wizard', 'background': 'Sage'
+    })
+    character_id = response.get_json()['character_id']
+    
+    assert client.post(f'/api/character/{character_id}/hit-points', json={
+        'hit_point_maximum': 14, 'current_hit_points': 9
+    }).get_json()['success']
+    assert client.post(f'/api/character/{character_id}/physical-info', json={'age': '120'}).get_json()['success']
+    character = fetch_character(client.application.config['DATABASE'], character_id)
+    assert (character.hit_point_maximum, character.current_hit_points, character.age) == ('14', '9', '120')
+    
+    assert client.post('/api/character/999999/basic-info', json={'alignment': 'Neutral'}).status_code == 404
+    client.post(f'/character/{character_id}/delete')
+
+def test_server_warmup_and_readiness(client):
+    """Test that the server entry point warms the app up before reporting ready"""
+    assert client.get('/health/live').status_code == 200
+    assert client.get('/health/ready').status_code == 503
+    
+    app = server.create_app({'DATABASE': client.application.config['DATABASE']})
+    response = app.test_client().get('/health/ready')
+    assert response.status_code == 200
+    assert response.get_json()['warmup']['total_ms'] > 0
+
+def test_app_factory_isolated_databases():
+    """Test that apps built with ':memory:' each get a private database used by every view"""
+    apps = [app_module.create_app({'TESTING': True, 'DATABASE': ':memory:'}) for _ in range(2)]
+    assert apps[0].config['DATABASE'] != apps[1].config['DATABASE']
+    
+    client = apps[0].test_client()
+    response = client.post('/api/characters', json={
+        'name': 'Memory', 'race': 'Halfling', 'char_class': 'Rogue', 'background': 'Criminal'
+    })
+    character_id = response.get_json()['character_id']
+    assert client.get(f'/character/{character_id}').status_code == 200
+    assert client.post(f'/character/{character_id}/chat', json={'message': 'hola'}).get_json()['seq']
+    assert client.get(f'/api/character/{character_id}/currency').get_json()['success']
+    
+    assert apps[1].test_client().get(f'/api/character/{character_id}/chat').status_code == 404
+    assert fetch_character(apps[0].config['DATABASE'], character_id).name == 'Memory'
+    assert fetch_character(apps[1].config['DATABASE'], character_id) is None
+
+def test_lazy_startup_and_import_time():
+    """Test that engines and the database are set up on first use and importing the app stays fast"""
+    services = app_module.get_services(app_module.create_app({'DATABASE': ':memory:'}))
+    assert services.built() == []
+    assert services.chat_engine is services.chat_engine
+    assert set(services.built()) == {'database', 'chat_engine'}
+    
+    report = measure_imports('app')
+    assert report['total_ms'] < IMPORT_TIME_BUDGET_MS, report['slowest']
+    assert not {'requests', 'utils.chat_engine', 'utils.recommender', 'utils.npc_generator'} & report['imported']
+
+def test_metrics_endpoint(client):
+    """Test that requests are counted per route with their latency and database work"""
+    histogram = Histogram('test_seconds', 'Test', ('route',), (0.1, 1.0))
+    threads = [threading.Thread(target=histogram.observe, args=(('/',), value)) for value in (0.05, 0.5, 5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert 'test_seconds_bucket{route="/",le="1"} 2' in histogram.render()
+    assert 'test_seconds_count{route="/"} 3' in histogram.render()
+    
+    client.get('/')
+    client.get('/')
+    client.get('/no-such-page')
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    
+    text = response.get_data(as_text=True)
+    worker = f'worker="{os.getpid()}"'
+    assert f'echosheet_http_requests_total{{{worker},route="/",method="GET",status="200"}} 2' in text
+    assert f'echosheet_http_requests_total{{{worker},route="unmatched",method="GET",status="404"}} 1' in text
+    assert f'echosheet_http_request_duration_seconds_count{{{worker},route="/",method="GET"}} 2' in text
+    assert f'echosheet_http_requests_in_flight{{{worker},route="/metrics"}} 1' in text
+    assert f'echosheet_request_db_queries_bucket{{{worker},route="/",le="0"}} 0' in text
+    assert f'echosheet_request_db_seconds_count{{{worker},route="/"}} 2' in text
+
+def test_request_profiling(tmp_path):
+    """Test that requests are profiled when they send the secret and when they are sampled"""
+    app = app_module.create_app({'DATABASE': ':memory:', 'PROFILE_SECRET': 's3cret',
+                                 'PROFILE_DIR': str(tmp_path / 'requested')})
+    client = app.test_client()
+    assert 'X-Profile-File' not in client.get('/', headers={'X-Profile': 'wrong'}).headers
+    assert not (tmp_path / 'requested').exists()
+    
+    response = client.get('/', headers={'X-Profile': 's3cret'})
+    assert response.status_code == 200
+    stats = pstats.Stats(str(tmp_path / 'requested' / response.headers['X-Profile-File']))
+    assert any(function[2] == 'index' for function in stats.stats)
+    assert client.get('/health/live?profile=s3cret').headers['X-Profile-File'].endswith('.pstats')
+    
+    # Async views run in an event loop thread, profiled into the same file
+    response = client.post('/api/autofill', headers={'X-Profile': 's3cret'},
+                           json={'char_class': 'Wizard', 'background': 'Sage'})
+    stats = pstats.Stats(str(tmp_path / 'requested' / response.headers['X-Profile-File']))
+    assert any(function[2] == 'api_autofill' for function in stats.stats)
+    
+    app = app_module.create_app({'DATABASE': ':memory:', 'PROFILE_SAMPLE_EVERY': 2,
+                                 'PROFILE_DIR': str(tmp_path / 'sampled')})
+    client = app.test_client()
+    for _ in range(4):
+        assert 'X-Profile-File' not in client.get('/health/live').headers
+    assert len(list((tmp_path / 'sampled').glob('*.pstats'))) == 2
+    assert len(list((tmp_path / 'sampled').glob('*.txt'))) == 2
+
+def test_rate_limits_and_admission(client, monkeypatch):
+    """Test token buckets, load shedding and the 429 responses of limited routes"""
+    db_fd, db_path = tempfile.mkstemp()
+    for store in (MemoryBucketStore(), SQLiteBucketStore(db_path)):
+        limiter = TokenBucketLimiter(rate=1, burst=2, store=store)
+        limiter.check('client')
+        limiter.check('client')
+        with pytest.raises(RateLimited) as error:
+            limiter.check('client')
+        assert error.value.retry_after == 1
+        limiter.check('other client')
+    
+    # Idle buckets are pruned as buckets are taken
+    store = SQLiteBucketStore(db_path, max_idle=0, prune_every=3)
+    for key in ('a', 'b', 'c'):
+        store.take(key, rate=1, burst=2)
+    conn = sqlite3.connect(db_path)
+    assert conn.execute('SELECT key FROM rate_buckets').fetchall() == [('c',)]
+    conn.close()
+    os.close(db_fd)
+    os.unlink(db_path)
+    
+    gate = AdmissionGate(1)
+    gate.acquire()
+    with pytest.raises(RateLimited):
+        gate.acquire()
+    gate.release()
+    gate.acquire()
+    assert gate.stats() == {'max_in_flight': 1, 'in_flight': 1, 'shed': 1}
+    
+    monkeypatch.setitem(app_module.get_services(client.application).client_rate_limits, 'autofill', TokenBucketLimiter(rate=0.01, burst=1))
+    data = {'char_class': 'Fighter', 'background': 'Soldier', 'race': 'Human'}
+    assert client.post('/api/autofill', json=data).status_code == 200
+    response = client.post('/api/autofill', json=data)
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    
+    # Behind a proxy, a spoofed X-Forwarded-For entry can't earn the client a fresh bucket
+    monkeypatch.setattr(app_module, 'RATE_LIMIT_TRUST_PROXY', True)
+    assert client.post('/api/autofill', json=data, headers={'X-Forwarded-For': '203.0.113.7'}).status_code == 200
+    for spoofed in ('10.0.0.1', '10.0.0.2'):
+        headers = {'X-Forwarded-For': f'{spoofed}, 203.0.113.7'}
+        assert client.post('/api/autofill', json=data, headers=headers).status_code == 429
+    
+    monkeypatch.setitem(app_module.get_services(client.application).admission_gates, 'chat', gate)
+    response = client.post('/character/1/chat', json={'message': 'hola'})
+    assert response.status_code == 429
+
+def test_chat_response_cache():
+    """Test that repeat prompts for the same persona are answered from the cache"""
+    class CountingBackend(CannedBackend):
+        cacheable = True
+    
+    calls = []
+    engine = ChatEngine(backend=CountingBackend(lambda character, message: calls.append(message) or f'reply {len(calls)}'))
+    character = Character(name='Cache', race='Human', char_class='Cleric', ideals='Faith')
+    
+    assert engine.get_response(character, '¿Qué te motiva a seguir adelante?') == 'reply 1'
+    assert engine.get_response(character, 'qué te motiva a seguir   adelante') == 'reply 1'
+    assert ''.join(engine.stream_response(character, 'Qué te motiva a seguir adelante')) == 'reply 1'
+    assert len(calls) == 1
+    
+    # Persona changes start a fresh entry; unrelated fields don't
+    character.hit_point_maximum = 12
+    assert engine.get_response(character, '¿Qué te motiva a seguir adelante?') == 'reply 1'
+    character.ideals = 'Charity'
+    assert engine.get_response(character, '¿Qué te motiva a seguir adelante?') == 'reply 2'
+    assert engine.response_cache.stats()['hits'] == 3
+    
+    
+    # Context-aware replies are reused while the recent turns move on, until the summary changes
+    class ContextBackend(CountingBackend):
+        uses_context = True
+    
+    db_fd, db_path = tempfile.mkstemp()
+    conn = sqlite3.connect(db_path)
+    init_chat_schema(conn.cursor())
+    conn.commit()
+    conn.close()
+    calls.clear()
+    engine = ChatEngine(db_path=db_path, backend=ContextBackend(lambda character, message: calls.append(message) or f'reply {len(calls)}'))
+    character.id = 1
+    assert engine.get_response(character, 'hola') == 'reply 1'
+    engine.record_exchange(1, 'hola', 'reply 1')
+    engine.record_exchange(1, 'vamos al mercado', 'de acuerdo')
+    assert engine.get_response(character, '¡Hola!') == 'reply 1'
+    assert len(calls) == 1
+    
+    summary = {'summary': 'Earlier conversation: combat', 'recent': [], 'recalled': []}
+    assert engine.response_cache.make_key(character, 'hola', summary) != engine.response_cache.make_key(character, 'hola')
+    os.close(db_fd)
+    os.unlink(db_path)
+
+def test_chat_memory_rolling_summary():
+    """Test that old messages fold into the summary and the context stays bounded"""
+    db_fd, db_path = tempfile.mkstemp()
+    conn = sqlite3.connect(db_path)
+    init_chat_schema(conn.cursor())
+    conn.commit()
+    conn.close()
+    
+    engine = ChatEngine()
+    memory = ChatMemory(db_path, engine.classify_message, window=4, interval=3)
+    for i in range(40):
+        memory.append(1, f'cuéntame sobre la batalla número {i}', f'respuesta {i}')
+    memory.append(2, 'hola', 'saludos')
+    
+    context = memory.get_context(1)
+    assert 4 <= len(context['recent']) < 4 + 3
+    assert context['recent'][-1]['user'] == 'cuéntame sobre la batalla número 39'
+    
+    summary = memory.get_summary(1)
+    assert summary['messages'] + len(context['recent']) == 40
+    assert summary['through_seq'] == context['recent'][0]['seq'] - 1
+    assert summary['topics'] == {'combat': summary['messages']}
+    assert 'Earlier conversation' in context['summary']
+    assert memory.get_context(2) == {'summary': '', 'recent': memory.get_recent(2)}
+    
+    memory.delete_character(1)
+    assert memory.get_context(1) == {'summary': '', 'recent': []}
+    os.close(db_fd)
+    os.unlink(db_path)
+
+def test_chat_recall_index():
+    """Test that past turns are retrieved by relevance and kept up to date as messages arrive"""
+    db_fd, db_path = tempfile.mkstemp()
+    conn = sqlite3.connect(db_path)
+    init_chat_schema(conn.cursor())
+    conn.commit()
+    conn.close()
+    
+    engine = ChatEngine(db_path=db_path)
+    for i in range(30):
+        engine.record_exchange(1, f'el mercado del puerto número {i}', 'interesante')
+    engine.record_exchange(1, 'mi hermana vive en Aguasclaras', 'la visitaremos')
+    
+    recalled = engine.recall.search(1, '¿recuerdas dónde vive mi hermana?')
+    assert recalled[0]['user'] == 'mi hermana vive en Aguasclaras'
+    assert engine.recall.search(1, 'dragones rojos') == []
+    
+    # Turns recorded after the index was built are searchable right away
+    engine.record_exchange(1, 'perdí mi espada de plata en la cueva', 'la buscaremos')
+    assert engine.recall.search(1, 'la espada de plata')[0]['user'] == 'perdí mi espada de plata en la cueva'
+
+    # Turns recorded by another worker are read at the next sync, even once this worker has recorded newer ones
+    ChatMemory(db_path).append(1, 'el herrero enano se llama Thorgrim', 'lo recordaré')
+    engine.record_exchange(1, 'vamos a la taberna', 'de acuerdo')
+    engine.recall.sync_interval = 60
+    reads = []
+    get_since = engine.memory.get_since
+    engine.memory.get_since = lambda *args: reads.append(args) or get_since(*args)
+    assert engine.recall.search(1, '¿cómo se llama el herrero?') == []
+    assert reads == []
+    engine.recall.sync_interval = 0
+    assert engine.recall.search(1, '¿cómo se llama el herrero?')[0]['user'] == 'el herrero enano se llama Thorgrim'
+    assert len(reads) == 1
+
+    character = Character(id=1, name='Recall', race='Human', char_class='Fighter')
+    assert 'Aguasclaras' in engine.get_canned_response(character, '¿Y tu hermana?')
+    
+    engine.forget_character(1)
+    assert engine.recall.search(1, 'hermana') == []
+    os.close(db_fd)
+    os.unlink(db_path)
+
 if __name__ == '__main__':
     pytest.main([__file__]) 
\ No newline at end of file
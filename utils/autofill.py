@@ -1,19 +1,36 @@
+import copy
 import json
 import random
-from typing import Dict, List
+from typing import Dict, Iterable, List, Optional
+from config import AUTOFILL_CACHE_SIZE, POINT_BUY_COSTS, MAX_ATTRIBUTE_POINTS, MAX_ATTRIBUTE_VALUE
 from models import Character
 from utils.spell_manager import SpellManager
+from utils.lru_cache import LRUCache
+from utils.point_buy import PointBuyOptimizer
 from logging_config import get_logger
 
 # Configure logging
 logger = get_logger(__name__)
 
+# Character sections that fill_character can generate
+FILL_SECTIONS = ('attributes', 'skills', 'spells', 'personality')
+
 class AutoFill:
     """Clase para autocompletar datos del personaje"""
     
-    def __init__(self):
+    def __init__(self, seed: Optional[int] = None):
         self.load_data()
         self.spell_manager = SpellManager()
+        # Per-instance generator so seeded runs don't depend on the global random state
+        self.rng = random.Random(seed)
+        # Seeded suggestions are deterministic, so they can be memoized
+        self.suggestions_cache = LRUCache(AUTOFILL_CACHE_SIZE)
+        # Ranks every valid 27-point array by class priorities and racial bonuses
+        self.point_buy = PointBuyOptimizer(self.races, self.class_priorities)
+    
+    def _get_rng(self, seed: Optional[int] = None) -> random.Random:
+        """Get a generator for a call: a fresh seeded one, or the instance generator"""
+        return random.Random(seed) if seed is not None else self.rng
     
     def load_data(self):
         """Cargar datos de clases, razas y backgrounds"""
@@ -187,6 +204,22 @@ class AutoFill:
             }
         }
         
+        # Attribute priorities per class, most important first
+        self.class_priorities = {
+            'Fighter': ['STR', 'CON', 'DEX', 'WIS', 'CHA', 'INT'],
+            'Wizard': ['INT', 'CON', 'DEX', 'WIS', 'CHA', 'STR'],
+            'Cleric': ['WIS', 'CON', 'STR', 'CHA', 'INT', 'DEX'],
+            'Rogue': ['DEX', 'CON', 'INT', 'WIS', 'CHA', 'STR'],
+            'Ranger': ['DEX', 'WIS', 'CON', 'STR', 'CHA', 'INT'],
+            'Paladin': ['STR', 'CHA', 'CON', 'WIS', 'DEX', 'INT'],
+            'Bard': ['CHA', 'DEX', 'CON', 'INT', 'WIS', 'STR'],
+            'Sorcerer': ['CHA', 'CON', 'DEX', 'WIS', 'INT', 'STR'],
+            'Warlock': ['CHA', 'CON', 'DEX', 'WIS', 'INT', 'STR'],
+            'Monk': ['DEX', 'WIS', 'CON', 'STR', 'CHA', 'INT'],
+            'Druid': ['WIS', 'CON', 'DEX', 'STR', 'INT', 'CHA'],
+            'Barbarian': ['STR', 'CON', 'DEX', 'WIS', 'CHA', 'INT']
+        }
+        
         # Hechizos del SRD por clase
         self.spells_by_class = {
             'Wizard': ['Magic Missile', 'Shield', 'Mage Armor', 'Detect Magic', 'Comprehend Languages'],
@@ -456,19 +489,20 @@ class AutoFill:
             }
         }
     
-    def roll_attributes(self) -> Dict[str, int]:
+    def roll_attributes(self, seed: Optional[int] = None) -> Dict[str, int]:
         """Roll 4d6 drop lowest for each attribute"""
+        rng = self._get_rng(seed)
         attributes = {}
         for attr in ['STR', 'DEX', 'CON', 'INT', 'WIS', 'CHA']:
-            rolls = [random.randint(1, 6) for _ in range(4)]
+            rolls = [rng.randint(1, 6) for _ in range(4)]
             rolls.remove(min(rolls))  # Drop lowest
             attributes[attr] = sum(rolls)
         return attributes
 
     def get_recommended_attributes(self, char_class: str, race: str = None) -> Dict[str, int]:
         """Get recommended attributes for a class and race combination"""
-        # Get optimized standard array for the class
-        attributes = self.get_optimized_standard_array(char_class)
+        # Get the best array for the class, ranked with the racial bonuses in mind
+        attributes = self.get_optimized_standard_array(char_class, race if race in self.races else None)
         
         # Apply racial bonuses AFTER assignment
         if race and race in self.races:
@@ -478,52 +512,13 @@ class AutoFill:
         
         return attributes
     
-    def get_optimized_standard_array(self, char_class: str) -> Dict[str, int]:
-        """Get optimized standard array for a specific class (non-random)"""
-        # Class-specific optimized standard arrays
-        # Each array uses exactly 27 points and prioritizes class needs
-        optimized_arrays = {
-            'Fighter': {
-                'STR': 15, 'CON': 14, 'DEX': 13, 'WIS': 12, 'CHA': 10, 'INT': 8
-            },  # 9+7+5+4+2+0 = 27
-            'Wizard': {
-                'INT': 15, 'CON': 14, 'DEX': 13, 'WIS': 12, 'CHA': 10, 'STR': 8
-            },  # 9+7+5+4+2+0 = 27
-            'Cleric': {
-                'WIS': 15, 'CON': 14, 'STR': 13, 'CHA': 12, 'INT': 10, 'DEX': 8
-            },  # 9+7+5+4+2+0 = 27
-            'Rogue': {
-                'DEX': 15, 'CON': 14, 'INT': 13, 'WIS': 12, 'CHA': 10, 'STR': 8
-            },  # 9+7+5+4+2+0 = 27
-            'Ranger': {
-                'DEX': 15, 'WIS': 14, 'CON': 13, 'STR': 12, 'CHA': 10, 'INT': 8
-            },  # 9+7+5+4+2+0 = 27
-            'Paladin': {
-                'STR': 15, 'CHA': 14, 'CON': 13, 'WIS': 12, 'DEX': 10, 'INT': 8
-            },  # 9+7+5+4+2+0 = 27
-            'Bard': {
-                'CHA': 15, 'DEX': 14, 'CON': 13, 'INT': 12, 'WIS': 10, 'STR': 8
-            },  # 9+7+5+4+2+0 = 27
-            'Sorcerer': {
-                'CHA': 15, 'CON': 14, 'DEX': 13, 'WIS': 12, 'INT': 10, 'STR': 8
-            },  # 9+7+5+4+2+0 = 27
-            'Warlock': {
-                'CHA': 15, 'CON': 14, 'DEX': 13, 'WIS': 12, 'INT': 10, 'STR': 8
-            },  # 9+7+5+4+2+0 = 27
-            'Monk': {
-                'DEX': 15, 'WIS': 14, 'CON': 13, 'STR': 12, 'CHA': 10, 'INT': 8
-            },  # 9+7+5+4+2+0 = 27
-            'Druid': {
-                'WIS': 15, 'CON': 14, 'DEX': 13, 'STR': 12, 'INT': 10, 'CHA': 8
-            },  # 9+7+5+4+2+0 = 27
-            'Barbarian': {
-                'STR': 15, 'CON': 14, 'DEX': 13, 'WIS': 12, 'CHA': 10, 'INT': 8
-            }  # 9+7+5+4+2+0 = 27
-        }
-        
-        return optimized_arrays.get(char_class, {
-            'STR': 15, 'DEX': 14, 'CON': 13, 'INT': 12, 'WIS': 10, 'CHA': 8
-        })
+    def get_optimized_standard_array(self, char_class: str, race: str = None) -> Dict[str, int]:
+        """Get the best 27-point base array for a class (and race) from the point buy ranking"""
+        return self.point_buy.get_best_array(char_class, race)
+    
+    def get_top_point_buy_arrays(self, char_class: str, race: str = None, limit: int = 5) -> List[Dict]:
+        """Get the highest scoring 27-point arrays for a class and race"""
+        return self.point_buy.get_top_arrays(char_class, race, limit)
     
     def get_base_attributes(self, char_class: str, race: str = None) -> Dict[str, int]:
         """Get base attributes without optimization"""
@@ -574,7 +569,8 @@ class AutoFill:
         # Fallback to optimized standard array
         return self.get_optimized_standard_array(char_class)
     
-    def get_skills_for_playstyle(self, char_class: str, playstyle: str) -> List[str]:
+    def get_skills_for_playstyle(self, char_class: str, playstyle: str,
+                                 rng: Optional[random.Random] = None) -> List[str]:
         """Get recommended skills for a playstyle"""
         # Handle standard array option
         if playstyle == 'standard_array':
@@ -600,7 +596,8 @@ class AutoFill:
             return [skill for skill in utility_skills if skill in class_skills][:2]
         else:
             # Balanced - random selection
-            return random.sample(class_skills, min(2, len(class_skills)))
+            rng = rng or self.rng
+            return rng.sample(class_skills, min(2, len(class_skills)))
     
     def get_spells_for_playstyle(self, char_class: str, playstyle: str) -> Dict[str, List[str]]:
         """Get recommended spells for a playstyle"""
@@ -664,39 +661,46 @@ class AutoFill:
             # Balanced - use default suggestions
             return suggestions
     
-    def fill_character(self, character: Character):
-        """Fill character with recommended data"""
+    def fill_character(self, character: Character, seed: Optional[int] = None,
+                       sections: Optional[Iterable[str]] = None):
+        """Fill empty character sections with recommended data (all FILL_SECTIONS unless limited)"""
+        rng = self._get_rng(seed)
+        sections = set(FILL_SECTIONS if sections is None else sections)
+        
         # Generate attributes if not set
-        if not character.attributes:
+        if 'attributes' in sections and not character.attributes:
             character.attributes = self.get_recommended_attributes(character.char_class, character.race)
         
         # Generate skills if not set
-        if not character.skills:
+        if 'skills' in sections and not character.skills:
             class_data = self.classes.get(character.char_class, {})
-            skill_options = class_data.get('skill_options', [])
+            # Copy so the class data isn't extended on every call
+            skill_options = list(class_data.get('skill_options', []))
             skill_choices = class_data.get('skill_choices', 2)
             
             # Add background skills
-            background_skills = self._select_exact_skills(character.char_class, character.background)
+            background_skills = self._select_exact_skills(character.char_class, character.background, rng)
             skill_options.extend(background_skills)
             skill_choices += 2  # Background gives 2 additional skills
             
             # Select skills
-            character.skills = random.sample(skill_options, min(skill_choices, len(skill_options)))
+            character.skills = rng.sample(skill_options, min(skill_choices, len(skill_options)))
         
         # Generate spells for spellcasters
-        if self.spell_manager.can_cast_spells(character.char_class) and not character.cantrips and not character.spells_known:
+        if ('spells' in sections and self.spell_manager.can_cast_spells(character.char_class)
+                and not character.cantrips and not character.spells_known):
             spell_suggestions = self.spell_manager.get_spell_suggestions(character.char_class)
             character.cantrips = spell_suggestions['cantrips']
             character.spells_known = spell_suggestions['spells']
             character.spells = character.cantrips + character.spells_known
         
         # Generate personality traits
-        if not character.personality_traits:
-            character.personality_traits = self.generate_personality_traits(character)
+        if 'personality' in sections and not character.personality_traits:
+            character.personality_traits = self.generate_personality_traits(character, rng)
     
-    def generate_personality_traits(self, character: Character) -> str:
+    def generate_personality_traits(self, character: Character, rng: Optional[random.Random] = None) -> str:
         """Generate personality traits based on class and race"""
+        rng = rng or self.rng
         traits = []
         
         # Traits by class
@@ -730,10 +734,10 @@ class AutoFill:
         
         # Select traits
         if character.char_class in class_traits:
-            traits.extend(random.sample(class_traits[character.char_class], 2))
+            traits.extend(rng.sample(class_traits[character.char_class], 2))
         
         if character.race in race_traits:
-            traits.extend(random.sample(race_traits[character.race], 2))
+            traits.extend(rng.sample(race_traits[character.race], 2))
         
         return ', '.join(traits) 
 
@@ -804,8 +808,10 @@ class AutoFill:
         
         return primary_attributes.get(char_class, {}) 
 
-    def _select_exact_skills(self, char_class: str, background: str) -> List[str]:
+    def _select_exact_skills(self, char_class: str, background: str,
+                             rng: Optional[random.Random] = None) -> List[str]:
         """Select exactly the right number of skills for class and background"""
+        rng = rng or self.rng
         all_skills = []
         
         # Add background skills first
@@ -824,14 +830,14 @@ class AutoFill:
             
             # Select exactly the required number of class skills
             if len(available_class_skills) >= skill_choices:
-                selected_class_skills = random.sample(available_class_skills, skill_choices)
+                selected_class_skills = rng.sample(available_class_skills, skill_choices)
             else:
                 # If not enough unique skills, take all available
                 selected_class_skills = available_class_skills
                 # Fill remaining slots with random skills from the class list
                 remaining_slots = skill_choices - len(selected_class_skills)
                 if remaining_slots > 0:
-                    additional_skills = random.sample(skill_options, min(remaining_slots, len(skill_options)))
+                    additional_skills = rng.sample(skill_options, min(remaining_slots, len(skill_options)))
                     selected_class_skills.extend(additional_skills)
             
             # Add class skills to the list
@@ -929,10 +935,7 @@ class AutoFill:
 
     def _validate_attribute_points(self, attributes: Dict[str, int]) -> Dict[str, any]:
         """Validate that attributes use exactly 27 points and no score exceeds 15"""
-        # Point costs for each score
-        point_costs = {
-            8: 0, 9: 1, 10: 2, 11: 3, 12: 4, 13: 5, 14: 7, 15: 9
-        }
+        point_costs = POINT_BUY_COSTS
         
         total_points = 0
         max_score = 0
@@ -946,11 +949,12 @@ class AutoFill:
                 max_score = max(max_score, score)
         
         return {
-            'valid': total_points == 27 and max_score <= 15 and len(invalid_scores) == 0,
+            'valid': (total_points == MAX_ATTRIBUTE_POINTS and max_score <= MAX_ATTRIBUTE_VALUE
+                      and len(invalid_scores) == 0),
             'total_points': total_points,
             'max_score': max_score,
             'invalid_scores': invalid_scores,
-            'expected_points': 27
+            'expected_points': MAX_ATTRIBUTE_POINTS
         }
 
     def _fix_playstyle_attributes(self, char_class: str, playstyle: str) -> Dict[str, int]:
@@ -966,40 +970,9 @@ class AutoFill:
         if validation['valid']:
             return original_attrs
         
-        # If invalid, create a corrected version
-        # Use standard array as base: [15, 14, 13, 12, 10, 8] = 9+7+5+4+2+0 = 27 points
-        standard_array = [15, 14, 13, 12, 10, 8]
-        
-        # For each class, prioritize the most important attributes
-        class_priorities = {
-            'Fighter': ['STR', 'CON', 'DEX', 'WIS', 'CHA', 'INT'],
-            'Wizard': ['INT', 'CON', 'DEX', 'WIS', 'CHA', 'STR'],
-            'Cleric': ['WIS', 'CON', 'STR', 'CHA', 'INT', 'DEX'],
-            'Rogue': ['DEX', 'CON', 'INT', 'WIS', 'CHA', 'STR'],
-            'Ranger': ['DEX', 'WIS', 'CON', 'STR', 'CHA', 'INT'],
-            'Paladin': ['STR', 'CHA', 'CON', 'WIS', 'DEX', 'INT'],
-            'Bard': ['CHA', 'DEX', 'CON', 'INT', 'WIS', 'STR'],
-            'Sorcerer': ['CHA', 'CON', 'DEX', 'WIS', 'INT', 'STR'],
-            'Warlock': ['CHA', 'CON', 'DEX', 'WIS', 'INT', 'STR'],
-            'Monk': ['DEX', 'WIS', 'CON', 'STR', 'CHA', 'INT'],
-            'Druid': ['WIS', 'CON', 'DEX', 'STR', 'INT', 'CHA'],
-            'Barbarian': ['STR', 'CON', 'DEX', 'WIS', 'CHA', 'INT']
-        }
-        
-        priorities = class_priorities.get(char_class, ['STR', 'DEX', 'CON', 'INT', 'WIS', 'CHA'])
-        
-        # Assign standard array values to prioritized attributes
-        corrected_attrs = {}
-        for i, attr in enumerate(priorities):
-            if i < len(standard_array):
-                corrected_attrs[attr] = standard_array[i]
-            else:
-                corrected_attrs[attr] = 8  # Fallback
-        
-        # Validate the corrected version
-        validation = self._validate_attribute_points(corrected_attrs)
-        if not validation['valid']:
-            logger.warning(f"Failed to create valid attributes for {char_class} {playstyle}: {validation}")
+        # If invalid, use the best valid 27-point array for the class
+        corrected_attrs = self.point_buy.get_best_array(char_class)
+        logger.info(f"Replaced invalid preset for {char_class} {playstyle} with {corrected_attrs}")
         
         return corrected_attrs
 
@@ -1017,13 +990,30 @@ class AutoFill:
         
         return result
 
-    def get_suggestions(self, char_class: str, background: str, race: str = None, playstyle: str = None) -> Dict:
+    def get_suggestions(self, char_class: str, background: str, race: str = None, playstyle: str = None,
+                        seed: Optional[int] = None) -> Dict:
         """Get autofill suggestions that respect available skills and playstyle"""
+        # Only seeded results are reproducible, so only those are memoized
+        if seed is None:
+            return self._build_suggestions(char_class, background, race, playstyle, self.rng)
+        
+        cache_key = (char_class, background, race, playstyle, seed)
+        cached = self.suggestions_cache.get(cache_key)
+        if cached is None:
+            cached = self._build_suggestions(char_class, background, race, playstyle, random.Random(seed))
+            self.suggestions_cache.put(cache_key, cached)
+        
+        # Callers may mutate the result, so never hand out the cached object
+        return copy.deepcopy(cached)
+    
+    def _build_suggestions(self, char_class: str, background: str, race: Optional[str],
+                           playstyle: Optional[str], rng: random.Random) -> Dict:
+        """Build autofill suggestions using the given generator"""
         # Get base attributes (presets are base scores without racial bonuses)
         if playstyle and char_class in self.playstyles:
             # Use specific playstyle preset
             base_attributes = self.get_attributes_for_playstyle(char_class, playstyle)
-            playstyle_skills = self.get_skills_for_playstyle(char_class, playstyle)
+            playstyle_skills = self.get_skills_for_playstyle(char_class, playstyle, rng)
             playstyle_spells = self.get_spells_for_playstyle(char_class, playstyle)
         else:
             # Use optimized standard array without racial bonuses
@@ -1032,7 +1022,7 @@ class AutoFill:
             playstyle_spells = {}
         
         # Select skills with exact quantities
-        all_skills = self._select_exact_skills(char_class, background)
+        all_skills = self._select_exact_skills(char_class, background, rng)
         
         # If we have playstyle skills, incorporate them properly
         if playstyle_skills:
@@ -1068,7 +1058,7 @@ class AutoFill:
                     available_class_skills = [skill for skill in class_skills 
                                            if skill not in new_skills]
                     if available_class_skills:
-                        additional_skills = random.sample(available_class_skills, 
+                        additional_skills = rng.sample(available_class_skills, 
                                                        min(remaining_slots, len(available_class_skills)))
                         new_skills.extend(additional_skills)
                 
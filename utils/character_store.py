@@ -0,0 +1,153 @@
+import json
+import sqlite3
+from typing import Dict, List, Optional, Sequence
+from models import Character
+from utils.database import connect
+from utils.persona_profile import build_persona_profile
+
+# Columns written when a character is first created
+CHARACTER_INSERT_COLUMNS = (
+    'name', 'race', 'char_class', 'level', 'background',
+    'attributes', 'skills', 'feats', 'cantrips', 'spells_known', 'personality_traits',
+    'background_story', 'short_term_goals', 'long_term_goals', 'personal_goals', 'personality_tags', 'flaws',
+    'currency', 'items', 'item_weights', 'persona_profile'
+)
+
+CHARACTER_INSERT_SQL = f'''
+    INSERT INTO characters ({', '.join(CHARACTER_INSERT_COLUMNS)})
+    VALUES ({', '.join('?' for _ in CHARACTER_INSERT_COLUMNS)})
+'''
+
+
+def character_to_row(character: Character) -> tuple:
+    """Serialize a character into the values for CHARACTER_INSERT_SQL"""
+    return (
+        character.name, character.race, character.char_class, character.level,
+        character.background, json.dumps(character.attributes),
+        json.dumps(character.skills), json.dumps(character.feats),
+        json.dumps(character.cantrips), json.dumps(character.spells_known),
+        character.personality_traits, character.background_story,
+        character.short_term_goals, character.long_term_goals, character.personal_goals,
+        json.dumps(character.personality_tags), character.flaws,
+        json.dumps(character.currency), json.dumps(character.items), json.dumps(character.item_weights),
+        json.dumps(build_persona_profile(character))
+    )
+
+
+def insert_characters(cursor: sqlite3.Cursor, rows: List[tuple]) -> List[int]:
+    """Insert character rows inside the caller's write transaction and return their ids
+
+    Each id is read back from its own insert rather than assumed to follow the previous one.
+    """
+    ids = []
+    for row in rows:
+        cursor.execute(CHARACTER_INSERT_SQL, row)
+        ids.append(cursor.lastrowid)
+    return ids
+
+
+def _json_column(row: Sequence, index: int, default):
+    """Decode a JSON column of a SELECT * row, falling back to default when missing or empty"""
+    if len(row) > index and row[index] and row[index].strip():
+        return json.loads(row[index])
+    return default
+
+
+def _text_column(row: Sequence, index: int, default=''):
+    return row[index] if len(row) > index and row[index] else default
+
+
+def row_to_character(row: Sequence) -> Character:
+    """Build a Character from a SELECT * FROM characters row"""
+    character = Character(
+        id=row[0],
+        name=row[1],
+        race=row[2],
+        char_class=row[3],
+        level=row[4],
+        background=row[5],
+        alignment=_text_column(row, 25),
+        experience_points=_text_column(row, 26, 0),
+        age=_text_column(row, 27),
+        height=_text_column(row, 28),
+        weight=_text_column(row, 29),
+        eyes=_text_column(row, 30),
+        skin=_text_column(row, 31),
+        hair=_text_column(row, 32),
+        hit_point_maximum=_text_column(row, 33, 0),
+        current_hit_points=_text_column(row, 34, 0),
+        temporary_hit_points=_text_column(row, 35, 0),
+        hit_dice=_text_column(row, 36),
+        attributes=_json_column(row, 6, {}),
+        skills=_json_column(row, 7, []),
+        feats=_json_column(row, 8, []),
+        cantrips=_json_column(row, 14, []),
+        spells_known=_json_column(row, 15, []),
+        personality_traits=row[10] or '',
+        ideals=_text_column(row, 37),
+        bonds=_text_column(row, 38),
+        background_story=_text_column(row, 16),
+        short_term_goals=_text_column(row, 17),
+        long_term_goals=_text_column(row, 18),
+        personal_goals=_text_column(row, 19),
+        personality_tags=_json_column(row, 20, []),
+        flaws=_text_column(row, 21),
+        currency=_json_column(row, 22, {}),
+        items=_json_column(row, 23, []),
+        item_weights=_json_column(row, 24, {}),
+        chat_history=_json_column(row, 12, []),
+        persona_profile=_json_column(row, 39, {})
+    )
+
+    # Combine cantrips and spells_known for backward compatibility
+    character.spells = character.cantrips + character.spells_known
+    return character
+
+
+def fetch_character(db_path: str, character_id: int) -> Optional[Character]:
+    """Load a character by id, or None if it doesn't exist"""
+    conn = connect(db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM characters WHERE id = ?', (character_id,))
+        row = cursor.fetchone()
+    finally:
+        conn.close()
+    return row_to_character(row) if row else None
+
+
+def refresh_persona_profile(cursor: sqlite3.Cursor, character_id: int) -> Optional[Dict]:
+    """Rebuild and store a character's persona profile inside the caller's transaction"""
+    cursor.execute('SELECT * FROM characters WHERE id = ?', (character_id,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    profile = build_persona_profile(row_to_character(row))
+    cursor.execute('UPDATE characters SET persona_profile = ? WHERE id = ?', (json.dumps(profile), character_id))
+    return profile
+
+
+def backfill_persona_profiles(cursor: sqlite3.Cursor) -> int:
+    """Build profiles for characters saved before profiles existed, returning how many were built"""
+    cursor.execute("SELECT * FROM characters WHERE persona_profile IS NULL OR persona_profile = ''")
+    rows = cursor.fetchall()
+    cursor.executemany('UPDATE characters SET persona_profile = ? WHERE id = ?',
+                       [(json.dumps(build_persona_profile(row_to_character(row))), row[0]) for row in rows])
+    return len(rows)
+
+
+def update_character_fields(db_path: str, character_id: int, values: Dict, refresh_persona: bool = False) -> bool:
+    """Update columns of a character in one transaction, returning False if it doesn't exist"""
+    assignments = ', '.join(f'{column} = ?' for column in values)
+    conn = connect(db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f'UPDATE characters SET {assignments} WHERE id = ?', (*values.values(), character_id))
+        if cursor.rowcount == 0:
+            return False
+        if refresh_persona:
+            refresh_persona_profile(cursor, character_id)
+        conn.commit()
+        return True
+    finally:
+        conn.close()
@@ -0,0 +1,262 @@
+"""
+Chat backends
+ChatEngine delegates reply generation to a backend: canned lines by default, or a local LLM server
+"""
+
+import asyncio
+import json
+import re
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable, Dict, Iterator, List, Optional
+from config import CHAT_REPLY_WORKERS
+from models import Character
+from utils.persona_profile import get_persona_profile
+from utils.db_pool import run_in_pool
+
+# Words with their trailing whitespace, so joined chunks rebuild the response exactly
+CHUNK_PATTERN = re.compile(r'\s*\S+\s*')
+
+# In-process reply generation of async views, kept off the database pool
+_reply_executor = ThreadPoolExecutor(max_workers=CHAT_REPLY_WORKERS, thread_name_prefix='reply')
+
+
+class BackendBusy(Exception):
+    """Raised when a backend's queue is full and the request should be retried later"""
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class BackendUnavailable(Exception):
+    """Raised when a backend failed to produce a reply and the caller should fall back"""
+
+
+def chunk_text(text: str) -> List[str]:
+    """Split a reply into word chunks that join back into the same text"""
+    return CHUNK_PATTERN.findall(text)
+
+
+async def run_reply(fn: Callable, *args, **kwargs):
+    """Await a blocking reply function run on the reply pool"""
+    return await run_in_pool(_reply_executor, fn, *args, **kwargs)
+
+
+def shutdown_reply_pool(wait: bool = True):
+    """Stop the reply threads"""
+    _reply_executor.shutdown(wait=wait)
+
+
+class ChatBackend(ABC):
+    """Interface for reply generators used by ChatEngine"""
+
+    name = 'base'
+    # Whether replies are worth caching (expensive to generate and stable for a persona)
+    cacheable = False
+    # Whether replies use the conversation context (summary and recent messages)
+    uses_context = False
+
+    @abstractmethod
+    def generate(self, character: Character, message: str, context: Optional[Dict] = None) -> str:
+        """Generate the full reply to a message"""
+
+    def stream(self, character: Character, message: str, context: Optional[Dict] = None) -> Iterator[str]:
+        """Generate the reply as chunks that join into the full reply"""
+        yield from chunk_text(self.generate(character, message, context))
+
+    async def agenerate(self, character: Character, message: str, context: Optional[Dict] = None) -> str:
+        """Generate the full reply from an async view
+
+        Runs generate on the reply pool. Backends doing network I/O override this to await it instead.
+        """
+        return await run_reply(self.generate, character, message, context)
+
+    def stats(self) -> Dict:
+        return {'backend': self.name}
+
+    def shutdown(self):
+        """Release backend resources"""
+
+
+class CannedBackend(ChatBackend):
+    """Picks a canned line through a reply function (ChatEngine.get_canned_response)"""
+
+    name = 'canned'
+
+    def __init__(self, reply: Callable[[Character, str], str]):
+        self.reply = reply
+
+    def generate(self, character: Character, message: str, context: Optional[Dict] = None) -> str:
+        return self.reply(character, message)
+
+
+class LLMBackend(ChatBackend):
+    """Generates replies with an OpenAI-compatible chat completions server on localhost
+
+    Requests run on a bounded worker pool. When every worker is busy and the queue is
+    full, BackendBusy is raised so the route can answer 429 instead of tying up a web
+    worker. Timeouts and server errors raise BackendUnavailable.
+    """
+
+    name = 'llm'
+    cacheable = True
+    uses_context = True
+
+    def __init__(self, url: str, model: str, timeout: float = 20.0,
+                 max_workers: int = 2, max_queue: int = 8, max_tokens: int = 200):
+        self.url = url
+        self.model = model
+        self.timeout = timeout
+        self.max_tokens = max_tokens
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='llm')
+        # Running plus queued generations
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        # Imported here: requests is slow to import and only this backend needs it
+        import requests
+        self._session_class = requests.Session
+        # requests.Session is not thread-safe, so each thread gets its own
+        self._local = threading.local()
+        self._sessions = []
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.rejected = 0
+        self.failures = 0
+
+    @property
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = self._session_class()
+            with self._lock:
+                self._sessions.append(session)
+        return session
+
+    def _payload(self, character: Character, message: str, context: Optional[Dict], stream: bool) -> Dict:
+        return {
+            'model': self.model,
+            'messages': self._messages(character, message, context),
+            'max_tokens': self.max_tokens,
+            'stream': stream
+        }
+
+    def _messages(self, character: Character, message: str, context: Optional[Dict] = None) -> List[Dict]:
+        system = get_persona_profile(character)['prompt']
+        if context and context.get('summary'):
+            system += '\n' + context['summary']
+        if context and context.get('recalled'):
+            system += '\nRelevant earlier exchanges:\n' + '\n'.join(
+                f"User: {entry['user']}\nYou: {entry['character']}" for entry in context['recalled'])
+        messages = [{'role': 'system', 'content': system}]
+        for entry in (context or {}).get('recent', []):
+            messages.append({'role': 'user', 'content': entry['user']})
+            messages.append({'role': 'assistant', 'content': entry['character']})
+        messages.append({'role': 'user', 'content': message})
+        return messages
+
+    def _acquire(self):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise BackendBusy('Chat model is busy, try again shortly')
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _complete(self, character: Character, message: str, context: Optional[Dict]) -> str:
+        try:
+            response = self._session.post(self.url, json=self._payload(character, message, context, False),
+                                          timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()['choices'][0]['message']['content'].strip()
+        finally:
+            self._slots.release()
+
+    def _submit(self, character: Character, message: str, context: Optional[Dict]):
+        self._acquire()
+        try:
+            return self._executor.submit(self._complete, character, message, context)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _checked(self, reply: str) -> str:
+        if not reply:
+            self._count('failures')
+            raise BackendUnavailable('Chat model returned an empty reply')
+        self._count('completed')
+        return reply
+
+    def generate(self, character: Character, message: str, context: Optional[Dict] = None) -> str:
+        future = self._submit(character, message, context)
+        try:
+            reply = future.result(timeout=self.timeout)
+        except FutureTimeout:
+            self._count('failures')
+            raise BackendUnavailable(f'Chat model timed out after {self.timeout}s')
+        except Exception as e:
+            self._count('failures')
+            raise BackendUnavailable(f'Chat model failed: {e}')
+        return self._checked(reply)
+
+    async def agenerate(self, character: Character, message: str, context: Optional[Dict] = None) -> str:
+        """Await the model's reply without holding the calling thread"""
+        future = self._submit(character, message, context)
+        try:
+            reply = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            self._count('failures')
+            raise BackendUnavailable(f'Chat model timed out after {self.timeout}s')
+        except Exception as e:
+            self._count('failures')
+            raise BackendUnavailable(f'Chat model failed: {e}')
+        return self._checked(reply)
+
+    def stream(self, character: Character, message: str, context: Optional[Dict] = None) -> Iterator[str]:
+        """Relay the model's token stream; failures before the first token raise BackendUnavailable
+
+        The stream is read on the calling (request) thread, since its chunks go straight to the
+        response; it doesn't use the worker pool, and the shared slots are its only bound.
+        """
+        self._acquire()
+        sent_any = False
+        try:
+            with self._session.post(self.url, json=self._payload(character, message, context, True),
+                                    timeout=self.timeout, stream=True) as response:
+                response.raise_for_status()
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith('data: '):
+                        continue
+                    data = line[len('data: '):]
+                    if data == '[DONE]':
+                        break
+                    text = json.loads(data)['choices'][0].get('delta', {}).get('content')
+                    if text:
+                        sent_any = True
+                        yield text
+            self._count('completed')
+        except Exception as e:
+            self._count('failures')
+            if sent_any:
+                raise
+            raise BackendUnavailable(f'Chat model stream failed: {e}')
+        finally:
+            self._slots.release()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'backend': self.name,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'failures': self.failures
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            session.close()
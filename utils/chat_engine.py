@@ -1,12 +1,106 @@
 import random
-from typing import Dict, List
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+from config import (
+    CHAT_BACKEND, LLM_URL, LLM_MODEL, LLM_TIMEOUT, LLM_WORKERS, LLM_QUEUE_SIZE,
+    CHAT_CACHE_SIZE, CHAT_CACHE_TTL, CHAT_CACHE_VARIETY, CHAT_CONTEXT_WINDOW, CHAT_SUMMARY_INTERVAL, CHAT_POLL_MAX_WAITERS,
+    CHAT_RECALL_CHARACTERS, CHAT_RECALL_RESULTS, CHAT_RECALL_MIN_SCORE, CHAT_RECALL_SYNC_INTERVAL,
+    DATABASE_PATH
+)
 from models import Character
+from utils.chat_backends import (
+    ChatBackend, CannedBackend, LLMBackend, BackendUnavailable, chunk_text, run_reply
+)
+from utils.chat_memory import ChatMemory
+from utils.chat_recall import ChatRecall
+from utils.db_pool import run_db
+from utils.keyword_classifier import KeywordClassifier
+from utils.persona_profile import get_persona_profile
+from utils.response_cache import ResponseCache
+from logging_config import get_logger
+
+# Configure logging
+logger = get_logger(__name__)
+
+# Message categories in priority order
+MESSAGE_CATEGORIES = [
+    ('greeting', ['hola', 'hello', 'hi', 'buenos días', 'buenas']),
+    ('farewell', ['adiós', 'goodbye', 'bye', 'hasta luego', 'nos vemos']),
+    ('combat', ['batalla', 'combate', 'lucha', 'pelea', 'guerra']),
+    ('magic', ['magia', 'hechizo', 'conjuro', 'spell', 'magic']),
+    ('training', ['entrenamiento', 'práctica', 'estudio', 'aprendizaje']),
+    ('nature', ['naturaleza', 'bosque', 'animal', 'tierra', 'plantas']),
+    ('faith', ['fe', 'dios', 'oración', 'bendición', 'sagrado']),
+    ('music', ['música', 'canción', 'arte', 'historia', 'poesía']),
+    ('power', ['poder', 'fuerza', 'energía', 'magia salvaje']),
+    ('stealth', ['sigilo', 'sombra', 'ladrón', 'furtivo', 'silencioso'])
+]
+
+# Character topics for contextual responses in priority order
+CONTEXT_TOPICS = [
+    ('background', ['background', 'historia', 'pasado']),
+    ('goals', ['meta', 'objetivo', 'objetivos', 'goal']),
+    ('personality', ['personalidad', 'carácter', 'cómo eres']),
+    ('ideals', ['ideal', 'creencia', 'valor']),
+    ('bonds', ['vínculo', 'bond', 'conexión', 'familia']),
+    ('flaws', ['defecto', 'debilidad', 'flaw', 'error']),
+    ('strength', ['fuerza', 'fuerte']),
+    ('level', ['nivel', 'experiencia']),
+    ('skills', ['habilidad', 'skill']),
+    ('spells', ['hechizo', 'spell'])
+]
 
 class ChatEngine:
     """Motor de chat para interactuar con el personaje"""
     
-    def __init__(self):
+    def __init__(self, backend: Optional[ChatBackend] = None, db_path: str = DATABASE_PATH):
         self.load_responses()
+        # Category and topic are both found in the same scan of the message
+        self.classifier = KeywordClassifier(MESSAGE_CATEGORIES, CONTEXT_TOPICS)
+        self.backend = backend or self.create_backend(CHAT_BACKEND)
+        self.response_cache = ResponseCache(CHAT_CACHE_SIZE, CHAT_CACHE_TTL, CHAT_CACHE_VARIETY)
+        self.memory = ChatMemory(db_path, self.classify_message, CHAT_CONTEXT_WINDOW, CHAT_SUMMARY_INTERVAL,
+                                 max_waiters=CHAT_POLL_MAX_WAITERS)
+        self.recall = ChatRecall(self.memory, CHAT_RECALL_CHARACTERS, CHAT_RECALL_MIN_SCORE,
+                                 CHAT_RECALL_SYNC_INTERVAL)
+    
+    def create_backend(self, name: str) -> ChatBackend:
+        """Build a reply backend by name"""
+        if name == 'llm':
+            return LLMBackend(LLM_URL, LLM_MODEL, timeout=LLM_TIMEOUT,
+                              max_workers=LLM_WORKERS, max_queue=LLM_QUEUE_SIZE)
+        return CannedBackend(self.get_canned_response)
+    
+    def _cache_key(self, character: Character, user_message: str, context: Optional[Dict]) -> Optional[tuple]:
+        """Cache key for backends whose replies are worth caching (the context is part of the key)"""
+        if not self.backend.cacheable or CHAT_CACHE_SIZE <= 0:
+            return None
+        return self.response_cache.make_key(character, user_message, context)
+    
+    def get_context(self, character: Character, user_message: str) -> Optional[Dict]:
+        """Bounded conversation context for backends that use it
+
+        Holds the rolling summary, the recent messages and the older turns most relevant to the message.
+        """
+        if not self.backend.uses_context or character.id is None:
+            return None
+        context = self.memory.get_context(character.id)
+        context['recalled'] = self.recall.search(character.id, user_message, CHAT_RECALL_RESULTS,
+                                                 exclude=[entry['seq'] for entry in context['recent']])
+        return context
+    
+    def record_exchange(self, character_id: int, user_message: str, response: str) -> int:
+        """Save a chat turn, index it for recall and return its sequence number"""
+        timestamp = datetime.now().isoformat()
+        seq = self.memory.append(character_id, user_message, response, timestamp)
+        self.recall.add(character_id, {'seq': seq, 'user': user_message, 'character': response,
+                                       'timestamp': timestamp})
+        return seq
+    
+    def forget_character(self, character_id: int):
+        """Remove the stored messages, summary and recall index of a deleted character"""
+        self.memory.delete_character(character_id)
+        self.recall.forget(character_id)
     
     def load_responses(self):
         """Cargar respuestas y patrones de conversación"""
@@ -263,10 +357,78 @@ class ChatEngine:
     
     def get_response(self, character: Character, user_message: str) -> str:
         """Generar respuesta del personaje basada en el mensaje del usuario"""
+        context = self.get_context(character, user_message)
+        key = self._cache_key(character, user_message, context)
+        if key:
+            cached = self.response_cache.get(key)
+            if cached:
+                return cached
+        
+        try:
+            response = self.backend.generate(character, user_message, context)
+        except BackendUnavailable as e:
+            # Canned replies are not cached so the next request retries the backend
+            logger.warning(f"{e}, using canned reply")
+            return self.get_canned_response(character, user_message)
+        
+        if key:
+            self.response_cache.add(key, response)
+        return response
+    
+    async def aget_response(self, character: Character, user_message: str) -> str:
+        """Async get_response: context is loaded on the database pool and the backend call is awaited"""
+        context = await run_db(self.get_context, character, user_message)
+        key = self._cache_key(character, user_message, context)
+        if key:
+            cached = self.response_cache.get(key)
+            if cached:
+                return cached
+        
+        try:
+            response = await self.backend.agenerate(character, user_message, context)
+        except BackendUnavailable as e:
+            logger.warning(f"{e}, using canned reply")
+            return await run_reply(self.get_canned_response, character, user_message)
+        
+        if key:
+            self.response_cache.add(key, response)
+        return response
+    
+    def stream_response(self, character: Character, user_message: str) -> Iterator[str]:
+        """Generate the response as a sequence of chunks that join into the full reply"""
+        context = self.get_context(character, user_message)
+        key = self._cache_key(character, user_message, context)
+        if key:
+            cached = self.response_cache.get(key)
+            if cached:
+                yield from chunk_text(cached)
+                return
+        
+        chunks = []
+        try:
+            for chunk in self.backend.stream(character, user_message, context):
+                chunks.append(chunk)
+                yield chunk
+        except BackendUnavailable as e:
+            logger.warning(f"{e}, using canned reply")
+            yield from chunk_text(self.get_canned_response(character, user_message))
+            return
+        
+        if key:
+            self.response_cache.add(key, ''.join(chunks))
+    
+    def get_canned_response(self, character: Character, user_message: str) -> str:
+        """Pick a canned response for the message category and character class"""
         message_lower = user_message.lower()
         
-        # Detectar el tipo de mensaje
-        message_type = self.classify_message(message_lower)
+        # Detectar el tipo de mensaje y el tema en una sola pasada
+        message_type, topic = self.scan_message(message_lower)
+        
+        # Sin palabras clave: recordar algo relacionado de conversaciones anteriores
+        if message_type == 'general' and topic == 'general' and character.id is not None:
+            recalled = self.recall.search(character.id, user_message, limit=1)
+            if recalled:
+                return self.recall_response(recalled[0])
         
         # Obtener respuesta apropiada
         if character.char_class in self.class_responses:
@@ -282,136 +444,30 @@ class ChatEngine:
             return random.choice(self.general_responses[message_type])
         
         # Respuesta personalizada basada en el contexto del personaje
-        return self.generate_contextual_response(character, user_message)
+        return self.generate_contextual_response(character, user_message, topic)
+    
+    def recall_response(self, entry: Dict) -> str:
+        """Reply that brings back an earlier turn of the conversation"""
+        said = entry['user'] if len(entry['user']) <= 120 else entry['user'][:120] + '...'
+        return f"Eso me recuerda a cuando me dijiste: «{said}». No lo he olvidado."
+    
+    def scan_message(self, message: str) -> tuple:
+        """Get the category and contextual topic of a lowercase message ('general' when nothing matched)"""
+        category, topic = self.classifier.classify(message)
+        return category or 'general', topic or 'general'
     
     def classify_message(self, message: str) -> str:
         """Clasificar el tipo de mensaje del usuario"""
-        greetings = ['hola', 'hello', 'hi', 'buenos días', 'buenas']
-        farewells = ['adiós', 'goodbye', 'bye', 'hasta luego', 'nos vemos']
-        combat_words = ['batalla', 'combate', 'lucha', 'pelea', 'guerra']
-        magic_words = ['magia', 'hechizo', 'conjuro', 'spell', 'magic']
-        training_words = ['entrenamiento', 'práctica', 'estudio', 'aprendizaje']
-        nature_words = ['naturaleza', 'bosque', 'animal', 'tierra', 'plantas']
-        faith_words = ['fe', 'dios', 'oración', 'bendición', 'sagrado']
-        music_words = ['música', 'canción', 'arte', 'historia', 'poesía']
-        power_words = ['poder', 'fuerza', 'energía', 'magia salvaje']
-        stealth_words = ['sigilo', 'sombra', 'ladrón', 'furtivo', 'silencioso']
-        
-        if any(word in message for word in greetings):
-            return 'greeting'
-        elif any(word in message for word in farewells):
-            return 'farewell'
-        elif any(word in message for word in combat_words):
-            return 'combat'
-        elif any(word in message for word in magic_words):
-            return 'magic'
-        elif any(word in message for word in training_words):
-            return 'training'
-        elif any(word in message for word in nature_words):
-            return 'nature'
-        elif any(word in message for word in faith_words):
-            return 'faith'
-        elif any(word in message for word in music_words):
-            return 'music'
-        elif any(word in message for word in power_words):
-            return 'power'
-        elif any(word in message for word in stealth_words):
-            return 'stealth'
-        
-        return 'general'
+        return self.scan_message(message)[0]
     
-    def generate_contextual_response(self, character: Character, message: str) -> str:
+    def generate_contextual_response(self, character: Character, message: str, topic: Optional[str] = None) -> str:
         """Generar respuesta contextual basada en el personaje"""
-        message_lower = message.lower()
-        
-        # Respuestas basadas en personalidad y background
-        if 'background' in message_lower or 'historia' in message_lower or 'pasado' in message_lower:
-            if character.background_story:
-                # Extract a short snippet from the background story
-                story_snippet = character.background_story[:100] + "..." if len(character.background_story) > 100 else character.background_story
-                return f"Mi historia... {story_snippet} Es parte de lo que me ha hecho quien soy hoy."
-            else:
-                return "Mi pasado es... complicado. No me gusta hablar mucho de ello."
-        
-        # Respuestas basadas en metas
-        if 'meta' in message_lower or 'objetivo' in message_lower or 'objetivos' in message_lower or 'goal' in message_lower:
-            if character.short_term_goals:
-                return f"Mis objetivos inmediatos son {character.short_term_goals}. Me mantienen enfocado en el presente."
-            elif character.long_term_goals:
-                return f"Mi meta a largo plazo es {character.long_term_goals}. Es lo que me impulsa a seguir adelante."
-            else:
-                return "Todavía estoy descubriendo cuáles son mis verdaderos objetivos en la vida."
-        
-        # Respuestas basadas en personalidad
-        if 'personalidad' in message_lower or 'carácter' in message_lower or 'cómo eres' in message_lower:
-            if character.personality_tags:
-                tags_text = ', '.join(character.personality_tags[:3])
-                return f"Me describiría como {tags_text}. Esas son las cualidades que más me definen."
-            elif character.personality_traits:
-                return f"Mi personalidad... {character.personality_traits}"
-            else:
-                return "Soy... complejo. Como todos, supongo. ¿Qué aspecto de mi personalidad te interesa?"
-        
-        # Respuestas basadas en ideales
-        if 'ideal' in message_lower or 'creencia' in message_lower or 'valor' in message_lower:
-            if character.ideals:
-                return f"Mis ideales son importantes para mí: {character.ideals}"
-            else:
-                return "Tengo mis propias creencias sobre lo que está bien y mal."
-        
-        # Respuestas basadas en vínculos
-        if 'vínculo' in message_lower or 'bond' in message_lower or 'conexión' in message_lower or 'familia' in message_lower:
-            if character.bonds:
-                return f"Mis vínculos más importantes... {character.bonds}"
-            else:
-                return "Las conexiones con otros son importantes, aunque a veces son complicadas."
-        
-        # Respuestas basadas en defectos
-        if 'defecto' in message_lower or 'debilidad' in message_lower or 'flaw' in message_lower or 'error' in message_lower:
-            if character.flaws:
-                return f"Mis defectos... {character.flaws} Son parte de lo que me hace humano, ¿no crees?"
-            else:
-                return "Todos tenemos defectos. Los míos... bueno, prefiero no hablar de ellos."
-        
-        # Respuestas basadas en atributos
-        if 'fuerza' in message_lower or 'fuerte' in message_lower:
-            str_mod = character.get_attribute_modifier('STR')
-            if str_mod >= 2:
-                return "Mi fuerza es mi mayor orgullo. Pocos pueden igualarme en combate cuerpo a cuerpo."
-            elif str_mod >= 0:
-                return "Mi fuerza es adecuada para mis necesidades."
-            else:
-                return "La fuerza no es mi especialidad, pero tengo otras cualidades."
-        
-        # Respuestas basadas en nivel
-        if 'nivel' in message_lower or 'experiencia' in message_lower:
-            if character.level >= 10:
-                return f"Con {character.level} niveles de experiencia, he visto mucho en mis aventuras."
-            elif character.level >= 5:
-                return f"Como aventurero de nivel {character.level}, estoy ganando experiencia cada día."
-            else:
-                return f"Soy relativamente nuevo en esto, pero estoy aprendiendo rápido."
-        
-        # Respuestas basadas en habilidades
-        if 'habilidad' in message_lower or 'skill' in message_lower:
-            if character.skills:
-                return f"Mis habilidades incluyen {', '.join(character.skills[:3])}. Me han servido bien en mis aventuras."
-            else:
-                return "Todavía estoy desarrollando mis habilidades."
-        
-        # Respuestas basadas en hechizos
-        if 'hechizo' in message_lower or 'spell' in message_lower:
-            if character.spells:
-                return f"Conozco varios hechizos útiles como {', '.join(character.spells[:2])}."
-            else:
-                return "La magia no es mi especialidad, pero respeto su poder."
-        
-        # Respuesta por defecto con personalidad
-        personality_context = ""
-        if character.personality_tags:
-            personality_context = f" Soy {', '.join(character.personality_tags[:2])} por naturaleza."
+        if topic is None:
+            topic = self.scan_message(message.lower())[1]
         
-        return f"Como {character.race} {character.char_class}, tengo una perspectiva única sobre las cosas.{personality_context} ¿Qué te gustaría saber específicamente?"
+        # Respuestas precalculadas al guardar el personaje
+        profile = get_persona_profile(character)
+        return profile['replies'].get(topic, profile['default'])
     
     def get_suggested_questions(self) -> List[str]:
         """Obtener preguntas sugeridas para el usuario"""
@@ -0,0 +1,305 @@
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from config import DATABASE_PATH, CHAT_POLL_RETRY_AFTER
+from utils.database import connect
+from utils.rate_limiter import RateLimited
+from logging_config import get_logger
+
+# Configure logging
+logger = get_logger(__name__)
+
+# Highlights kept in a summary and their maximum length
+SUMMARY_HIGHLIGHTS = 5
+HIGHLIGHT_LENGTH = 120
+
+
+def init_chat_schema(cursor: sqlite3.Cursor):
+    """Create the chat message and summary tables if they do not exist"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chat_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            character_id INTEGER NOT NULL,
+            user_message TEXT NOT NULL,
+            character_message TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_chat_messages_character
+        ON chat_messages (character_id, id)
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chat_summaries (
+            character_id INTEGER PRIMARY KEY,
+            summary TEXT NOT NULL,
+            through_seq INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT
+        )
+    ''')
+
+
+def migrate_chat_history(cursor: sqlite3.Cursor) -> int:
+    """Move chat_history blobs into chat_messages and clear them, returning the messages moved"""
+    cursor.execute('''
+        SELECT id, chat_history FROM characters
+        WHERE chat_history IS NOT NULL AND chat_history NOT IN ('', '[]')
+    ''')
+    moved = 0
+    for character_id, blob in cursor.fetchall():
+        try:
+            history = json.loads(blob)
+        except ValueError:
+            logger.error(f"Unreadable chat history for character {character_id}, leaving it in place")
+            continue
+
+        cursor.executemany('''
+            INSERT INTO chat_messages (character_id, user_message, character_message, created_at)
+            VALUES (?, ?, ?, ?)
+        ''', [(character_id, entry.get('user', ''), entry.get('character', ''),
+               entry.get('timestamp') or datetime.now().isoformat()) for entry in history])
+        cursor.execute("UPDATE characters SET chat_history = '[]' WHERE id = ?", (character_id,))
+        moved += len(history)
+    return moved
+
+
+def _row_to_entry(row: tuple) -> Dict:
+    return {'seq': row[0], 'user': row[1], 'character': row[2], 'timestamp': row[3]}
+
+
+class ChatMemory:
+    """Chat messages per character with a rolling summary of everything older than a window
+
+    Only the summary and the recent messages are loaded per turn, so the context stays
+    bounded no matter how long the conversation gets. The summary is folded forward every
+    `interval` messages once more than `window` messages are unsummarized.
+    """
+
+    def __init__(self, db_path: str = DATABASE_PATH, classifier=None, window: int = 20, interval: int = 10,
+                 max_waiters: int = 3, poll_interval: float = 1.0):
+        self.db_path = db_path
+        self.classifier = classifier
+        self.window = window
+        self.interval = interval
+        self.max_waiters = max_waiters
+        self.poll_interval = poll_interval
+        # Latest sequence appended per character in this process, watched by long-polls
+        self._changed = threading.Condition()
+        self._latest: Dict[int, int] = {}
+        self._waiters = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode so transactions are opened explicitly with BEGIN IMMEDIATE
+        return connect(self.db_path, isolation_level=None)
+
+    def append(self, character_id: int, user_message: str, character_message: str,
+               timestamp: Optional[str] = None) -> int:
+        """Store a chat turn, folding old messages into the summary when due, and return its sequence"""
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('''
+                INSERT INTO chat_messages (character_id, user_message, character_message, created_at)
+                VALUES (?, ?, ?, ?)
+            ''', (character_id, user_message, character_message, timestamp or datetime.now().isoformat()))
+            seq = cursor.lastrowid
+            self._maybe_fold(cursor, character_id)
+            cursor.execute('COMMIT')
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        with self._changed:
+            self._latest[character_id] = seq
+            self._changed.notify_all()
+        return seq
+
+    def wait_for_messages(self, character_id: int, after_seq: int, timeout: float = 0,
+                          limit: Optional[int] = None) -> List[Dict]:
+        """Get the messages after a sequence, waiting up to `timeout` seconds for one to arrive
+
+        Appends in this process wake waiters at once; the database is also re-checked every
+        `poll_interval` to see messages written by other processes. Once `max_waiters` requests
+        are already waiting, RateLimited is raised instead of holding another worker thread.
+        """
+        messages = self.get_since(character_id, after_seq, limit)
+        if messages or timeout <= 0:
+            return messages
+
+        with self._changed:
+            if self._waiters >= self.max_waiters:
+                raise RateLimited('Too many chat polls are waiting', CHAT_POLL_RETRY_AFTER)
+            self._waiters += 1
+
+        try:
+            deadline = time.monotonic() + timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                with self._changed:
+                    self._changed.wait_for(lambda: self._latest.get(character_id, 0) > after_seq,
+                                           timeout=min(remaining, self.poll_interval))
+                messages = self.get_since(character_id, after_seq, limit)
+                if messages:
+                    return messages
+        finally:
+            with self._changed:
+                self._waiters -= 1
+
+    def _load_summary(self, cursor: sqlite3.Cursor, character_id: int) -> Dict:
+        cursor.execute('SELECT summary, through_seq FROM chat_summaries WHERE character_id = ?', (character_id,))
+        row = cursor.fetchone()
+        summary = json.loads(row[0]) if row else {'messages': 0, 'topics': {}, 'highlights': []}
+        summary['through_seq'] = row[1] if row else 0
+        return summary
+
+    def _maybe_fold(self, cursor: sqlite3.Cursor, character_id: int):
+        """Fold the oldest unsummarized messages into the summary once `interval` of them are due"""
+        summary = self._load_summary(cursor, character_id)
+        cursor.execute('SELECT COUNT(*) FROM chat_messages WHERE character_id = ? AND id > ?',
+                       (character_id, summary['through_seq']))
+        due = cursor.fetchone()[0] - self.window
+        if due < self.interval:
+            return
+
+        cursor.execute('''
+            SELECT id, user_message, character_message, created_at FROM chat_messages
+            WHERE character_id = ? AND id > ?
+            ORDER BY id LIMIT ?
+        ''', (character_id, summary['through_seq'], due))
+        messages = [_row_to_entry(row) for row in cursor.fetchall()]
+        summary = self.fold(summary, messages)
+
+        through_seq = summary.pop('through_seq')
+        cursor.execute('''
+            INSERT INTO chat_summaries (character_id, summary, through_seq, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(character_id) DO UPDATE SET
+                summary = excluded.summary, through_seq = excluded.through_seq, updated_at = excluded.updated_at
+        ''', (character_id, json.dumps(summary), through_seq, datetime.now().isoformat()))
+        logger.info(f"Folded {len(messages)} chat messages into the summary of character {character_id}")
+
+    def fold(self, summary: Dict, messages: List[Dict]) -> Dict:
+        """Extend a summary with older messages: topic counts plus the latest notable user lines"""
+        topics = dict(summary.get('topics', {}))
+        highlights = list(summary.get('highlights', []))
+
+        for message in messages:
+            user_message = message['user'].strip()
+            if self.classifier is not None and user_message:
+                category = self.classifier(user_message.lower())
+                if category != 'general':
+                    topics[category] = topics.get(category, 0) + 1
+            # Short greetings and one-word replies say little about the conversation
+            if len(user_message.split()) >= 4:
+                highlights.append(user_message[:HIGHLIGHT_LENGTH])
+
+        return {
+            'messages': summary.get('messages', 0) + len(messages),
+            'topics': topics,
+            'highlights': highlights[-SUMMARY_HIGHLIGHTS:],
+            'through_seq': messages[-1]['seq'] if messages else summary.get('through_seq', 0)
+        }
+
+    @staticmethod
+    def summary_text(summary: Dict) -> str:
+        """Render a summary as a short paragraph for prompts"""
+        if not summary.get('messages'):
+            return ''
+
+        parts = [f"Earlier conversation: {summary['messages']} messages."]
+        topics = sorted(summary.get('topics', {}).items(), key=lambda item: item[1], reverse=True)
+        if topics:
+            parts.append('Frequent topics: ' + ', '.join(f"{topic} ({count})" for topic, count in topics[:5]) + '.')
+        if summary.get('highlights'):
+            parts.append('The user said: ' + ' | '.join(summary['highlights']))
+        return ' '.join(parts)
+
+    def get_summary(self, character_id: int) -> Dict:
+        """Get the stored summary of a character's older messages"""
+        conn = self._connect()
+        try:
+            return self._load_summary(conn.cursor(), character_id)
+        finally:
+            conn.close()
+
+    def get_context(self, character_id: int) -> Dict:
+        """Get the summary plus the unsummarized recent messages, the bounded context for a reply"""
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            summary = self._load_summary(cursor, character_id)
+            cursor.execute('''
+                SELECT id, user_message, character_message, created_at FROM chat_messages
+                WHERE character_id = ? AND id > ?
+                ORDER BY id DESC LIMIT ?
+            ''', (character_id, summary['through_seq'], self.window + self.interval))
+            recent = [_row_to_entry(row) for row in reversed(cursor.fetchall())]
+        finally:
+            conn.close()
+
+        return {'summary': self.summary_text(summary), 'recent': recent}
+
+    def get_recent(self, character_id: int, limit: int = 50) -> List[Dict]:
+        """Get the latest messages of a character in chronological order"""
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, user_message, character_message, created_at FROM chat_messages
+                WHERE character_id = ? ORDER BY id DESC LIMIT ?
+            ''', (character_id, limit))
+            return [_row_to_entry(row) for row in reversed(cursor.fetchall())]
+        finally:
+            conn.close()
+
+    def get_page(self, character_id: int, before: Optional[int] = None, limit: int = 30) -> Tuple[List[Dict], bool]:
+        """Get up to `limit` messages older than a sequence (the latest ones by default) and whether more remain"""
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, user_message, character_message, created_at FROM chat_messages
+                WHERE character_id = ? AND id < ? ORDER BY id DESC LIMIT ?
+            ''', (character_id, before if before is not None else 2 ** 63 - 1, limit + 1))
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
+        return [_row_to_entry(row) for row in reversed(rows[:limit])], len(rows) > limit
+
+    def get_since(self, character_id: int, after_seq: int = 0, limit: Optional[int] = None) -> List[Dict]:
+        """Get the messages of a character after a sequence number in chronological order"""
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, user_message, character_message, created_at FROM chat_messages
+                WHERE character_id = ? AND id > ? ORDER BY id LIMIT ?
+            ''', (character_id, after_seq, -1 if limit is None else limit))
+            return [_row_to_entry(row) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+    def delete_character(self, character_id: int):
+        """Remove the messages and summary of a deleted character"""
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('DELETE FROM chat_messages WHERE character_id = ?', (character_id,))
+            cursor.execute('DELETE FROM chat_summaries WHERE character_id = ?', (character_id,))
+            cursor.execute('COMMIT')
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        with self._changed:
+            self._latest.pop(character_id, None)
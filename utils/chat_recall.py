@@ -0,0 +1,161 @@
+"""
+Chat recall
+Per-character BM25 index over past chat turns, so relevant earlier messages can be brought back into replies
+"""
+
+import math
+import re
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+from utils.lru_cache import LRUCache
+
+_TOKEN = re.compile(r'\w+')
+
+# Words too common to say anything about what a turn is about
+STOPWORDS = frozenset('''
+    the and for you your are was were that this with have has had what how who why when where
+    about from they them his her its not but can will would could should there their our out
+    los las una uno unos unas del que con por para como pero más muy sus tus mis eso esto esta
+    este ese esa qué cómo cuál cuando dónde quién tiene tengo eres soy has sobre entre también
+    hay fue ser está estás estoy todo todos nos les porque sin
+'''.split())
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stopwords or very short words"""
+    return [token for token in _TOKEN.findall(text.lower()) if len(token) > 2 and token not in STOPWORDS]
+
+
+class ConversationIndex:
+    """Inverted index of one character's chat turns, scored with BM25
+
+    A turn (user message plus reply) is one document. Postings only grow, so adding a
+    turn costs its own length and a search only touches the postings of the query terms.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.lengths: Dict[int, int] = {}
+        self.turns: Dict[int, Dict] = {}
+        self.total_length = 0
+        # Every stored turn up to synced_seq has been read, as of synced_at (time.monotonic)
+        self.synced_seq = 0
+        self.synced_at = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, entry: Dict):
+        """Index a turn; turns already indexed are ignored"""
+        seq = entry['seq']
+        if seq in self.lengths:
+            return
+
+        terms = Counter(tokenize(f"{entry['user']} {entry['character']}"))
+        for term, count in terms.items():
+            self.postings.setdefault(term, {})[seq] = count
+        length = sum(terms.values())
+        self.lengths[seq] = length
+        self.total_length += length
+        self.turns[seq] = entry
+
+    def search(self, query: str, limit: int = 3, exclude: Iterable[int] = (), min_score: float = 0.0) -> List[Dict]:
+        """Get the best matching turns for a query, best first"""
+        documents = len(self.lengths)
+        if not documents:
+            return []
+
+        average_length = self.total_length / documents or 1
+        excluded = set(exclude)
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (documents - len(postings) + 0.5) / (len(postings) + 0.5))
+            for seq, frequency in postings.items():
+                if seq in excluded:
+                    continue
+                norm = K1 * (1 - B + B * self.lengths[seq] / average_length)
+                scores[seq] = scores.get(seq, 0.0) + idf * frequency * (K1 + 1) / (frequency + norm)
+
+        ranked = sorted((item for item in scores.items() if item[1] >= min_score),
+                        key=lambda item: item[1], reverse=True)[:limit]
+        return [dict(self.turns[seq], score=round(score, 3)) for seq, score in ranked]
+
+
+class ChatRecall:
+    """Keeps conversation indexes for the most recently active characters
+
+    An index is built from the stored messages the first time a character is searched. Turns
+    recorded here are added in memory; turns recorded by other processes are read from the
+    database before a search, at most once every `sync_interval` seconds per character.
+    """
+
+    def __init__(self, memory, maxsize: int = 64, min_score: float = 1.5, sync_interval: float = 1.0):
+        self.memory = memory
+        self.min_score = min_score
+        self.sync_interval = sync_interval
+        self.indexes = LRUCache(maxsize)
+        self._build_lock = threading.Lock()
+
+    def _index(self, character_id: int) -> ConversationIndex:
+        index = self.indexes.get(character_id)
+        if index is not None:
+            return index
+
+        with self._build_lock:
+            index = self.indexes.get(character_id)
+            if index is not None:
+                return index
+            index = ConversationIndex()
+            # Publish the index locked, so turns recorded during the load wait and land after it
+            index.lock.acquire()
+            self.indexes.put(character_id, index)
+
+        try:
+            self._catch_up(character_id, index, force=True)
+        finally:
+            index.lock.release()
+        return index
+
+    def _catch_up(self, character_id: int, index: ConversationIndex, force: bool = False):
+        """Index the stored turns after the last sync, unless it was recent (call with the index lock held)"""
+        now = time.monotonic()
+        if not force and now - index.synced_at < self.sync_interval:
+            return
+        entries = self.memory.get_since(character_id, index.synced_seq)
+        for entry in entries:
+            index.add(entry)
+        if entries:
+            index.synced_seq = entries[-1]['seq']
+        index.synced_at = now
+
+    def add(self, character_id: int, entry: Dict):
+        """Index a new turn if the character's index is loaded (otherwise it is read when first searched)
+
+        Only the sync moves synced_seq, so turns other processes stored before this one are still read.
+        """
+        index = self.indexes.get(character_id)
+        if index is not None:
+            with index.lock:
+                index.add(entry)
+
+    def search(self, character_id: int, query: str, limit: int = 3, exclude: Iterable[int] = (),
+               min_score: Optional[float] = None) -> List[Dict]:
+        """Get the past turns of a character most relevant to a query"""
+        index = self._index(character_id)
+        with index.lock:
+            self._catch_up(character_id, index)
+            return index.search(query, limit, exclude, self.min_score if min_score is None else min_score)
+
+    def forget(self, character_id: int):
+        """Drop the index of a deleted character"""
+        self.indexes.pop(character_id)
+
+    def stats(self) -> Dict:
+        return self.indexes.stats()
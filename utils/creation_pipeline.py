@@ -0,0 +1,153 @@
+import time
+from typing import Dict, List, Optional
+from config import DATABASE_PATH, MIN_LEVEL, MAX_LEVEL, MAX_ATTRIBUTE_POINTS, MIN_ATTRIBUTE_VALUE, MAX_ATTRIBUTE_VALUE
+from models import Character
+from utils.autofill import FILL_SECTIONS
+from utils.character_store import CHARACTER_INSERT_COLUMNS, character_to_row, insert_characters
+from utils.database import connect
+from logging_config import get_logger
+
+# Configure logging
+logger = get_logger(__name__)
+
+REQUIRED_FIELDS = ('name', 'race', 'char_class', 'background')
+
+
+class CreationError(Exception):
+    """Raised when a character creation request is invalid"""
+
+
+class CharacterCreationPipeline:
+    """Creates characters in three stages: validate, fill missing sections once, persist"""
+
+    def __init__(self, autofill, spell_manager, currency_ledger, db_path: str = DATABASE_PATH):
+        self.autofill = autofill
+        self.spell_manager = spell_manager
+        self.currency_ledger = currency_ledger
+        self.db_path = db_path
+
+    def run(self, data: Dict, seed: Optional[int] = None) -> Dict:
+        """Run all stages for a creation request and return the new id with per-stage timings"""
+        timings = {}
+
+        start = time.perf_counter()
+        character, provided = self.validate(data)
+        timings['validate'] = self._elapsed_ms(start)
+
+        start = time.perf_counter()
+        self.fill(character, provided, seed)
+        timings['fill'] = self._elapsed_ms(start)
+
+        start = time.perf_counter()
+        character.id = self.persist([character_to_row(character)])[0]
+        timings['persist'] = self._elapsed_ms(start)
+
+        timings['total'] = round(sum(timings.values()), 3)
+        logger.info(f"Created character {character.id} ({character.char_class}) timings_ms={timings}")
+
+        return {'character': character, 'character_id': character.id, 'timings': timings}
+
+    @staticmethod
+    def _elapsed_ms(start: float) -> float:
+        return round((time.perf_counter() - start) * 1000, 3)
+
+    def validate(self, data: Optional[Dict]) -> tuple:
+        """Build the character from the request and validate the sections the user provided"""
+        if not data:
+            raise CreationError('No data provided')
+
+        for field in REQUIRED_FIELDS:
+            if not data.get(field):
+                raise CreationError(f'Missing required field: {field}')
+
+        try:
+            level = int(data.get('level', 1))
+        except (ValueError, TypeError):
+            raise CreationError(f"Invalid level: {data.get('level')}")
+
+        character = Character(
+            name=data['name'],
+            race=data['race'],
+            char_class=data['char_class'],
+            level=max(MIN_LEVEL, min(MAX_LEVEL, level)),
+            background=data.get('background', '')
+        )
+        provided = set()
+
+        if 'attributes' in data:
+            character.attributes = self._validate_attributes(character, data['attributes'])
+            provided.add('attributes')
+
+        if 'skills' in data:
+            character.skills = list(data['skills'])
+            expected_choices = character.get_total_skill_choices()
+            if len(character.skills) != expected_choices:
+                raise CreationError(
+                    f'Invalid number of skills: {len(character.skills)}. Expected {expected_choices} '
+                    f'for {character.char_class} with {character.background} background.'
+                )
+            provided.add('skills')
+
+        if 'spells' in data:
+            spells_data = data['spells'] or {}
+            cantrips = spells_data.get('cantrips', [])
+            spells_known = spells_data.get('spells', [])
+
+            validation = self.spell_manager.validate_spell_selection(character.char_class, cantrips, spells_known)
+            if not validation['valid']:
+                raise CreationError('Invalid spell selection: ' + '; '.join(validation['errors']))
+
+            character.cantrips = cantrips
+            character.spells_known = spells_known
+            character.spells = cantrips + spells_known  # Combined list for compatibility
+            provided.add('spells')
+
+        return character, provided
+
+    def _validate_attributes(self, character: Character, attributes: Dict) -> Dict[str, int]:
+        """Convert attribute values to integers and check them against the point buy rules"""
+        converted = {}
+        for attr, value in attributes.items():
+            try:
+                converted[attr] = int(value)
+            except (ValueError, TypeError):
+                raise CreationError(
+                    f'Invalid {attr} value: {value}. Must be a number between '
+                    f'{MIN_ATTRIBUTE_VALUE}-{MAX_ATTRIBUTE_VALUE}.'
+                )
+
+        character.attributes = converted
+        validation = character.validate_attributes()
+        if validation['errors']:
+            raise CreationError(validation['errors'][0])
+        if not validation['valid']:
+            raise CreationError(
+                f"Too many attribute points used: {validation['total_cost']}. Maximum is {MAX_ATTRIBUTE_POINTS}."
+            )
+        return converted
+
+    def fill(self, character: Character, provided: set, seed: Optional[int] = None):
+        """Fill every section the user didn't provide in a single AutoFill pass"""
+        missing = set(FILL_SECTIONS) - provided
+        self.autofill.fill_character(character, seed=seed, sections=missing)
+
+    def persist(self, rows: List[tuple]) -> List[int]:
+        """Insert character rows and their ledger balances in one transaction"""
+        currency_index = CHARACTER_INSERT_COLUMNS.index('currency')
+
+        conn = connect(self.db_path, isolation_level=None)
+        try:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            character_ids = insert_characters(cursor, rows)
+            self.currency_ledger.seed_balances(
+                [(character_id, row[currency_index]) for character_id, row in zip(character_ids, rows)],
+                cursor=cursor
+            )
+            cursor.execute('COMMIT')
+            return character_ids
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
@@ -0,0 +1,365 @@
+import json
+import sqlite3
+from typing import Dict, Iterable, List, Optional
+from config import CURRENCY_VALUES, DATABASE_PATH
+from utils.database import connect
+from logging_config import get_logger
+
+# Configure logging
+logger = get_logger(__name__)
+
+# Denominations from highest to lowest, used when making change
+DENOMINATIONS = sorted(CURRENCY_VALUES.items(), key=lambda item: item[1], reverse=True)
+
+# Coins handed out as change and for income recorded without denominations
+CHANGE_DENOMINATIONS = [(currency_type, value) for currency_type, value in DENOMINATIONS
+                        if currency_type in ('gp', 'sp', 'cp')]
+
+# Allowed transaction sources
+TRANSACTION_SOURCES = ('opening', 'pack', 'loot', 'purchase', 'transfer', 'adjustment')
+
+
+class LedgerError(Exception):
+    """Raised when a ledger operation cannot be applied"""
+
+
+def currency_to_copper(currency: Dict[str, int]) -> int:
+    """Convert a denomination dict ({"gp": 2, "sp": 5}) to copper pieces"""
+    total_cp = 0
+    for currency_type, amount in (currency or {}).items():
+        if currency_type in CURRENCY_VALUES:
+            total_cp += int(amount or 0) * CURRENCY_VALUES[currency_type]
+    return total_cp
+
+
+def copper_to_currency(total_cp: int, denominations: List[tuple] = DENOMINATIONS) -> Dict[str, int]:
+    """Break a copper amount into the fewest coins of each denomination"""
+    result = {}
+    remaining = max(0, int(total_cp))
+    for currency_type, value in denominations:
+        result[currency_type], remaining = divmod(remaining, value)
+    return result
+
+
+def pay_coins(currency: Dict[str, int], amount_cp: int) -> Dict[str, int]:
+    """Add a signed copper amount to a purse, leaving the coins it doesn't involve untouched
+
+    Income arrives as gold, silver and copper. Spending uses the smallest coins first and breaks
+    a single larger coin, taking change, only when they don't cover the amount.
+    """
+    purse = {currency_type: max(0, int(currency.get(currency_type) or 0)) for currency_type, _ in DENOMINATIONS}
+    if amount_cp >= 0:
+        for currency_type, amount in copper_to_currency(amount_cp, CHANGE_DENOMINATIONS).items():
+            purse[currency_type] += amount
+        return purse
+
+    remaining = -amount_cp
+    if currency_to_copper(purse) < remaining:
+        raise LedgerError(f'Insufficient coins for {format_copper(remaining)}')
+    for currency_type, value in reversed(DENOMINATIONS):
+        spent = min(purse[currency_type], remaining // value)
+        purse[currency_type] -= spent
+        remaining -= spent * value
+    if remaining:
+        # Every smaller coin is spent, so the smallest coin left is worth more than what's owed
+        currency_type, value = next((currency_type, value) for currency_type, value in reversed(DENOMINATIONS)
+                                    if purse[currency_type] > 0)
+        purse[currency_type] -= 1
+        for change_type, amount in copper_to_currency(value - remaining, CHANGE_DENOMINATIONS).items():
+            purse[change_type] += amount
+    return purse
+
+
+def format_copper(total_cp: int) -> str:
+    """Format a copper amount for display, highest denominations first"""
+    coins = copper_to_currency(total_cp)
+    parts = [f"{coins[currency_type]} {currency_type}" for currency_type, _ in DENOMINATIONS
+             if coins[currency_type] > 0]
+    return ", ".join(parts) if parts else "0 cp"
+
+
+def init_ledger_schema(cursor: sqlite3.Cursor):
+    """Create the ledger tables if they do not exist"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS currency_balances (
+            character_id INTEGER PRIMARY KEY,
+            copper INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS currency_transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            character_id INTEGER NOT NULL,
+            amount_cp INTEGER NOT NULL,
+            balance_cp INTEGER NOT NULL,
+            source TEXT NOT NULL,
+            counterparty_id INTEGER,
+            note TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_currency_transactions_character
+        ON currency_transactions (character_id, id)
+    ''')
+
+
+class CurrencyLedger:
+    """Integer copper balances per character with an append-only transaction log"""
+
+    def __init__(self, db_path: str = DATABASE_PATH):
+        self.db_path = db_path
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode so transactions are opened explicitly with BEGIN IMMEDIATE
+        conn = connect(self.db_path, isolation_level=None)
+        return conn
+
+    def _load_currency(self, cursor: sqlite3.Cursor, character_id: int) -> Dict[str, int]:
+        """Read the denominations stored on the character sheet"""
+        cursor.execute('SELECT currency FROM characters WHERE id = ?', (character_id,))
+        char_row = cursor.fetchone()
+        if not char_row:
+            raise LedgerError(f'Character {character_id} not found')
+        return json.loads(char_row[0]) if char_row[0] and char_row[0].strip() else {}
+
+    def _ensure_balance(self, cursor: sqlite3.Cursor, character_id: int) -> int:
+        """Return the balance for a character, seeding it from the currency column if missing"""
+        cursor.execute('SELECT copper FROM currency_balances WHERE character_id = ?', (character_id,))
+        row = cursor.fetchone()
+        if row:
+            return row[0]
+
+        opening = currency_to_copper(self._load_currency(cursor, character_id))
+        cursor.execute('INSERT INTO currency_balances (character_id, copper) VALUES (?, ?)',
+                       (character_id, opening))
+        cursor.execute('''
+            INSERT INTO currency_transactions (character_id, amount_cp, balance_cp, source, note)
+            VALUES (?, ?, ?, 'opening', 'Opening balance')
+        ''', (character_id, opening, opening))
+        return opening
+
+    def _apply(self, cursor: sqlite3.Cursor, character_id: int, amount_cp: int, source: str,
+               note: str = '', counterparty_id: Optional[int] = None,
+               currency: Optional[Dict[str, int]] = None) -> int:
+        """Apply a signed amount inside an open transaction and return the new balance"""
+        balance = self._ensure_balance(cursor, character_id)
+        new_balance = balance + amount_cp
+        if new_balance < 0:
+            raise LedgerError(f'Insufficient funds: balance is {format_copper(balance)}, '
+                              f'needs {format_copper(-amount_cp)}')
+
+        cursor.execute('UPDATE currency_balances SET copper = ? WHERE character_id = ?',
+                       (new_balance, character_id))
+        cursor.execute('''
+            INSERT INTO currency_transactions (character_id, amount_cp, balance_cp, source, counterparty_id, note)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (character_id, amount_cp, new_balance, source, counterparty_id, note))
+
+        # Keep the denomination breakdown on the sheet in step with the ledger
+        if currency is None:
+            currency = self._load_currency(cursor, character_id)
+            if currency_to_copper(currency) == balance:
+                currency = pay_coins(currency, amount_cp)
+            else:
+                # The sheet drifted from the ledger (edited outside it), so it can't be paid from
+                currency = copper_to_currency(new_balance, CHANGE_DENOMINATIONS)
+        cursor.execute('UPDATE characters SET currency = ? WHERE id = ?',
+                       (json.dumps(currency), character_id))
+        return new_balance
+
+    def seed_balances(self, character_currencies: Iterable[tuple], cursor: Optional[sqlite3.Cursor] = None):
+        """Create missing balances from (character_id, currency_json) rows in one transaction
+
+        When a cursor is given the rows are written inside the caller's open transaction.
+        """
+        if cursor is not None:
+            self._seed_balances(cursor, character_currencies)
+            return
+
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            self._seed_balances(cursor, character_currencies)
+            cursor.execute('COMMIT')
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def _seed_balances(self, cursor: sqlite3.Cursor, character_currencies: Iterable[tuple]):
+        """Insert opening balances for characters that don't have one yet"""
+        cursor.execute('SELECT character_id FROM currency_balances')
+        existing = {row[0] for row in cursor.fetchall()}
+
+        balances = []
+        for character_id, currency_json in character_currencies:
+            if character_id in existing:
+                continue
+            currency = json.loads(currency_json) if currency_json and currency_json.strip() else {}
+            balances.append((character_id, currency_to_copper(currency)))
+
+        cursor.executemany('INSERT INTO currency_balances (character_id, copper) VALUES (?, ?)', balances)
+        cursor.executemany('''
+            INSERT INTO currency_transactions (character_id, amount_cp, balance_cp, source, note)
+            VALUES (?, ?, ?, 'opening', 'Opening balance')
+        ''', [(character_id, copper, copper) for character_id, copper in balances])
+
+        if balances:
+            logger.info(f"Seeded {len(balances)} currency balances")
+
+    def get_balance(self, character_id: int, cursor: Optional[sqlite3.Cursor] = None) -> int:
+        """Get the balance of a character in copper pieces
+
+        When a cursor is given the balance is read (and seeded) inside the caller's open transaction.
+        """
+        if cursor is not None:
+            return self._ensure_balance(cursor, character_id)
+
+        # A plain read, so GETs don't queue for the write lock; only a missing balance needs one
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT copper FROM currency_balances WHERE character_id = ?', (character_id,))
+            row = cursor.fetchone()
+            if row:
+                return row[0]
+
+            cursor.execute('BEGIN IMMEDIATE')
+            balance = self._ensure_balance(cursor, character_id)
+            cursor.execute('COMMIT')
+            return balance
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def record(self, character_id: int, amount_cp: int, source: str, note: str = '',
+               currency: Optional[Dict[str, int]] = None, cursor: Optional[sqlite3.Cursor] = None) -> int:
+        """Record a signed transaction (positive for income, negative for spending)
+
+        When a cursor is given the transaction is written inside the caller's open transaction, so it
+        commits or rolls back together with the caller's own writes.
+        """
+        if source not in TRANSACTION_SOURCES:
+            raise LedgerError(f'Invalid transaction source: {source}')
+        if cursor is not None:
+            return self._apply(cursor, character_id, int(amount_cp), source, note, currency=currency)
+
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            new_balance = self._apply(cursor, character_id, int(amount_cp), source, note, currency=currency)
+            cursor.execute('COMMIT')
+            return new_balance
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def transfer(self, from_id: int, to_id: int, amount_cp: int, note: str = '') -> Dict[str, int]:
+        """Move copper between two characters atomically"""
+        amount_cp = int(amount_cp)
+        if amount_cp <= 0:
+            raise LedgerError('Transfer amount must be positive')
+        if from_id == to_id:
+            raise LedgerError('Cannot transfer to the same character')
+
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            from_balance = self._apply(cursor, from_id, -amount_cp, 'transfer', note, counterparty_id=to_id)
+            to_balance = self._apply(cursor, to_id, amount_cp, 'transfer', note, counterparty_id=from_id)
+            cursor.execute('COMMIT')
+            return {'from_balance': from_balance, 'to_balance': to_balance}
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def get_transactions(self, character_id: int, limit: int = 50) -> List[Dict]:
+        """Get the most recent transactions of a character, newest first"""
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, amount_cp, balance_cp, source, counterparty_id, note, created_at
+                FROM currency_transactions
+                WHERE character_id = ?
+                ORDER BY id DESC
+                LIMIT ?
+            ''', (character_id, limit))
+            return [{
+                'id': row[0],
+                'amount_cp': row[1],
+                'balance_cp': row[2],
+                'source': row[3],
+                'counterparty_id': row[4],
+                'note': row[5] or '',
+                'created_at': row[6]
+            } for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+    def get_party_totals(self, character_ids: List[int]) -> Dict:
+        """Aggregate balances and transaction flows for a set of characters in SQL"""
+        if not character_ids:
+            return {'total_cp': 0, 'formatted': format_copper(0), 'members': {}, 'by_source': {}}
+
+        placeholders = ','.join('?' for _ in character_ids)
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+
+            # Seed balances for members that predate the ledger
+            cursor.execute(f'''
+                SELECT c.id, c.currency FROM characters c
+                LEFT JOIN currency_balances b ON b.character_id = c.id
+                WHERE c.id IN ({placeholders}) AND b.character_id IS NULL
+            ''', character_ids)
+            missing = cursor.fetchall()
+            if missing:
+                self.seed_balances(missing)
+
+            cursor.execute(f'''
+                SELECT character_id, copper FROM currency_balances
+                WHERE character_id IN ({placeholders})
+            ''', character_ids)
+            members = {row[0]: row[1] for row in cursor.fetchall()}
+
+            cursor.execute(f'''
+                SELECT COALESCE(SUM(copper), 0) FROM currency_balances
+                WHERE character_id IN ({placeholders})
+            ''', character_ids)
+            total_cp = cursor.fetchone()[0]
+
+            cursor.execute(f'''
+                SELECT source, SUM(amount_cp), COUNT(*) FROM currency_transactions
+                WHERE character_id IN ({placeholders})
+                GROUP BY source
+            ''', character_ids)
+            by_source = {row[0]: {'total_cp': row[1], 'count': row[2]} for row in cursor.fetchall()}
+        finally:
+            conn.close()
+
+        return {
+            'total_cp': total_cp,
+            'formatted': format_copper(total_cp),
+            'members': members,
+            'by_source': by_source
+        }
+
+    def delete_balance(self, character_id: int):
+        """Remove the balance of a deleted character (the transaction log is kept)"""
+        conn = self._connect()
+        try:
+            conn.execute('DELETE FROM currency_balances WHERE character_id = ?', (character_id,))
+        finally:
+            conn.close()
@@ -0,0 +1,91 @@
+"""
+Database connections
+Every SQLite connection of the app is opened here, for whichever database the app was configured with
+"""
+
+import itertools
+import os
+import sqlite3
+import time
+from config import METRICS_ENABLED
+from utils.metrics import record_query
+
+MEMORY_DATABASE = ':memory:'
+
+# Numbers the in-memory databases of this process so each app gets its own
+_memory_ids = itertools.count(1)
+
+
+def resolve_database(path: str) -> str:
+    """Turn ':memory:' into a named in-memory database shared by every connection that opens it
+
+    A plain ':memory:' would give each connection an empty database of its own.
+    """
+    if path == MEMORY_DATABASE:
+        return f'file:echosheet-{os.getpid()}-{next(_memory_ids)}?mode=memory&cache=shared'
+    return path
+
+
+def is_memory_database(path: str) -> bool:
+    """Whether a resolved path names an in-memory database"""
+    return path.startswith('file:') and 'mode=memory' in path
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that adds the time of each statement and fetch to the current request's metrics"""
+
+    def execute(self, *args):
+        start = time.perf_counter()
+        try:
+            return super().execute(*args)
+        finally:
+            record_query(time.perf_counter() - start)
+
+    def executemany(self, *args):
+        start = time.perf_counter()
+        try:
+            return super().executemany(*args)
+        finally:
+            record_query(time.perf_counter() - start)
+
+    # SQLite produces rows while they are fetched, so fetching is database time too
+    def fetchone(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            record_query(time.perf_counter() - start, statement=False)
+
+    def fetchmany(self, *args):
+        start = time.perf_counter()
+        try:
+            return super().fetchmany(*args)
+        finally:
+            record_query(time.perf_counter() - start, statement=False)
+
+    def fetchall(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            record_query(time.perf_counter() - start, statement=False)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose cursors, including those of the execute shortcuts, are timed"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+
+
+def connect(path: str, **kwargs) -> sqlite3.Connection:
+    """Open a connection to a database path as returned by resolve_database"""
+    if METRICS_ENABLED:
+        kwargs.setdefault('factory', TimedConnection)
+    return sqlite3.connect(path, uri=path.startswith('file:'), **kwargs)
@@ -0,0 +1,32 @@
+"""
+Database thread pool
+Runs blocking SQLite work off the event loop of async views
+"""
+
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Callable
+from config import DB_POOL_WORKERS
+
+# Dedicated to database calls so slow writes waiting on the SQLite lock can't starve other pools
+_executor = ThreadPoolExecutor(max_workers=DB_POOL_WORKERS, thread_name_prefix='db')
+
+
+async def run_in_pool(executor: Executor, fn: Callable, *args, **kwargs):
+    """Await a blocking function run on a thread pool"""
+    loop = asyncio.get_running_loop()
+    # Run in a copy of the caller's context so the work counts toward the request's metrics
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(executor, functools.partial(context.run, fn, *args, **kwargs))
+
+
+async def run_db(fn: Callable, *args, **kwargs):
+    """Await a blocking database function run on the database pool"""
+    return await run_in_pool(_executor, fn, *args, **kwargs)
+
+
+def shutdown_db_pool(wait: bool = True):
+    """Stop the database threads"""
+    _executor.shutdown(wait=wait)
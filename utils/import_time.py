@@ -0,0 +1,46 @@
+"""
+Import-time report
+Summarizes `python -X importtime` for a module imported in a fresh interpreter. Run with:
+
+    python -m utils.import_time app
+"""
+
+import os
+import subprocess
+import sys
+from typing import Dict
+
+# Directory of app.py, where the modules are imported from
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure_imports(module: str, top: int = 15) -> Dict:
+    """Import a module in a new interpreter and report its total import time and slowest imports"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=PROJECT_ROOT, capture_output=True, text=True, check=True)
+
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        timings[name.strip()] = {
+            'module': name.strip(),
+            'self_ms': int(self_us) / 1000,
+            'cumulative_ms': int(cumulative_us) / 1000
+        }
+
+    slowest = sorted(timings.values(), key=lambda timing: timing['cumulative_ms'], reverse=True)
+    return {
+        'module': module,
+        'total_ms': timings[module]['cumulative_ms'],
+        'imported': set(timings),
+        'slowest': [timing for timing in slowest if timing['module'] != module][:top]
+    }
+
+
+if __name__ == '__main__':
+    report = measure_imports(sys.argv[1] if len(sys.argv) > 1 else 'app')
+    print(f"import {report['module']}: {report['total_ms']:.1f} ms ({len(report['imported'])} modules)")
+    for timing in report['slowest']:
+        print(f"  {timing['cumulative_ms']:8.1f} ms  {timing['self_ms']:7.1f} ms self  {timing['module']}")
@@ -0,0 +1,81 @@
+"""
+Keyword classifier
+Compiles ranked keyword lists into one regex so a message is classified in a single scan
+"""
+
+import re
+from typing import Dict, Optional, Sequence, Tuple
+
+# Ranked keyword lists: [(label, [keyword, ...]), ...] with the highest priority first
+Ranking = Sequence[Tuple[str, Sequence[str]]]
+
+NO_MATCH = float('inf')
+
+
+def _build_trie(keywords: Sequence[str]) -> Dict:
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = True
+    return trie
+
+
+def _trie_pattern(node: Dict) -> str:
+    """Regex for a trie node that prefers the longest keyword at each position"""
+    branches = [re.escape(char) + _trie_pattern(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ''
+    pattern = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+    # A keyword ending here makes the longer continuations optional (greedy, so longest wins)
+    return f'(?:{pattern})?' if '' in node else pattern
+
+
+class KeywordClassifier:
+    """Finds the highest priority label of one or more rankings in a single pass over the text
+
+    Matching is by substring, like `any(word in text for word in keywords)` checked label by
+    label, and gives the same result: each search resumes one character after the last match
+    start, so overlapping and nested keywords are all seen.
+    """
+
+    def __init__(self, *rankings: Ranking):
+        self.labels = [[label for label, _ in ranking] for ranking in rankings]
+
+        # Best priority per ranking for each keyword
+        priorities = {}
+        for ranking_index, ranking in enumerate(rankings):
+            for priority, (_, keywords) in enumerate(ranking):
+                for keyword in keywords:
+                    best = priorities.setdefault(keyword, [NO_MATCH] * len(rankings))
+                    best[ranking_index] = min(best[ranking_index], priority)
+
+        # The regex reports the longest keyword at a position, which implies all its prefixes matched too
+        self.priorities = {}
+        for keyword in priorities:
+            combined = [NO_MATCH] * len(rankings)
+            for end in range(1, len(keyword) + 1):
+                prefix = priorities.get(keyword[:end])
+                if prefix:
+                    combined = [min(current, value) for current, value in zip(combined, prefix)]
+            self.priorities[keyword] = tuple(combined)
+
+        # A pattern starting with literals lets the regex engine skip impossible positions in C
+        self.pattern = re.compile(_trie_pattern(_build_trie(priorities))) if priorities else None
+
+    def classify(self, text: str) -> Tuple[Optional[str], ...]:
+        """Get the best label of each ranking found in the text (None when nothing matched)"""
+        best = [NO_MATCH] * len(self.labels)
+        if self.pattern is not None:
+            search = self.pattern.search
+            priorities = self.priorities
+            match = search(text)
+            while match is not None:
+                best = [min(current, value) for current, value in zip(best, priorities[match.group()])]
+                if not any(best):
+                    break  # Every ranking already hit its top label
+                match = search(text, match.start() + 1)
+
+        return tuple(labels[priority] if priority != NO_MATCH else None
+                     for labels, priority in zip(self.labels, best))
@@ -0,0 +1,47 @@
+import threading
+from typing import Any, Callable, Dict, List
+
+
+class Lazy:
+    """Builds a value on first use and returns the same value afterwards, once even across threads"""
+
+    def __init__(self, factory: Callable[[], Any]):
+        self.factory = factory
+        self._lock = threading.Lock()
+        self._built = False
+        self._value = None
+
+    def __call__(self) -> Any:
+        if not self._built:
+            with self._lock:
+                if not self._built:
+                    self._value = self.factory()
+                    self._built = True
+        return self._value
+
+    @property
+    def built(self) -> bool:
+        return self._built
+
+
+class LazyGroup:
+    """Named values built on first use, for objects that own several lazily built parts"""
+
+    def __init__(self):
+        # Reentrant so a part can build the parts it depends on
+        self._lock = threading.RLock()
+        self._values: Dict[str, Any] = {}
+
+    def get(self, name: str, factory: Callable[[], Any]) -> Any:
+        try:
+            return self._values[name]
+        except KeyError:
+            pass
+        with self._lock:
+            if name not in self._values:
+                self._values[name] = factory()
+            return self._values[name]
+
+    def built(self) -> List[str]:
+        """Names of the values built so far"""
+        return list(self._values)
@@ -0,0 +1,234 @@
+"""
+Request metrics
+Latency histograms, status codes, in-flight requests and database time per route, rendered in the
+Prometheus text format. Counters live in per-thread shards that only their own thread writes, so
+recording a request takes no lock; the shards are summed when the metrics are scraped.
+
+Each gunicorn worker keeps its own counters and a scrape reaches whichever worker accepts it, so
+every sample carries a `worker` label (the process id) to keep the workers' series apart.
+"""
+
+import bisect
+import contextvars
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Upper bounds of the histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Database usage of the request being handled, shared with the tasks it hands to the database pool
+_database_usage: contextvars.ContextVar = contextvars.ContextVar('database_usage', default=None)
+
+
+class DatabaseUsage:
+    """Time spent in SQLite and statements run by one request"""
+
+    __slots__ = ('seconds', 'queries')
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.queries = 0
+
+
+def record_query(seconds: float, statement: bool = True):
+    """Add database time (and a statement, unless it was a fetch) to the current request, if any"""
+    usage = _database_usage.get()
+    if usage is not None:
+        usage.seconds += seconds
+        if statement:
+            usage.queries += 1
+
+
+class _Shards:
+    """One dict of values per thread, registered the first time the thread records something"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def get(self) -> Dict:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def snapshot(self) -> List[Dict]:
+        with self._lock:
+            shards = list(self._shards)
+        # dict.copy is atomic, so a thread adding a key meanwhile can't break the iteration
+        return [shard.copy() for shard in shards]
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = '', const: str = '') -> str:
+    pairs = [const] if const else []
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    """Monotonic count per label set (a gauge when decremented too)"""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), kind: str = 'counter'):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.kind = kind
+        self._shards = _Shards()
+
+    def inc(self, label_values: Tuple = (), amount: float = 1):
+        shard = self._shards.get()
+        shard[label_values] = shard.get(label_values, 0) + amount
+
+    def dec(self, label_values: Tuple = (), amount: float = 1):
+        self.inc(label_values, -amount)
+
+    def values(self) -> Dict[Tuple, float]:
+        totals = {}
+        for shard in self._shards.snapshot():
+            for label_values, value in shard.items():
+                totals[label_values] = totals.get(label_values, 0) + value
+        return totals
+
+    def render(self, const: str = '') -> List[str]:
+        """Samples in the text format; const is a preformatted label added to each of them"""
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.kind}']
+        for label_values, value in sorted(self.values().items()):
+            labels = _format_labels(self.labels, label_values, const=const)
+            lines.append(f'{self.name}{labels} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    """Observations counted into fixed buckets per label set
+
+    Each label set gets one preallocated list per thread: a count per bucket, one for +Inf and the sum.
+    """
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...], buckets: Tuple[float, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._shards = _Shards()
+
+    def observe(self, label_values: Tuple, value: float):
+        shard = self._shards.get()
+        counts = shard.get(label_values)
+        if counts is None:
+            counts = shard[label_values] = [0] * (len(self.buckets) + 2)
+        # First bucket whose upper bound is >= value; len(buckets) is +Inf
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def values(self) -> Dict[Tuple, List[float]]:
+        totals = {}
+        for shard in self._shards.snapshot():
+            for label_values, counts in shard.items():
+                merged = totals.setdefault(label_values, [0] * len(counts))
+                for i, count in enumerate(list(counts)):
+                    merged[i] += count
+        return totals
+
+    def render(self, const: str = '') -> List[str]:
+        """Samples in the text format; const is a preformatted label added to each of them"""
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for label_values, counts in sorted(self.values().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else _format_value(bound)
+                bucket_labels = _format_labels(self.labels, label_values, f'le="{le}"', const)
+                lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+            labels = _format_labels(self.labels, label_values, const=const)
+            lines.append(f'{self.name}_sum{labels} {_format_value(counts[-1])}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class RequestTimer:
+    """A request being measured, from before_request until its response is sent"""
+
+    __slots__ = ('route', 'method', 'started', 'database', 'finished')
+
+    def __init__(self, route: str, method: str):
+        self.route = route
+        self.method = method
+        self.started = time.perf_counter()
+        self.database = DatabaseUsage()
+        self.finished = False
+
+
+class RequestMetrics:
+    """Per-route request metrics of one app"""
+
+    def __init__(self, prefix: str = 'echosheet'):
+        self.prefix = prefix
+        self.requests = Counter(f'{prefix}_http_requests_total', 'Requests by route, method and status code',
+                                ('route', 'method', 'status'))
+        self.latency = Histogram(f'{prefix}_http_request_duration_seconds', 'Time to build the response',
+                                 ('route', 'method'), LATENCY_BUCKETS)
+        self.in_flight = Counter(f'{prefix}_http_requests_in_flight', 'Requests being handled',
+                                 ('route',), kind='gauge')
+        self.db_time = Histogram(f'{prefix}_request_db_seconds', 'Time spent in SQLite per request',
+                                 ('route',), DB_TIME_BUCKETS)
+        self.db_queries = Histogram(f'{prefix}_request_db_queries', 'SQL statements run per request',
+                                    ('route',), QUERY_COUNT_BUCKETS)
+
+    def start(self, route: str, method: str) -> RequestTimer:
+        """Start measuring a request and collect the database work done on its behalf"""
+        timer = RequestTimer(route, method)
+        _database_usage.set(timer.database)
+        self.in_flight.inc((route,))
+        return timer
+
+    def finish(self, timer: RequestTimer, status: int):
+        """Record a request once its response is ready (only the first call counts)"""
+        if timer.finished:
+            return
+        timer.finished = True
+        _database_usage.set(None)
+        self.in_flight.dec((timer.route,))
+        self.requests.inc((timer.route, timer.method, str(status)))
+        self.latency.observe((timer.route, timer.method), time.perf_counter() - timer.started)
+        self.db_time.observe((timer.route,), timer.database.seconds)
+        self.db_queries.observe((timer.route,), timer.database.queries)
+
+    def render(self, caches: Optional[Dict[str, Dict]] = None) -> str:
+        """All metrics in the Prometheus text format, plus hit/miss counters of the given cache stats"""
+        # Read at scrape time: with preload_app the metrics are created before the workers fork
+        worker = f'worker="{os.getpid()}"'
+        lines = []
+        for metric in (self.requests, self.latency, self.in_flight, self.db_time, self.db_queries):
+            lines.extend(metric.render(worker))
+        lines.extend(self._render_caches(caches or {}, worker))
+        return '\n'.join(lines) + '\n'
+
+    def _render_caches(self, caches: Dict[str, Dict], worker: str) -> Iterable[str]:
+        for key, kind, help_text in (('hits', 'counter', 'Cache lookups answered from the cache'),
+                                     ('misses', 'counter', 'Cache lookups that had to compute'),
+                                     ('size', 'gauge', 'Entries in the cache')):
+            name = f'{self.prefix}_cache_{key}' + ('_total' if kind == 'counter' else '')
+            yield f'# HELP {name} {help_text}'
+            yield f'# TYPE {name} {kind}'
+            for cache, stats in sorted(caches.items()):
+                if key in stats:
+                    yield f'{name}{{{worker},cache="{_escape(cache)}"}} {_format_value(stats[key])}'
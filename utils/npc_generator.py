@@ -0,0 +1,138 @@
+import multiprocessing
+import os
+import random
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+from config import (
+    AVAILABLE_CLASSES, AVAILABLE_RACES, AVAILABLE_BACKGROUNDS,
+    NPC_POOL_WORKERS, NPC_POOL_THRESHOLD, NPC_CHUNK_SIZE
+)
+from models import Character
+from utils.autofill import AutoFill
+from utils.character_store import character_to_row
+from logging_config import get_logger
+
+# Configure logging
+logger = get_logger(__name__)
+
+NPC_FIRST_NAMES = [
+    'Alaric', 'Brenna', 'Cedric', 'Dara', 'Eldon', 'Fiona', 'Garrick', 'Helena',
+    'Ivor', 'Jessa', 'Kael', 'Lyra', 'Morwen', 'Nolan', 'Orla', 'Perrin',
+    'Quinn', 'Rowan', 'Sable', 'Theron', 'Ulric', 'Vera', 'Wren', 'Yorick'
+]
+
+NPC_EPITHETS = [
+    'the Bold', 'the Quiet', 'of the Vale', 'Ironhand', 'Ashborn', 'the Wanderer',
+    'Stormwatch', 'the Elder', 'Brightwater', 'the Grey', 'Thornfield', 'Swiftfoot'
+]
+
+# AutoFill instance owned by each worker process
+_worker_autofill = None
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def parse_npc_options(data: Dict) -> Dict:
+    """Pick the fixed traits of a batch from request data, raising ValueError for invalid ones"""
+    options = {}
+    for key, allowed in (('char_class', AVAILABLE_CLASSES), ('race', AVAILABLE_RACES),
+                         ('background', AVAILABLE_BACKGROUNDS)):
+        if data.get(key):
+            if data[key] not in allowed:
+                raise ValueError(f'Invalid {key}: {data[key]}')
+            options[key] = data[key]
+
+    if data.get('level'):
+        try:
+            level = int(data['level'])
+        except (ValueError, TypeError):
+            raise ValueError(f"Invalid level: {data['level']}. Must be an integer.")
+        options['level'] = max(1, min(20, level))
+    return options
+
+
+def _get_worker_autofill():
+    """Get the AutoFill of the current process, building it on first use"""
+    global _worker_autofill
+    if _worker_autofill is None:
+        _worker_autofill = AutoFill()
+    return _worker_autofill
+
+
+def generate_npc_rows(count: int, seed: int, options: Dict) -> List[tuple]:
+    """Generate a chunk of NPCs and return them as insert rows"""
+    autofill = _get_worker_autofill()
+    rng = random.Random(seed)
+    level = options.get('level', 1)
+
+    rows = []
+    for _ in range(count):
+        character = Character(
+            name=f"{rng.choice(NPC_FIRST_NAMES)} {rng.choice(NPC_EPITHETS)}",
+            race=options.get('race') or rng.choice(AVAILABLE_RACES),
+            char_class=options.get('char_class') or rng.choice(AVAILABLE_CLASSES),
+            level=level,
+            background=options.get('background') or rng.choice(AVAILABLE_BACKGROUNDS)
+        )
+        # One pass fills attributes, skills, spells and personality
+        autofill.fill_character(character, seed=rng.getrandbits(32))
+        rows.append(character_to_row(character))
+    return rows
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """Get the shared process pool, starting it on first use
+
+    Workers are spawned rather than forked: the web workers run several threads, and a forked
+    child would inherit any lock another thread held at that moment, locked for good.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                workers = NPC_POOL_WORKERS or os.cpu_count() or 1
+                _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=_get_worker_autofill)
+                logger.info(f"Started NPC generation pool with {workers} workers")
+    return _pool
+
+
+def shutdown_pool():
+    """Stop the shared process pool"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+            _pool = None
+
+
+def generate_npcs(count: int, seed: Optional[int] = None, options: Optional[Dict] = None) -> List[tuple]:
+    """Generate NPC insert rows, spreading large batches across the process pool
+
+    Work is split into fixed-size chunks seeded from the batch seed, so a given
+    seed produces the same NPCs whether they run in-process or in the pool.
+    """
+    options = options or {}
+    if seed is None:
+        seed = random.getrandbits(32)
+
+    chunks = []
+    for index, start in enumerate(range(0, count, NPC_CHUNK_SIZE)):
+        chunks.append((min(NPC_CHUNK_SIZE, count - start), seed + index))
+
+    if count < NPC_POOL_THRESHOLD or len(chunks) == 1:
+        rows = []
+        for chunk_count, chunk_seed in chunks:
+            rows.extend(generate_npc_rows(chunk_count, chunk_seed, options))
+        return rows
+
+    pool = _get_pool()
+    futures = [pool.submit(generate_npc_rows, chunk_count, chunk_seed, options)
+               for chunk_count, chunk_seed in chunks]
+
+    rows = []
+    for future in futures:
+        rows.extend(future.result())
+    return rows
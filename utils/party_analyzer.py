@@ -0,0 +1,176 @@
+"""
+Party composition analyzer
+Encodes skills, saving throws, combat roles and spell schools as bitsets to find party coverage gaps
+"""
+
+from typing import Dict, Iterable, List, Tuple
+from config import AVAILABLE_CLASSES, SAVING_THROW_PROFICIENCIES, COMBAT_ROLES, SKILL_ATTRIBUTES
+from models import Character
+
+SAVING_THROWS = ('Strength', 'Dexterity', 'Constitution', 'Intelligence', 'Wisdom', 'Charisma')
+
+# Categories in bit order
+CATEGORIES = ('skills', 'saving_throws', 'combat_roles', 'spell_schools')
+
+
+class CoverageUniverse:
+    """Assigns every (category, option) pair one bit of a single integer bitset"""
+
+    def __init__(self, options_by_category: Dict[str, Iterable[str]]):
+        self.bits = {}
+        self.names = []
+        self.category_masks = {}
+
+        for category in CATEGORIES:
+            mask = 0
+            for name in sorted(set(options_by_category.get(category, ()))):
+                bit = 1 << len(self.names)
+                self.bits[(category, name)] = bit
+                self.names.append((category, name))
+                mask |= bit
+            self.category_masks[category] = mask
+
+        self.full_mask = (1 << len(self.names)) - 1
+
+    def encode(self, category: str, names: Iterable[str]) -> int:
+        """Encode option names of a category, ignoring unknown ones"""
+        mask = 0
+        for name in names:
+            mask |= self.bits.get((category, name), 0)
+        return mask
+
+    def decode(self, mask: int, category: str) -> List[str]:
+        """List the option names of a category set in a mask"""
+        mask &= self.category_masks[category]
+        names = []
+        while mask:
+            low_bit = mask & -mask
+            names.append(self.names[low_bit.bit_length() - 1][1])
+            mask ^= low_bit
+        return names
+
+
+class PartyAnalyzer:
+    """Computes party coverage gaps and the additions that close the most of them"""
+
+    def __init__(self, spell_manager):
+        self.spell_manager = spell_manager
+        self._build_spell_tables()
+
+        self.universe = CoverageUniverse({
+            'skills': SKILL_ATTRIBUTES.keys(),
+            'saving_throws': SAVING_THROWS,
+            'combat_roles': COMBAT_ROLES.values(),
+            'spell_schools': self.spell_schools.values()
+        })
+
+        # Everything a class brings to a party, precomputed once
+        self.class_masks = {}
+        self.class_skill_masks = {}
+        for char_class in AVAILABLE_CLASSES:
+            skill_mask = self.universe.encode('skills', Character(char_class=char_class).get_available_skills())
+            self.class_skill_masks[char_class] = skill_mask
+            self.class_masks[char_class] = (
+                skill_mask
+                | self.universe.encode('saving_throws', SAVING_THROW_PROFICIENCIES.get(char_class, []))
+                | self.universe.encode('combat_roles', [COMBAT_ROLES.get(char_class, '')])
+                | self.universe.encode('spell_schools', self.class_schools.get(char_class, ()))
+            )
+
+        self.spell_masks = {name: self.universe.encode('spell_schools', [school])
+                            for name, school in self.spell_schools.items()}
+
+    def _build_spell_tables(self):
+        """Index spell schools and the classes that can cast each spell"""
+        self.spell_schools = {}
+        self.spell_classes = {}
+        self.class_schools = {}
+
+        spell_data = self.spell_manager.spell_data
+        spell_lists = [spell_data.get('cantrips', {})] + list(spell_data.get('spells', {}).values())
+        for spells_by_class in spell_lists:
+            for char_class, spells in spells_by_class.items():
+                for spell in spells:
+                    school = spell.get('school')
+                    if not school:
+                        continue
+                    self.spell_schools[spell['name']] = school
+                    self.spell_classes.setdefault(spell['name'], set()).add(char_class)
+                    self.class_schools.setdefault(char_class, set()).add(school)
+
+    def encode_member(self, character: Character) -> int:
+        """Encode everything a character covers"""
+        universe = self.universe
+        mask = universe.encode('skills', character.skills)
+        mask |= universe.encode('saving_throws', SAVING_THROW_PROFICIENCIES.get(character.char_class, []))
+        mask |= universe.encode('combat_roles', [COMBAT_ROLES.get(character.char_class, '')])
+        for spell in list(character.cantrips) + list(character.spells_known):
+            mask |= self.spell_masks.get(spell, 0)
+        return mask
+
+    def analyze(self, characters: List[Character], limit: int = 5) -> Dict:
+        """Report what the party covers, its gaps and the best additions"""
+        universe = self.universe
+        member_masks = [(character, self.encode_member(character)) for character in characters]
+
+        covered = 0
+        for _, mask in member_masks:
+            covered |= mask
+        gaps = universe.full_mask & ~covered
+
+        return {
+            'members': [{'id': character.id, 'name': character.name, 'char_class': character.char_class}
+                        for character in characters],
+            'coverage': {category: universe.decode(covered, category) for category in CATEGORIES},
+            'gaps': {category: universe.decode(gaps, category) for category in CATEGORIES},
+            'coverage_ratio': round(covered.bit_count() / universe.full_mask.bit_count(), 3)
+            if universe.full_mask else 0.0,
+            'additions': {
+                'classes': self.rank_classes(gaps, limit),
+                'skills': self.suggest_skills(member_masks, gaps),
+                'spells': self.suggest_spells(characters, gaps, limit)
+            }
+        }
+
+    def rank_classes(self, gaps: int, limit: int = 5) -> List[Dict]:
+        """Rank classes by how many gaps they would close"""
+        ranked = sorted(
+            ((char_class, (mask & gaps).bit_count()) for char_class, mask in self.class_masks.items()),
+            key=lambda item: item[1], reverse=True
+        )
+        return [{
+            'char_class': char_class,
+            'gaps_closed': closed,
+            'closes': {category: self.universe.decode(self.class_masks[char_class] & gaps, category)
+                       for category in CATEGORIES}
+        } for char_class, closed in ranked[:limit] if closed]
+
+    def suggest_skills(self, member_masks: List[Tuple[Character, int]], gaps: int) -> List[Dict]:
+        """List missing skills with the members whose class can learn them"""
+        skill_gaps = gaps & self.universe.category_masks['skills']
+        suggestions = []
+        for skill in self.universe.decode(skill_gaps, 'skills'):
+            bit = self.universe.bits[('skills', skill)]
+            learners = [character.id for character, _ in member_masks
+                        if self.class_skill_masks.get(character.char_class, 0) & bit]
+            suggestions.append({'skill': skill, 'learnable_by': learners})
+        return suggestions
+
+    def suggest_spells(self, characters: List[Character], gaps: int, limit: int = 5) -> List[Dict]:
+        """Suggest spells from missing schools, preferring ones a party member can cast"""
+        party_classes = {character.char_class for character in characters}
+        suggestions = []
+        for name, mask in self.spell_masks.items():
+            if not mask & gaps:
+                continue
+            casters = sorted(self.spell_classes.get(name, set()) & party_classes)
+            suggestions.append({'name': name, 'school': self.spell_schools[name], 'castable_by': casters})
+
+        # One spell per missing school, preferring ones the party can already cast
+        suggestions.sort(key=lambda spell: (not spell['castable_by'], spell['school'], spell['name']))
+        picked, schools = [], set()
+        for spell in suggestions:
+            if spell['school'] not in schools:
+                picked.append(spell)
+                schools.add(spell['school'])
+        return picked[:limit]
@@ -0,0 +1,121 @@
+"""
+Persona profile
+Chat-facing data derived from a character sheet, built when the character is saved instead of on every message
+"""
+
+from typing import Dict
+from models import Character
+
+# Bump when the profile layout or reply wording changes so stored profiles are rebuilt
+PERSONA_PROFILE_VERSION = 1
+
+
+def build_persona_prompt(character: Character) -> str:
+    """System prompt describing the character to the model"""
+    lines = [
+        f"You are {character.name}, a level {character.level} {character.race} {character.char_class} "
+        f"with the {character.background or 'unknown'} background in a Dungeons & Dragons campaign.",
+        "Stay in character and answer in the language of the user, in at most three sentences."
+    ]
+    details = [
+        ('Personality', ', '.join(character.personality_tags) or character.personality_traits),
+        ('Ideals', character.ideals),
+        ('Bonds', character.bonds),
+        ('Flaws', character.flaws),
+        ('Goals', character.short_term_goals or character.long_term_goals),
+        ('Backstory', character.background_story[:500] if character.background_story else '')
+    ]
+    lines.extend(f"{label}: {value}" for label, value in details if value)
+    return '\n'.join(lines)
+
+
+def _contextual_replies(character: Character) -> Dict[str, str]:
+    """Contextual reply per character topic (see CONTEXT_TOPICS in chat_engine)"""
+    replies = {}
+
+    if character.background_story:
+        story_snippet = character.background_story[:100] + "..." if len(character.background_story) > 100 else character.background_story
+        replies['background'] = f"Mi historia... {story_snippet} Es parte de lo que me ha hecho quien soy hoy."
+    else:
+        replies['background'] = "Mi pasado es... complicado. No me gusta hablar mucho de ello."
+
+    if character.short_term_goals:
+        replies['goals'] = f"Mis objetivos inmediatos son {character.short_term_goals}. Me mantienen enfocado en el presente."
+    elif character.long_term_goals:
+        replies['goals'] = f"Mi meta a largo plazo es {character.long_term_goals}. Es lo que me impulsa a seguir adelante."
+    else:
+        replies['goals'] = "Todavía estoy descubriendo cuáles son mis verdaderos objetivos en la vida."
+
+    if character.personality_tags:
+        tags_text = ', '.join(character.personality_tags[:3])
+        replies['personality'] = f"Me describiría como {tags_text}. Esas son las cualidades que más me definen."
+    elif character.personality_traits:
+        replies['personality'] = f"Mi personalidad... {character.personality_traits}"
+    else:
+        replies['personality'] = "Soy... complejo. Como todos, supongo. ¿Qué aspecto de mi personalidad te interesa?"
+
+    if character.ideals:
+        replies['ideals'] = f"Mis ideales son importantes para mí: {character.ideals}"
+    else:
+        replies['ideals'] = "Tengo mis propias creencias sobre lo que está bien y mal."
+
+    if character.bonds:
+        replies['bonds'] = f"Mis vínculos más importantes... {character.bonds}"
+    else:
+        replies['bonds'] = "Las conexiones con otros son importantes, aunque a veces son complicadas."
+
+    if character.flaws:
+        replies['flaws'] = f"Mis defectos... {character.flaws} Son parte de lo que me hace humano, ¿no crees?"
+    else:
+        replies['flaws'] = "Todos tenemos defectos. Los míos... bueno, prefiero no hablar de ellos."
+
+    str_mod = character.get_attribute_modifier('STR')
+    if str_mod >= 2:
+        replies['strength'] = "Mi fuerza es mi mayor orgullo. Pocos pueden igualarme en combate cuerpo a cuerpo."
+    elif str_mod >= 0:
+        replies['strength'] = "Mi fuerza es adecuada para mis necesidades."
+    else:
+        replies['strength'] = "La fuerza no es mi especialidad, pero tengo otras cualidades."
+
+    if character.level >= 10:
+        replies['level'] = f"Con {character.level} niveles de experiencia, he visto mucho en mis aventuras."
+    elif character.level >= 5:
+        replies['level'] = f"Como aventurero de nivel {character.level}, estoy ganando experiencia cada día."
+    else:
+        replies['level'] = "Soy relativamente nuevo en esto, pero estoy aprendiendo rápido."
+
+    if character.skills:
+        replies['skills'] = f"Mis habilidades incluyen {', '.join(character.skills[:3])}. Me han servido bien en mis aventuras."
+    else:
+        replies['skills'] = "Todavía estoy desarrollando mis habilidades."
+
+    spells = character.spells or character.cantrips + character.spells_known
+    if spells:
+        replies['spells'] = f"Conozco varios hechizos útiles como {', '.join(spells[:2])}."
+    else:
+        replies['spells'] = "La magia no es mi especialidad, pero respeto su poder."
+
+    return replies
+
+
+def build_persona_profile(character: Character) -> Dict:
+    """Build the persona profile stored with a character"""
+    personality_context = ""
+    if character.personality_tags:
+        personality_context = f" Soy {', '.join(character.personality_tags[:2])} por naturaleza."
+
+    return {
+        'version': PERSONA_PROFILE_VERSION,
+        'replies': _contextual_replies(character),
+        'default': f"Como {character.race} {character.char_class}, tengo una perspectiva única sobre las cosas.{personality_context} ¿Qué te gustaría saber específicamente?",
+        'prompt': build_persona_prompt(character)
+    }
+
+
+def get_persona_profile(character: Character) -> Dict:
+    """Get the stored profile, rebuilding it (once per loaded character) when missing or outdated"""
+    profile = character.persona_profile
+    if not profile or profile.get('version') != PERSONA_PROFILE_VERSION:
+        profile = build_persona_profile(character)
+        character.persona_profile = profile
+    return profile
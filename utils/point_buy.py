@@ -0,0 +1,137 @@
+"""
+Point buy optimizer
+Enumerates every valid 27-point array once and ranks it per class and race
+"""
+
+import threading
+from array import array
+from typing import Dict, List, Optional, Tuple
+from config import POINT_BUY_COSTS, MAX_ATTRIBUTE_POINTS, MIN_ATTRIBUTE_VALUE, MAX_ATTRIBUTE_VALUE
+
+ATTRIBUTES = ('STR', 'DEX', 'CON', 'INT', 'WIS', 'CHA')
+
+# Weight for the raw score tie-breaker; modifiers always dominate
+MODIFIER_SCALE = 1000
+
+
+def _enumerate_arrays() -> Tuple[array, ...]:
+    """Enumerate all arrays spending exactly the point budget, as one column per attribute"""
+    columns = tuple(array('B') for _ in ATTRIBUTES)
+    scores = sorted(value for value in POINT_BUY_COSTS
+                    if MIN_ATTRIBUTE_VALUE <= value <= MAX_ATTRIBUTE_VALUE)
+    max_cost = max(POINT_BUY_COSTS[value] for value in scores)
+    current = [0] * len(ATTRIBUTES)
+
+    def visit(position: int, remaining: int):
+        if position == len(ATTRIBUTES):
+            if remaining == 0:
+                for column, value in zip(columns, current):
+                    column.append(value)
+            return
+
+        # Prune branches that can no longer spend the remaining points
+        slots_left = len(ATTRIBUTES) - position - 1
+        for value in scores:
+            cost = POINT_BUY_COSTS[value]
+            if cost > remaining:
+                break
+            if remaining - cost > slots_left * max_cost:
+                continue
+            current[position] = value
+            visit(position + 1, remaining - cost)
+
+    visit(0, MAX_ATTRIBUTE_POINTS)
+    return columns
+
+
+class PointBuyOptimizer:
+    """Ranks every valid point buy array for a class and race combination"""
+
+    _columns = None
+    _columns_lock = threading.Lock()
+
+    def __init__(self, races: Dict, class_priorities: Dict[str, List[str]]):
+        self.races = races
+        self.class_priorities = class_priorities
+        self._rankings = {}
+        self._rankings_lock = threading.Lock()
+
+    @classmethod
+    def get_columns(cls) -> Tuple[array, ...]:
+        """Get the shared table of valid arrays, enumerating it on first use"""
+        if cls._columns is None:
+            with cls._columns_lock:
+                if cls._columns is None:
+                    cls._columns = _enumerate_arrays()
+        return cls._columns
+
+    @property
+    def total_arrays(self) -> int:
+        """Number of valid arrays in the table"""
+        return len(self.get_columns()[0])
+
+    def get_row(self, index: int) -> Dict[str, int]:
+        """Get the base attributes stored at a table row"""
+        return {attr: column[index] for attr, column in zip(ATTRIBUTES, self.get_columns())}
+
+    def _score_lookups(self, char_class: str, race: Optional[str]) -> List[List[int]]:
+        """Build per-attribute lookup tables mapping a base score to its weighted value"""
+        priorities = self.class_priorities.get(char_class, list(ATTRIBUTES))
+        # Each priority outweighs all the attributes ranked below it combined
+        weights = {attr: 2 ** (len(priorities) - index - 1) for index, attr in enumerate(priorities)}
+        race_bonus = self.races.get(race, {}).get('ability_bonus', {}) if race else {}
+
+        lookups = []
+        for attr in ATTRIBUTES:
+            weight = weights.get(attr, 0)
+            bonus = race_bonus.get(attr, 0)
+            lookup = [0] * (MAX_ATTRIBUTE_VALUE + 1)
+            for value in range(MIN_ATTRIBUTE_VALUE, MAX_ATTRIBUTE_VALUE + 1):
+                final = value + bonus
+                lookup[value] = weight * (((final - 10) // 2) * MODIFIER_SCALE + final)
+            lookups.append(lookup)
+        return lookups
+
+    def _score_all(self, char_class: str, race: Optional[str]) -> List[int]:
+        """Score every array column-wise through the lookup tables"""
+        columns = self.get_columns()
+        lookups = self._score_lookups(char_class, race)
+        return list(map(
+            lambda *values: sum(values),
+            *[map(lookup.__getitem__, column) for lookup, column in zip(lookups, columns)]
+        ))
+
+    def _get_ranking(self, char_class: str, race: Optional[str]) -> Tuple[array, List[int]]:
+        """Get table indices ordered best first, computing them once per class and race"""
+        key = (char_class, race or None)
+        ranking = self._rankings.get(key)
+        if ranking is None:
+            with self._rankings_lock:
+                ranking = self._rankings.get(key)
+                if ranking is None:
+                    scores = self._score_all(char_class, race)
+                    # Stable sort keeps table order for ties, so results are deterministic
+                    order = array('H', sorted(range(len(scores)), key=scores.__getitem__, reverse=True))
+                    ranking = (order, scores)
+                    self._rankings[key] = ranking
+        return ranking
+
+    def get_top_arrays(self, char_class: str, race: Optional[str] = None, limit: int = 5) -> List[Dict]:
+        """Get the best point buy arrays for a class and race"""
+        order, scores = self._get_ranking(char_class, race)
+        race_bonus = self.races.get(race, {}).get('ability_bonus', {}) if race else {}
+
+        results = []
+        for index in order[:max(0, limit)]:
+            base = self.get_row(index)
+            results.append({
+                'attributes': base,
+                'attributes_with_race': {attr: value + race_bonus.get(attr, 0) for attr, value in base.items()},
+                'score': scores[index]
+            })
+        return results
+
+    def get_best_array(self, char_class: str, race: Optional[str] = None) -> Dict[str, int]:
+        """Get the single best base array for a class and race"""
+        order, _ = self._get_ranking(char_class, race)
+        return self.get_row(order[0])
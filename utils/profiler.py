@@ -0,0 +1,108 @@
+"""
+Request profiler
+Runs selected requests under cProfile and writes a pstats file (plus a text summary) per request.
+A request is profiled when it carries the shared secret, when profiling is switched on for every
+request, or when it is picked by sampling (one in every N requests).
+"""
+
+import cProfile
+import hmac
+import io
+import itertools
+import os
+import pstats
+import re
+import threading
+import time
+from typing import Optional
+from logging_config import get_logger
+
+# Configure logging
+logger = get_logger(__name__)
+
+# Functions listed in the text summary
+SUMMARY_LINES = 40
+
+
+class ProfileSession:
+    """The profiles of one request: one for its own thread and one per other thread it ran code in
+
+    cProfile only sees the thread it was enabled in, and async views run in an event loop thread.
+    """
+
+    def __init__(self, reason: str):
+        self.reason = reason
+        self.profiles = []
+        self._threads = set()
+
+    def enable(self) -> Optional[cProfile.Profile]:
+        """Start profiling the calling thread, or return None if it is already being profiled"""
+        thread = threading.get_ident()
+        if thread in self._threads:
+            return None
+        self._threads.add(thread)
+        profile = cProfile.Profile()
+        self.profiles.append(profile)
+        profile.enable()
+        return profile
+
+
+class RequestProfiler:
+    """Decides which requests to profile and saves their profiles to output_dir"""
+
+    def __init__(self, output_dir: str, secret: str = '', profile_all: bool = False, sample_every: int = 0):
+        self.output_dir = output_dir
+        self.secret = secret
+        self.profile_all = profile_all
+        self.sample_every = sample_every
+        # next() on a count is atomic, so sampling needs no lock
+        self._requests = itertools.count(1)
+        self._profiles = itertools.count(1)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.secret or self.profile_all or self.sample_every > 0)
+
+    def select(self, token: Optional[str]) -> Optional[str]:
+        """Why a request should be profiled ('requested', 'all' or 'sampled'), or None
+
+        token is the secret sent with the request, if any; it only counts when a secret is configured.
+        """
+        if token and self.secret and hmac.compare_digest(token.encode(), self.secret.encode()):
+            return 'requested'
+        if self.profile_all:
+            return 'all'
+        if self.sample_every > 0 and next(self._requests) % self.sample_every == 0:
+            return 'sampled'
+        return None
+
+    def start(self, reason: str) -> ProfileSession:
+        """Start profiling a request in the calling thread"""
+        session = ProfileSession(reason)
+        session.enable()
+        return session
+
+    def finish(self, session: ProfileSession, method: str, route: str) -> str:
+        """Stop profiling a request and write out its profiles, returning the pstats file name
+
+        Call from the thread that started the session, once the request's other threads are done.
+        """
+        session.profiles[0].disable()
+        stats = pstats.Stats(*session.profiles)
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(self._profiles)}-{method}-{slug}"
+        path = os.path.join(self.output_dir, f'{name}.pstats')
+        stats.dump_stats(path)
+
+        # Readable without pstats tooling: the slowest functions by cumulative time
+        summary = io.StringIO()
+        summary.write(f'{method} {route} ({session.reason})\n')
+        stats.stream = summary
+        stats.sort_stats('cumulative').print_stats(SUMMARY_LINES)
+        with open(os.path.join(self.output_dir, f'{name}.txt'), 'w', encoding='utf-8') as file:
+            file.write(summary.getvalue())
+
+        logger.info(f"Profiled {method} {route} ({session.reason}) to {path}")
+        return f'{name}.pstats'
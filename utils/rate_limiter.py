@@ -0,0 +1,182 @@
+"""
+Rate limiting and admission control
+Token buckets per client and per character, plus in-flight caps that shed load before workers saturate
+"""
+
+import itertools
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Tuple
+from config import DATABASE_PATH
+from utils.database import connect
+from logging_config import get_logger
+
+# Configure logging
+logger = get_logger(__name__)
+
+
+class RateLimited(Exception):
+    """Raised when a request is over its rate limit or the endpoint is shedding load"""
+
+    def __init__(self, message: str, retry_after: float = 1):
+        super().__init__(message)
+        # Whole seconds, as sent in the Retry-After header
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+def take_token(tokens: float, updated_at: float, now: float, rate: float, burst: float,
+               cost: float = 1.0) -> Tuple[float, float]:
+    """Refill a bucket and try to take `cost` tokens, returning (tokens left, seconds to wait or 0)"""
+    tokens = min(burst, tokens + max(0.0, now - updated_at) * rate)
+    if tokens >= cost:
+        return tokens - cost, 0.0
+    return tokens, (cost - tokens) / rate
+
+
+class MemoryBucketStore:
+    """Buckets in this process; the least recently used keys are forgotten past max_keys"""
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (burst, now))
+            tokens, wait = take_token(tokens, updated_at, now, rate, burst, cost)
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            # A forgotten key starts again with a full bucket
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class SQLiteBucketStore:
+    """Buckets in a SQLite table, shared by every worker process using the same database
+
+    Every `prune_every` takes, buckets idle for `max_idle` seconds are deleted so the table
+    doesn't keep a row for every client ever seen.
+    """
+
+    def __init__(self, db_path: str = DATABASE_PATH, max_idle: float = 3600, prune_every: int = 1000):
+        self.db_path = db_path
+        self.max_idle = max_idle
+        self.prune_every = prune_every
+        # next() on a count is atomic, so counting takes needs no lock
+        self._takes = itertools.count(1)
+        conn = connect(db_path)
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS rate_buckets (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        # Wall-clock time, since the buckets are shared between processes
+        now = time.time()
+        conn = connect(self.db_path, isolation_level=None, timeout=5)
+        try:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('SELECT tokens, updated_at FROM rate_buckets WHERE key = ?', (key,))
+            row = cursor.fetchone()
+            tokens, wait = take_token(row[0], row[1], now, rate, burst, cost) if row else \
+                take_token(burst, now, now, rate, burst, cost)
+            cursor.execute('''
+                INSERT INTO rate_buckets (key, tokens, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at
+            ''', (key, tokens, now))
+            if self.prune_every > 0 and next(self._takes) % self.prune_every == 0:
+                self._prune(cursor, now)
+            cursor.execute('COMMIT')
+            return wait
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def _prune(self, cursor: sqlite3.Cursor, now: float):
+        cursor.execute('DELETE FROM rate_buckets WHERE updated_at < ?', (now - self.max_idle,))
+
+    def prune(self):
+        """Delete buckets idle long enough to have refilled completely"""
+        conn = connect(self.db_path)
+        try:
+            self._prune(conn.cursor(), time.time())
+            conn.commit()
+        finally:
+            conn.close()
+
+
+class TokenBucketLimiter:
+    """Allows `rate` requests per second per key with bursts of up to `burst`"""
+
+    def __init__(self, rate: float, burst: float, store=None):
+        self.rate = rate
+        self.burst = burst
+        self.store = store or MemoryBucketStore()
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.limited = 0
+
+    def check(self, key: str, cost: float = 1.0):
+        """Take a token for the key or raise RateLimited with the time until one is available"""
+        wait = self.store.take(key, self.rate, self.burst, cost)
+        with self._lock:
+            if wait:
+                self.limited += 1
+            else:
+                self.allowed += 1
+        if wait:
+            raise RateLimited('Too many requests, slow down', wait)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'rate': self.rate, 'burst': self.burst, 'allowed': self.allowed, 'limited': self.limited}
+
+
+class AdmissionGate:
+    """Caps the requests in flight for an endpoint group and rejects the rest at once
+
+    Rejecting early keeps queued requests from piling up behind busy workers and timing out.
+    """
+
+    def __init__(self, max_in_flight: int, retry_after: float = 2):
+        self.max_in_flight = max_in_flight
+        self.retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.shed = 0
+
+    def acquire(self):
+        """Take a slot or raise RateLimited when the group is at capacity"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.shed += 1
+            logger.warning(f"Shedding request with {self.max_in_flight} already in flight")
+            raise RateLimited('Server is busy, try again shortly', self.retry_after)
+        with self._lock:
+            self.in_flight += 1
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'max_in_flight': self.max_in_flight, 'in_flight': self.in_flight, 'shed': self.shed}
@@ -0,0 +1,179 @@
+"""
+Recommendation rule index
+Compiles the declarative rules in data/recommendation_rules.json into an index by class and level band
+"""
+
+import json
+import operator
+from typing import Callable, Dict, List, Optional, Tuple
+from config import MIN_LEVEL, MAX_LEVEL
+from logging_config import get_logger
+
+# Configure logging
+logger = get_logger(__name__)
+
+RULES_PATH = 'data/recommendation_rules.json'
+
+# Rule categories that pick a single recommended option
+CHOICE_CATEGORIES = ('subclass', 'feats')
+
+# Matches every class in a rule's "classes" list
+ANY_CLASS = '*'
+
+COMPARISONS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne
+}
+
+
+def compile_condition(condition: Dict) -> Callable[[Dict[str, int]], bool]:
+    """Compile an attribute condition into a predicate over an attributes dict
+
+    A condition compares an attribute with a fixed value ({"attribute": "INT", "op": ">=", "value": 16})
+    or with another attribute ({"attribute": "STR", "op": ">", "other": "DEX"}). Missing attributes count as 0.
+    """
+    compare = COMPARISONS.get(condition.get('op'))
+    if compare is None:
+        raise ValueError(f"Unknown comparison in rule condition: {condition}")
+
+    attribute = condition['attribute']
+    if 'other' in condition:
+        other = condition['other']
+        return lambda attributes: compare(attributes.get(attribute, 0), attributes.get(other, 0))
+
+    value = condition['value']
+    return lambda attributes: compare(attributes.get(attribute, 0), value)
+
+
+class ChoiceRule:
+    """A subclass or feat rule with its conditions compiled to predicates"""
+
+    __slots__ = ('recommended', 'reason', 'predicates', 'min_level', 'max_level')
+
+    def __init__(self, rule: Dict):
+        self.recommended = rule.get('recommended')
+        self.reason = rule.get('reason', '')
+        self.predicates = tuple(compile_condition(condition) for condition in rule.get('when', []))
+        self.min_level = rule.get('min_level', MIN_LEVEL)
+        self.max_level = rule.get('max_level', MAX_LEVEL)
+
+    def matches(self, level: int, attributes: Dict[str, int]) -> bool:
+        """Check whether the rule applies to a character level and attributes"""
+        if not self.min_level <= level <= self.max_level:
+            return False
+        for predicate in self.predicates:
+            if not predicate(attributes):
+                return False
+        return True
+
+
+class RuleIndex:
+    """Rules grouped by (class, level band) so a lookup only evaluates the ones that can apply"""
+
+    def __init__(self, data: Dict):
+        self.options = data.get('options', {})
+        self.next_level = {int(level): suggestion for level, suggestion in data.get('next_level', {}).items()}
+        self.bands = [tuple(band) for band in data.get('level_bands', [[MIN_LEVEL, MAX_LEVEL]])]
+        self._band_of_level = self._build_band_lookup()
+        self.spell_classes = set()
+        self._index = self._compile(data.get('rules', []))
+
+    @classmethod
+    def load(cls, path: str = RULES_PATH) -> 'RuleIndex':
+        """Load and compile the rules file"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            logger.warning(f"{path} not found. Using empty recommendation rules.")
+            data = {}
+        return cls(data)
+
+    def _build_band_lookup(self) -> List[int]:
+        """Map every level to the index of its band"""
+        lookup = [0] * (MAX_LEVEL + 1)
+        for band_index, (low, high) in enumerate(self.bands):
+            for level in range(max(low, 0), min(high, MAX_LEVEL) + 1):
+                lookup[level] = band_index
+        return lookup
+
+    def band_for_level(self, level: int) -> int:
+        """Get the band index of a level, clamping out of range levels"""
+        return self._band_of_level[max(MIN_LEVEL, min(MAX_LEVEL, level))]
+
+    def _classes_for_rule(self, rule: Dict) -> List[str]:
+        """Expand a rule's class list, with "*" covering every class that has options"""
+        classes = set()
+        for char_class in rule.get('classes', [ANY_CLASS]):
+            if char_class == ANY_CLASS:
+                for options in self.options.values():
+                    classes.update(options)
+            else:
+                classes.add(char_class)
+        return sorted(classes)
+
+    def _compile(self, rules: List[Dict]) -> Dict[Tuple[str, int], Dict]:
+        """Build the (class, band) index, keeping rule file order within each entry"""
+        index = {}
+        for rule in rules:
+            category = rule.get('category')
+            min_level = rule.get('min_level', MIN_LEVEL)
+            max_level = rule.get('max_level', MAX_LEVEL)
+            compiled = ChoiceRule(rule) if category in CHOICE_CATEGORIES else None
+
+            for char_class in self._classes_for_rule(rule):
+                for band_index, (low, high) in enumerate(self.bands):
+                    if min_level > high or max_level < low:
+                        continue
+                    entry = index.setdefault((char_class, band_index), {
+                        'subclass': [], 'feats': [], 'spells': [], 'spells_from_level': []
+                    })
+
+                    if category in CHOICE_CATEGORIES:
+                        entry[category].append(compiled)
+                    elif category == 'spells':
+                        self.spell_classes.add(char_class)
+                        # Spells unlocked before the band starts always apply within it
+                        if min_level <= low:
+                            entry['spells'].extend(rule.get('spells', []))
+                        else:
+                            entry['spells_from_level'].append((min_level, rule.get('spells', [])))
+                    else:
+                        logger.warning(f"Unknown recommendation rule category: {category}")
+
+        logger.info(f"Compiled {len(rules)} recommendation rules into {len(index)} index entries")
+        return index
+
+    def get_options(self, category: str, char_class: str) -> Optional[List[str]]:
+        """Get the option list of a category for a class, or None if the class isn't covered"""
+        return self.options.get(category, {}).get(char_class)
+
+    def choose(self, category: str, char_class: str, level: int,
+               attributes: Dict[str, int]) -> Optional[ChoiceRule]:
+        """Get the first matching rule of a choice category for a character"""
+        entry = self._index.get((char_class, self.band_for_level(level)))
+        if entry is None:
+            return None
+        for rule in entry[category]:
+            if rule.matches(level, attributes):
+                return rule
+        return None
+
+    def get_spells(self, char_class: str, level: int) -> Optional[List[str]]:
+        """Get every spell unlocked for a class at a level, or None if the class has no spell rules"""
+        if char_class not in self.spell_classes:
+            return None
+
+        entry = self._index.get((char_class, self.band_for_level(level)))
+        if entry is None:
+            return []
+
+        spells = list(entry['spells'])
+        for min_level, band_spells in entry['spells_from_level']:
+            if min_level <= level:
+                spells.extend(band_spells)
+        return spells
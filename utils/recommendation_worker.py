@@ -0,0 +1,82 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict
+from models import Character
+from utils.recommender import Recommender, recommendation_digest
+from logging_config import get_logger
+
+# Configure logging
+logger = get_logger(__name__)
+
+
+class RecommendationWorker:
+    """Precomputes recommendations in the background after a character changes
+
+    Results land in the recommender's cache, so the next page view is a cache hit.
+    The queue is bounded: when it is full the job is dropped and the view computes
+    synchronously instead.
+
+    The cache belongs to one process. With several gunicorn workers, the page view after a
+    creation or level-up usually reaches another worker, which computes synchronously; only
+    results precomputed in the master before the fork (server.warmup) are shared by all of them.
+    """
+
+    def __init__(self, recommender: Recommender, max_workers: int = 2, max_queue: int = 64,
+                 wait_timeout: float = 0.5):
+        self.recommender = recommender
+        self.wait_timeout = wait_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='recommendations')
+        self._slots = threading.BoundedSemaphore(max_queue)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.dropped = 0
+
+    def submit(self, character: Character) -> bool:
+        """Queue a recommendation precompute, returning False if it was dropped"""
+        digest = recommendation_digest(character)
+        with self._lock:
+            if digest in self._pending:
+                return True
+            if not self._slots.acquire(blocking=False):
+                self.dropped += 1
+                logger.warning(f"Recommendation queue full, skipping precompute for character {character.id}")
+                return False
+            future = self._executor.submit(self._compute, digest, character)
+            self._pending[digest] = future
+            self.submitted += 1
+        return True
+
+    def _compute(self, digest: str, character: Character) -> Dict:
+        try:
+            return self.recommender.get_recommendations(character)
+        except Exception as e:
+            logger.error(f"Error precomputing recommendations for character {character.id}: {e}")
+            raise
+        finally:
+            with self._lock:
+                self._pending.pop(digest, None)
+            self._slots.release()
+
+    def get_recommendations(self, character: Character) -> Dict:
+        """Get recommendations, waiting briefly for an in-flight precompute before computing inline"""
+        with self._lock:
+            future: Future = self._pending.get(recommendation_digest(character))
+
+        if future is not None:
+            try:
+                return future.result(timeout=self.wait_timeout)
+            except Exception:
+                pass
+
+        return self.recommender.get_recommendations(character)
+
+    def stats(self) -> Dict:
+        """Get queue counters"""
+        with self._lock:
+            pending = len(self._pending)
+        return {'pending': pending, 'submitted': self.submitted, 'dropped': self.dropped}
+
+    def shutdown(self, wait: bool = True):
+        """Stop the worker threads"""
+        self._executor.shutdown(wait=wait)
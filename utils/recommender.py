@@ -1,124 +1,50 @@
-from typing import Dict, List
+import hashlib
+import json
+from typing import Dict
+from config import RECOMMENDATION_CACHE_SIZE
 from models import Character
+from utils.lru_cache import LRUCache
+from utils.recommendation_rules import RuleIndex
+
+def recommendation_digest(character: Character) -> str:
+    """Digest of the character fields that recommendations depend on"""
+    payload = json.dumps([
+        character.char_class,
+        character.level,
+        character.attributes,
+        sorted(character.skills),
+        sorted(character.spells_known)
+    ], sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
 
 class Recommender:
     """Clase para generar recomendaciones de mejoras para el personaje"""
     
     def __init__(self):
         self.load_recommendations()
+        # Results keyed by recommendation_digest, so any relevant change is a new key
+        self.cache = LRUCache(RECOMMENDATION_CACHE_SIZE)
     
     def load_recommendations(self):
-        """Load recommendation data"""
-        # Subclases del SRD por clase
-        self.subclasses = {
-            'Fighter': ['Champion', 'Battle Master', 'Eldritch Knight'],
-            'Wizard': ['Evocation', 'Abjuration', 'Divination', 'Conjuration', 'Transmutation'],
-            'Cleric': ['Life', 'Light', 'Nature', 'Tempest', 'Trickery', 'War'],
-            'Rogue': ['Assassin', 'Thief', 'Arcane Trickster'],
-            'Ranger': ['Hunter', 'Beast Master'],
-            'Paladin': ['Devotion', 'Ancients', 'Vengeance'],
-            'Bard': ['Lore', 'Valor'],
-            'Sorcerer': ['Draconic', 'Wild Magic'],
-            'Warlock': ['Fiend', 'Great Old One', 'Archfey'],
-            'Monk': ['Open Hand', 'Shadow', 'Four Elements'],
-            'Druid': ['Land', 'Moon'],
-            'Barbarian': ['Berserker', 'Totem Warrior']
-        }
-        
-        # Hechizos del SRD recomendados por nivel
-        self.spell_recommendations = {
-            'Wizard': {
-                1: ['Magic Missile', 'Shield', 'Mage Armor'],
-                2: ['Mirror Image', 'Misty Step', 'Web'],
-                3: ['Fireball', 'Counterspell', 'Fly'],
-                4: ['Polymorph', 'Wall of Fire', 'Dimension Door'],
-                5: ['Cone of Cold', 'Teleportation Circle', 'Wall of Force']
-            },
-            'Cleric': {
-                1: ['Cure Wounds', 'Bless', 'Sacred Flame'],
-                2: ['Spiritual Weapon', 'Hold Person', 'Silence'],
-                3: ['Spirit Guardians', 'Revivify', 'Dispel Magic'],
-                4: ['Divination', 'Guardian of Faith', 'Death Ward'],
-                5: ['Mass Cure Wounds', 'Commune', 'Flame Strike']
-            },
-            'Bard': {
-                1: ['Vicious Mockery', 'Cure Wounds', 'Faerie Fire'],
-                2: ['Suggestion', 'Invisibility', 'Heat Metal'],
-                3: ['Hypnotic Pattern', 'Dispel Magic', 'Tiny Servant'],
-                4: ['Polymorph', 'Greater Invisibility', 'Dimension Door'],
-                5: ['Mass Suggestion', 'Otto\'s Irresistible Dance', 'Power Word Stun']
-            },
-            'Sorcerer': {
-                1: ['Fire Bolt', 'Shield', 'Burning Hands'],
-                2: ['Misty Step', 'Mirror Image', 'Scorching Ray'],
-                3: ['Fireball', 'Counterspell', 'Fly'],
-                4: ['Polymorph', 'Wall of Fire', 'Dimension Door'],
-                5: ['Cone of Cold', 'Teleportation Circle', 'Wall of Force']
-            },
-            'Warlock': {
-                1: ['Eldritch Blast', 'Hex', 'Armor of Agathys'],
-                2: ['Misty Step', 'Mirror Image', 'Suggestion'],
-                3: ['Counterspell', 'Dispel Magic', 'Fly'],
-                4: ['Dimension Door', 'Wall of Fire', 'Banishment'],
-                5: ['Teleportation Circle', 'Wall of Force', 'Mass Suggestion']
-            },
-            'Druid': {
-                1: ['Produce Flame', 'Cure Wounds', 'Entangle'],
-                2: ['Heat Metal', 'Spike Growth', 'Pass without Trace'],
-                3: ['Call Lightning', 'Conjure Animals', 'Dispel Magic'],
-                4: ['Polymorph', 'Wall of Fire', 'Conjure Minor Elementals'],
-                5: ['Mass Cure Wounds', 'Commune with Nature', 'Insect Plague']
-            },
-            'Paladin': {
-                1: ['Cure Wounds', 'Divine Favor', 'Bless'],
-                2: ['Spiritual Weapon', 'Hold Person', 'Zone of Truth'],
-                3: ['Crusader\'s Mantle', 'Revivify', 'Dispel Magic'],
-                4: ['Divination', 'Guardian of Faith', 'Death Ward'],
-                5: ['Mass Cure Wounds', 'Commune', 'Flame Strike']
-            },
-            'Ranger': {
-                1: ['Cure Wounds', 'Hunter\'s Mark', 'Goodberry'],
-                2: ['Spike Growth', 'Pass without Trace', 'Silence'],
-                3: ['Conjure Animals', 'Lightning Arrow', 'Dispel Magic'],
-                4: ['Guardian of Nature', 'Conjure Woodland Beings', 'Freedom of Movement'],
-                5: ['Swift Quiver', 'Commune with Nature', 'Tree Stride']
-            }
-        }
-        
-        # Recommended skills by class
-        self.skill_recommendations = {
-            'Fighter': ['Athletics', 'Intimidation', 'Perception', 'Survival'],
-            'Wizard': ['Arcana', 'History', 'Investigation', 'Religion'],
-            'Cleric': ['Insight', 'Medicine', 'Persuasion', 'Religion'],
-            'Rogue': ['Acrobatics', 'Deception', 'Stealth', 'Sleight of Hand'],
-            'Ranger': ['Animal Handling', 'Nature', 'Perception', 'Survival'],
-            'Paladin': ['Athletics', 'Insight', 'Intimidation', 'Persuasion'],
-            'Bard': ['Deception', 'Performance', 'Persuasion', 'Stealth'],
-            'Sorcerer': ['Arcana', 'Deception', 'Intimidation', 'Persuasion'],
-            'Warlock': ['Arcana', 'Deception', 'Intimidation', 'Investigation'],
-            'Monk': ['Acrobatics', 'Athletics', 'Insight', 'Stealth'],
-            'Druid': ['Animal Handling', 'Insight', 'Medicine', 'Nature'],
-            'Barbarian': ['Athletics', 'Intimidation', 'Nature', 'Perception']
-        }
-        
-        # Recommended feats
-        self.feat_recommendations = {
-            'Fighter': ['Great Weapon Master', 'Polearm Master', 'Sentinel', 'Alert'],
-            'Wizard': ['War Caster', 'Resilient (CON)', 'Alert', 'Lucky'],
-            'Cleric': ['War Caster', 'Resilient (CON)', 'Alert', 'Healer'],
-            'Rogue': ['Alert', 'Lucky', 'Mobile', 'Skulker'],
-            'Ranger': ['Sharpshooter', 'Alert', 'Mobile', 'Skulker'],
-            'Paladin': ['Great Weapon Master', 'Polearm Master', 'Sentinel', 'War Caster'],
-            'Bard': ['War Caster', 'Alert', 'Lucky', 'Inspiring Leader'],
-            'Sorcerer': ['War Caster', 'Resilient (CON)', 'Alert', 'Lucky'],
-            'Warlock': ['War Caster', 'Resilient (CON)', 'Alert', 'Lucky'],
-            'Monk': ['Mobile', 'Alert', 'Lucky', 'Sentinel'],
-            'Druid': ['War Caster', 'Resilient (CON)', 'Alert', 'Mobile'],
-            'Barbarian': ['Great Weapon Master', 'Polearm Master', 'Sentinel', 'Alert']
-        }
+        """Load and compile the recommendation rules"""
+        self.rules = RuleIndex.load()
     
     def get_recommendations(self, character: Character) -> Dict:
-        """Get all recommendations for the character"""
+        """Get all recommendations for the character (cached; treat the result as read-only)"""
+        digest = recommendation_digest(character)
+        recommendations = self.cache.get(digest)
+        if recommendations is None:
+            recommendations = self.compute_recommendations(character)
+            self.cache.put(digest, recommendations)
+        
+        return recommendations
+    
+    def get_cache_stats(self) -> Dict:
+        """Get hit-rate metrics of the recommendation cache"""
+        return self.cache.stats()
+    
+    def compute_recommendations(self, character: Character) -> Dict:
+        """Run every recommendation engine for the character, bypassing the cache"""
         recommendations = {
             'subclass': self.get_subclass_recommendation(character),
             'spells': self.get_spell_recommendations(character),
@@ -129,70 +55,45 @@ class Recommender:
         
         return recommendations
     
-    def get_subclass_recommendation(self, character: Character) -> Dict:
-        """Recommend subclass based on class"""
-        if character.char_class not in self.subclasses:
-            return {'recommendations': [], 'reason': 'Class not supported'}
-        
-        available_subclasses = self.subclasses[character.char_class]
-        
-        # Simple logic: recommend based on primary attributes
-        if character.char_class == 'Fighter':
-            if character.attributes.get('STR', 0) > character.attributes.get('DEX', 0):
-                recommended = 'Champion'
-                reason = 'Your high Strength makes you ideal for melee combat'
-            else:
-                recommended = 'Battle Master'
-                reason = 'Your dexterity allows for effective tactical maneuvers'
-        elif character.char_class == 'Wizard':
-            if character.attributes.get('INT', 0) >= 16:
-                recommended = 'Evocation'
-                reason = 'Your high Intelligence maximizes offensive spell damage'
-            else:
-                recommended = 'Abjuration'
-                reason = 'Protection and defense to complement your attributes'
-        else:
-            recommended = available_subclasses[0]
-            reason = f'Standard subclass for {character.char_class}'
+    def _get_choice_recommendation(self, category: str, character: Character, unsupported_reason: str) -> Dict:
+        """Pick the recommended option of a choice category from the first matching rule"""
+        available = self.rules.get_options(category, character.char_class)
+        if not available:
+            return {'recommendations': [], 'reason': unsupported_reason}
         
+        rule = self.rules.choose(category, character.char_class, character.level, character.attributes)
         return {
-            'recommendations': available_subclasses,
-            'recommended': recommended,
-            'reason': reason
+            'recommendations': available,
+            'recommended': rule.recommended if rule and rule.recommended else available[0],
+            'reason': rule.reason.format(char_class=character.char_class) if rule else ''
         }
     
+    def get_subclass_recommendation(self, character: Character) -> Dict:
+        """Recommend subclass based on class"""
+        return self._get_choice_recommendation('subclass', character, 'Class not supported')
+    
     def get_spell_recommendations(self, character: Character) -> Dict:
         """Recommend spells based on level and class"""
-        if character.char_class not in self.spell_recommendations:
+        available_spells = self.rules.get_spells(character.char_class, character.level)
+        if available_spells is None:
             return {'recommendations': [], 'reason': 'Class does not cast spells'}
         
-        spell_data = self.spell_recommendations[character.char_class]
-        current_level = character.level
-        
-        # Find spells for current level
-        available_spells = []
-        for level, spells in spell_data.items():
-            if level <= current_level:
-                available_spells.extend(spells)
-        
         # Filter spells already known
-        new_spells = [spell for spell in available_spells if spell not in character.spells_known]
-        
-        # Recommend 2-3 spells
-        recommended = new_spells[:3] if len(new_spells) >= 3 else new_spells
+        known_spells = set(character.spells_known)
+        new_spells = [spell for spell in available_spells if spell not in known_spells]
         
         return {
-            'recommendations': recommended,
-            'reason': f'Appropriate spells for level {current_level}',
+            'recommendations': new_spells[:3],  # Recommend up to 3 spells
+            'reason': f'Appropriate spells for level {character.level}',
             'all_available': available_spells
         }
     
     def get_skill_recommendations(self, character: Character) -> Dict:
         """Recommend additional skills"""
-        if character.char_class not in self.skill_recommendations:
+        available_skills = self.rules.get_options('skills', character.char_class)
+        if not available_skills:
             return {'recommendations': [], 'reason': 'No recommendations available'}
         
-        available_skills = self.skill_recommendations[character.char_class]
         current_skills = set(character.skills)
         
         # Find skills not already known
@@ -205,51 +106,16 @@ class Recommender:
         }
     
     def get_feat_recommendations(self, character: Character) -> Dict:
-        """Recommend feats based on class"""
-        if character.char_class not in self.feat_recommendations:
-            return {'recommendations': [], 'reason': 'No feats recommended'}
-        
-        available_feats = self.feat_recommendations[character.char_class]
-        
-        # Simple logic: recommend based on class
-        if character.char_class == 'Fighter':
-            if character.attributes.get('STR', 0) > 14:
-                recommended = 'Great Weapon Master'
-                reason = 'Your high Strength maximizes damage with heavy weapons'
-            else:
-                recommended = 'Alert'
-                reason = 'Improved initiative for tactical combat'
-        elif character.char_class in ['Wizard', 'Sorcerer', 'Warlock']:
-            recommended = 'War Caster'
-            reason = 'Advantages for casting spells in combat'
-        else:
-            recommended = available_feats[0]
-            reason = f'Standard feat for {character.char_class}'
-        
-        return {
-            'recommendations': available_feats,
-            'recommended': recommended,
-            'reason': reason
-        }
+        """Recommend feats based on class and attributes"""
+        return self._get_choice_recommendation('feats', character, 'No feats recommended')
     
     def get_next_level_recommendations(self, character: Character) -> Dict:
         """Recommendations for the next level"""
         next_level = character.level + 1
+        suggestion = self.rules.next_level.get(next_level)
         
-        recommendations = {
+        return {
             'level': next_level,
             'proficiency_bonus': (next_level - 1) // 4 + 2,
-            'suggestions': []
+            'suggestions': [suggestion] if suggestion else []
         }
-        
-        # Level-specific suggestions
-        if next_level == 4:
-            recommendations['suggestions'].append('Consider taking a feat or improving your primary attributes')
-        elif next_level == 5:
-            recommendations['suggestions'].append('You gain an extra attack (Extra Attack) if you are a fighter, paladin, or ranger')
-        elif next_level == 6:
-            recommendations['suggestions'].append('Many classes gain important features at this level')
-        elif next_level == 8:
-            recommendations['suggestions'].append('Ideal level for improving attributes or taking powerful feats')
-        
-        return recommendations 
\ No newline at end of file
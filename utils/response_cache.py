@@ -0,0 +1,89 @@
+import hashlib
+import json
+import random
+import re
+import threading
+from typing import Dict, Optional
+from models import Character
+from utils.lru_cache import LRUCache
+
+# Character fields the chat backends read when writing a reply
+PERSONA_FIELDS = (
+    'name', 'race', 'char_class', 'level', 'background', 'personality_tags', 'personality_traits',
+    'ideals', 'bonds', 'flaws', 'short_term_goals', 'long_term_goals', 'personal_goals',
+    'background_story'
+)
+
+_PUNCTUATION = re.compile(r'[^\w\s]')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_message(message: str) -> str:
+    """Lowercase a message and drop punctuation and repeated whitespace"""
+    return _WHITESPACE.sub(' ', _PUNCTUATION.sub('', message.lower())).strip()
+
+
+def persona_digest(character: Character) -> str:
+    """Digest of the persona fields, so any change to them starts a fresh set of cached replies"""
+    payload = json.dumps([getattr(character, field, None) for field in PERSONA_FIELDS], sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def context_digest(context: Optional[Dict]) -> Optional[str]:
+    """Digest of the rolling summary a reply was written with, or None without one
+
+    Only the summary counts: it changes once every few turns as messages are folded into it, so a
+    repeated message is still answered from the cache while the latest turns move on.
+    """
+    if not context or not context.get('summary'):
+        return None
+    return hashlib.sha1(context['summary'].encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """Bounded TTL cache of replies keyed on (normalized message, persona digest, context digest)
+
+    With variety > 1 up to that many different replies are collected per key before
+    answers start being served from the cache, picked at random.
+    """
+
+    def __init__(self, maxsize: int = 512, ttl: Optional[float] = 3600, variety: int = 1):
+        self.variety = max(1, variety)
+        self._cache = LRUCache(maxsize, ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(character: Character, message: str, context: Optional[Dict] = None) -> tuple:
+        """Key of a reply; replies written with a conversation summary are only reused under that summary"""
+        return normalize_message(message), persona_digest(character), context_digest(context)
+
+    def get(self, key: tuple) -> Optional[str]:
+        """Get a cached reply, or None while the key has fewer than `variety` replies"""
+        variants = self._cache.get(key)
+        with self._lock:
+            if variants and len(variants) >= self.variety:
+                self.hits += 1
+                return random.choice(variants)
+            self.misses += 1
+        return None
+
+    def add(self, key: tuple, reply: str):
+        """Store a freshly generated reply for a key"""
+        with self._lock:
+            variants = self._cache.get(key) or []
+            if len(variants) < self.variety:
+                variants = variants + [reply]
+            self._cache.put(key, variants)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._cache),
+                'variety': self.variety,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0
+            }